@@ -1,5 +1,5 @@
 from django.contrib import admin, messages
-from .models import Machine, MachineGroup, BlockedSite, Notification
+from .models import Machine, MachineGroup, BlockedSite, Notification, MachineMemoryModule, MachineNetworkAdapter, CommandJob, CommandBatch
 from import_export.admin import ImportExportMixin
 
 @admin.register(MachineGroup)
@@ -20,3 +20,25 @@ class BlockedSiteAdmin(ImportExportMixin, admin.ModelAdmin):
     list_filter   = ('group', 'machine')
     search_fields = ('url',)
 
+@admin.register(MachineMemoryModule)
+class MachineMemoryModuleAdmin(admin.ModelAdmin):
+    list_display  = ('machine', 'device_locator', 'capacity_gb', 'manufacturer', 'part_number', 'serial_number')
+    search_fields = ('part_number', 'serial_number', 'machine__hostname')
+
+@admin.register(MachineNetworkAdapter)
+class MachineNetworkAdapterAdmin(admin.ModelAdmin):
+    list_display  = ('machine', 'name', 'mac', 'ip', 'gateway')
+    search_fields = ('mac', 'gateway', 'machine__hostname')
+
+@admin.register(CommandJob)
+class CommandJobAdmin(admin.ModelAdmin):
+    list_display    = ('machine', 'command', 'status', 'status_code', 'created_by', 'created_at', 'finished_at')
+    list_filter     = ('status', 'kind')
+    search_fields   = ('machine__hostname', 'command')
+    raw_id_fields   = ('batch',)
+    readonly_fields = ('stdout', 'stderr', 'error', 'started_at', 'finished_at')
+
+@admin.register(CommandBatch)
+class CommandBatchAdmin(admin.ModelAdmin):
+    list_display  = ('group', 'command', 'total', 'created_by', 'created_at')
+    search_fields = ('command', 'group__name')
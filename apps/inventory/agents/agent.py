@@ -7,6 +7,16 @@ import platform
 import subprocess
 import threading
 import hashlib
+import gzip
+import struct
+import zlib
+import base64
+import queue
+import atexit
+import uuid
+import random
+import heapq
+import itertools
 import logging
 import tkinter as tk
 from datetime import datetime
@@ -24,6 +34,24 @@ VERSION = "2.2.1"  # Versão atualizada
 UPDATE_CHECK_INTERVAL = 3600
 HEARTBEAT_INTERVAL = 60
 OFFLINE_CHECK_INTERVAL = 60
+VOLATILE_INTERVAL = 60         # usuário, disco, uptime, antivírus
+NETWORK_INTERVAL = 15 * 60     # adaptadores, IP, MAC
+STATIC_INTERVAL = 24 * 3600    # BIOS, memória, TPM, GPU (e a cada boot)
+POLICY_CHECK_INTERVAL = 15 * 60  # sites bloqueados (GET condicional)
+COMPRESS_MIN_BYTES = 1024  # payloads menores não compensam compactar
+SPOOL_MAX_BYTES = 5 * 1024 * 1024      # limite total do spool em disco
+SPOOL_SEGMENT_BYTES = 256 * 1024       # tamanho de cada arquivo antes da rotação
+SPOOL_REPLAY_JITTER = 30               # espera aleatória máxima após reconectar
+SPOOL_BACKOFF_BASE = 5
+SPOOL_BACKOFF_MAX = 600
+ACK_BATCH_SIZE = 500                   # limite do endpoint /api/notifications/ack/
+INTERVAL_JITTER = 0.1                  # variação aleatória (±10%) de cada espera
+MIN_CHECKIN_INTERVAL = 30              # limites aceitos para a dica do servidor
+MAX_CHECKIN_INTERVAL = 3600
+OVERLOAD_BACKOFF_MAX = 240             # teto do backoff após HTTP 429/5xx; abaixo do
+                                       # CHECKIN_MAX_INTERVAL do servidor (300s), para a
+                                       # máquina não ficar offline durante o backoff
+COALESCE_WINDOW = 5                    # tarefas que vencem juntas rodam na mesma volta
 
 # Configurar logging
 LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
@@ -70,11 +98,20 @@ class AgentConfig:
             "auto_update": os.environ.get("AGENT_AUTO_UPDATE", "true").lower() == "true",
             "notifications": os.environ.get("AGENT_NOTIFICATIONS", "true").lower() == "true",
             "check_interval": int(os.environ.get("AGENT_CHECK_INTERVAL", HEARTBEAT_INTERVAL)),
+            "compress": os.environ.get("AGENT_COMPRESS", "true").lower() == "true",
+            "powershell_backend": os.environ.get("AGENT_POWERSHELL_BACKEND", "persistent"),
+            "volatile_interval": int(os.environ.get("AGENT_VOLATILE_INTERVAL", VOLATILE_INTERVAL)),
+            "network_interval": int(os.environ.get("AGENT_NETWORK_INTERVAL", NETWORK_INTERVAL)),
+            "static_interval": int(os.environ.get("AGENT_STATIC_INTERVAL", STATIC_INTERVAL)),
+            "spool_max_bytes": int(os.environ.get("AGENT_SPOOL_MAX_BYTES", SPOOL_MAX_BYTES)),
             "endpoint_validate": "/api/inventario/agent/validate/",
             "endpoint_checkin": "/api/inventario/checkin/",
+            "endpoint_checkin_batch": "/api/inventario/checkin/batch/",
             "endpoint_update": "/api/inventario/agent/update/",
             "endpoint_health": "/api/inventario/health/",
             "endpoint_notifications": "/api/notifications/",
+            "endpoint_notifications_wait": "/api/notifications/wait/",
+            "endpoint_notifications_ack": "/api/notifications/ack/",
         }
 
     def get(self, key, default=None):
@@ -94,10 +131,11 @@ class RequestsSession:
         if cls._session is None:
             cls._session = requests.Session()
 
+            # 429/503 não são repetidos aqui: quem trata é o CheckinSchedule
             retry_strategy = Retry(
                 total=3,
                 backoff_factor=1,
-                status_forcelist=[429, 500, 502, 503, 504],
+                status_forcelist=[500, 502, 504],
                 allowed_methods=["GET", "POST"]
             )
 
@@ -108,6 +146,23 @@ class RequestsSession:
         return cls._session
 
 
+def encode_json_body(config, payload):
+    """
+    Serializa o payload em JSON e compacta com gzip quando vale a pena
+
+    Returns:
+        tuple: (body_bytes, headers)
+    """
+    body = json.dumps(payload).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+
+    if config.get('compress') and len(body) >= COMPRESS_MIN_BYTES:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+
+    return body, headers
+
+
 class TokenValidator:
     """Validador de token de instalação"""
 
@@ -150,6 +205,71 @@ class TokenValidator:
             return False
 
 
+def jittered(interval, spread=INTERVAL_JITTER):
+    """Intervalo com variação aleatória para dessincronizar os agentes"""
+    return interval * random.uniform(1 - spread, 1 + spread)
+
+
+class CheckinSchedule:
+    """
+    Intervalo entre check-ins
+
+    Começa com uma fase aleatória (máquinas ligadas juntas não ficam
+    sincronizadas), segue o intervalo sugerido pelo servidor em next_checkin
+    e, após HTTP 429/5xx, recua exponencialmente (respeitando Retry-After).
+    """
+
+    def __init__(self, interval=HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self.failures = 0
+        self.backoff_until = 0.0
+
+    def initial_delay(self):
+        return random.uniform(0, self.interval)
+
+    def next_delay(self):
+        remaining = self.backoff_until - time.monotonic()
+        if remaining > 0:
+            return remaining
+        return jittered(self.interval)
+
+    def on_success(self, hint=None):
+        self.failures = 0
+        self.backoff_until = 0.0
+        if hint:
+            try:
+                self.interval = min(MAX_CHECKIN_INTERVAL, max(MIN_CHECKIN_INTERVAL, int(hint)))
+            except (TypeError, ValueError):
+                pass
+
+    def on_overload(self, retry_after=None):
+        self.failures += 1
+        delay = min(OVERLOAD_BACKOFF_MAX, self.interval * (2 ** self.failures))
+        delay = random.uniform(self.interval, delay)
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        delay = min(delay, OVERLOAD_BACKOFF_MAX)
+        self.backoff_until = time.monotonic() + delay
+        logger.warning(f"Servidor sobrecarregado, próximo check-in em {int(delay)}s")
+
+    @staticmethod
+    def is_overload(status_code):
+        return status_code == 429 or status_code >= 500
+
+    def observe(self, response):
+        """Atualiza o agendamento a partir de uma resposta de check-in"""
+        if self.is_overload(response.status_code):
+            self.on_overload(response.headers.get('Retry-After'))
+        elif response.status_code in (200, 201, 409):
+            try:
+                hint = response.json().get('next_checkin')
+            except ValueError:
+                hint = None
+            self.on_success(hint)
+
+
 class NetworkMonitor:
     """Monitor de conectividade de rede"""
 
@@ -157,6 +277,16 @@ class NetworkMonitor:
         self.config = config
         self.is_online = False
         self.last_check = None
+        self.last_contact = 0.0
+
+    def mark_reachable(self):
+        """Qualquer resposta do servidor dispensa o próximo health check"""
+        self.is_online = True
+        self.last_check = datetime.now()
+        self.last_contact = time.monotonic()
+
+    def recently_reachable(self, max_age):
+        return self.is_online and time.monotonic() - self.last_contact < max_age
 
     def check_connectivity(self):
         try:
@@ -167,6 +297,8 @@ class NetworkMonitor:
 
             self.is_online = response.status_code == 200
             self.last_check = datetime.now()
+            if self.is_online:
+                self.last_contact = time.monotonic()
 
             return self.is_online
 
@@ -181,8 +313,11 @@ class AutoUpdater:
 
     def __init__(self, config):
         self.config = config
+        # Segundos pedidos pelo servidor quando o limite de downloads da versão esgotou
+        self.retry_after = None
 
     def check_for_updates(self):
+        self.retry_after = None
         try:
             url = self.config.get('server_url') + self.config.get('endpoint_update')
 
@@ -199,6 +334,12 @@ class AutoUpdater:
                 if data.get('update_available'):
                     logger.info(f"Atualização disponível: {data.get('version')}")
                     return data
+                if data.get('retry_after'):
+                    self.retry_after = float(data['retry_after'])
+                    logger.info(
+                        f"Versão {data.get('latest_version')} sem vaga de download, "
+                        f"nova tentativa em {int(self.retry_after)}s"
+                    )
 
             return None
 
@@ -206,6 +347,93 @@ class AutoUpdater:
             logger.error(f"Erro ao verificar atualizações: {e}")
             return None
 
+    def next_check_delay(self):
+        """Espera até a próxima verificação: o retry_after do servidor ou o intervalo normal"""
+        retry_after, self.retry_after = self.retry_after, None
+        if retry_after:
+            # Espalha os agentes recusados pelas janelas seguintes
+            return retry_after + random.uniform(0, 60)
+        return jittered(UPDATE_CHECK_INTERVAL)
+
+    @staticmethod
+    def current_executable():
+        """Arquivo em execução: o executável empacotado (PyInstaller) ou este script"""
+        if getattr(sys, 'frozen', False):
+            return sys.executable
+        return os.path.abspath(__file__)
+
+    @staticmethod
+    def restart_command():
+        if getattr(sys, 'frozen', False):
+            return [sys.executable] + sys.argv[1:]
+        return [sys.executable] + sys.argv
+
+    @staticmethod
+    def apply_delta(old, delta):
+        """Mesmo formato de apps/inventory/delta.py (operações copia/insere + zlib)"""
+        data = zlib.decompress(delta)
+        if data[:4] != b'AGD1':
+            raise ValueError('Delta inválido')
+
+        out = []
+        pos = 4
+        while pos < len(data):
+            op = data[pos:pos + 1]
+            if op == b'C':
+                start, length = struct.unpack_from('>QI', data, pos + 1)
+                out.append(old[start:start + length])
+                pos += 13
+            elif op == b'I':
+                (length,) = struct.unpack_from('>I', data, pos + 1)
+                out.append(data[pos + 5:pos + 5 + length])
+                pos += 5 + length
+            else:
+                raise ValueError('Operação de delta inválida')
+        return b''.join(out)
+
+    def download_delta(self, update_info, current_content):
+        """
+        Reconstrói a nova versão a partir do arquivo atual
+
+        Returns:
+            bytes: Conteúdo novo verificado pelo SHA-256, ou None para baixar completo
+        """
+        delta_url = update_info.get('delta_url')
+        expected = update_info.get('sha256')
+        if not delta_url or not expected:
+            return None
+
+        # O delta só serve se o arquivo local for exatamente a versão base
+        current_hash = hashlib.sha256(current_content).hexdigest()
+        source_hash = update_info.get('delta_source_sha256')
+        if source_hash and source_hash != current_hash:
+            logger.info("Arquivo local difere da base do delta, baixando completo")
+            return None
+
+        try:
+            session = RequestsSession.get_session()
+            response = session.get(delta_url, verify=False, timeout=30)
+            if response.status_code != 200:
+                logger.info(f"Delta indisponível (HTTP {response.status_code}), baixando completo")
+                return None
+
+            source_hash = response.headers.get('X-Source-SHA256')
+            if source_hash and source_hash != current_hash:
+                logger.info("Arquivo local difere da base do delta, baixando completo")
+                return None
+
+            content = self.apply_delta(current_content, response.content)
+            if hashlib.sha256(content).hexdigest() != expected:
+                logger.warning("Hash do arquivo reconstruído não confere, baixando completo")
+                return None
+
+            logger.info(f"Atualização por delta: {len(response.content)} de {len(content)} bytes")
+            return content
+
+        except Exception as e:
+            logger.warning(f"Erro ao aplicar delta, baixando completo: {e}")
+            return None
+
     def download_update(self, update_info):
         if not self.config.get('auto_update'):
             logger.info("Auto-update desativado")
@@ -213,55 +441,394 @@ class AutoUpdater:
 
         try:
             download_url = update_info.get('download_url')
+            expected = update_info.get('sha256')
 
             logger.info(f"Baixando atualização {update_info.get('version')}")
 
-            session = RequestsSession.get_session()
-            response = session.get(download_url, verify=False, timeout=30)
+            current_file = self.current_executable()
+            with open(current_file, 'rb') as orig:
+                current_content = orig.read()
 
-            if response.status_code == 200:
-                current_file = os.path.abspath(__file__)
-                backup_file = current_file + '.bak'
+            content = self.download_delta(update_info, current_content)
 
-                with open(backup_file, 'wb') as f:
-                    with open(current_file, 'rb') as orig:
-                        f.write(orig.read())
+            if content is None:
+                session = RequestsSession.get_session()
+                response = session.get(download_url, verify=False, timeout=30)
+                if response.status_code != 200:
+                    logger.error(f"Erro ao baixar atualização: HTTP {response.status_code}")
+                    return
 
-                with open(current_file, 'wb') as f:
-                    f.write(response.content)
+                content = response.content
+                if expected and hashlib.sha256(content).hexdigest() != expected:
+                    logger.error("Hash da atualização não confere, descartando")
+                    return
 
-                logger.info("Atualização aplicada com sucesso")
+            backup_file = current_file + '.bak'
+            new_file = current_file + '.new'
 
-                time.sleep(2)
-                os.execv(sys.executable, [sys.executable] + sys.argv)
+            with open(new_file, 'wb') as f:
+                f.write(content)
+
+            # No Windows o executável em uso não pode ser sobrescrito, mas pode
+            # ser renomeado: o atual vira .bak e o novo assume o nome
+            os.replace(current_file, backup_file)
+            os.replace(new_file, current_file)
+
+            logger.info("Atualização aplicada com sucesso")
+
+            time.sleep(2)
+            command = self.restart_command()
+            os.execv(command[0], command)
 
         except Exception as e:
             logger.error(f"Erro ao aplicar atualização: {e}")
 
-            current_file = os.path.abspath(__file__)
+            current_file = self.current_executable()
             backup_file = current_file + '.bak'
 
-            if os.path.exists(backup_file):
-                with open(backup_file, 'rb') as b:
-                    with open(current_file, 'wb') as f:
-                        f.write(b.read())
+            if not os.path.exists(current_file) and os.path.exists(backup_file):
+                os.replace(backup_file, current_file)
+
+
+class InventoryDelta:
+    """
+    Estado do check-in incremental
+
+    Guarda o último inventário confirmado pelo servidor e o hash devolvido
+    por ele, decidindo a cada ciclo entre heartbeat, diff ou envio completo.
+    """
+
+    def __init__(self):
+        self.server_hash = None
+        self.last_snapshot = None
+
+    @staticmethod
+    def compute_hash(hardware):
+        """Mesmo hash de apps/inventory/checkin.py (JSON canônico + SHA-256)"""
+        canonical = json.dumps(hardware or {}, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def build_payload(self, config, data):
+        """Monta o payload do check-in conforme o estado conhecido do servidor"""
+        payload = {
+            "hostname": data["hostname"],
+            "ip": data.get("ip_address", ""),
+            "token": config.get("token_hash")
+        }
+
+        current_hash = self.compute_hash(data)
+
+        if self.server_hash is None or self.last_snapshot is None:
+            payload["mode"] = "full"
+            payload["hardware"] = data
+        elif current_hash == self.server_hash:
+            payload["mode"] = "heartbeat"
+            payload["inventory_hash"] = current_hash
+        else:
+            changed = {k: v for k, v in data.items() if self.last_snapshot.get(k) != v}
+            for removed in set(self.last_snapshot) - set(data):
+                changed[removed] = None
+
+            payload["mode"] = "diff"
+            payload["base_hash"] = self.server_hash
+            payload["inventory_hash"] = current_hash
+            payload["hardware"] = changed
+
+        return payload
+
+    def confirm(self, data, server_hash):
+        """Registra o inventário aceito pelo servidor"""
+        self.last_snapshot = dict(data)
+        self.server_hash = server_hash
+
+    def reset(self):
+        """Força envio completo no próximo check-in"""
+        self.server_hash = None
+        self.last_snapshot = None
+
+
+class PowerShellTimeout(Exception):
+    """A função PowerShell não respondeu dentro do timeout"""
+
+
+class SubprocessPowerShellBackend:
+    """Um processo powershell por coleta (comportamento original)"""
+
+    def __init__(self, script):
+        self.script = script
+
+    def invoke(self, function, timeout=30):
+        try:
+            result = subprocess.run(
+                ['powershell', '-NoProfile', '-ExecutionPolicy', 'Bypass', '-Command',
+                 self.script + '\n' + function],
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                creationflags=subprocess.CREATE_NO_WINDOW if platform.system() == "Windows" else 0
+            )
+        except subprocess.TimeoutExpired:
+            raise PowerShellTimeout(function)
+
+        if result.returncode != 0:
+            logger.error(f"PowerShell erro: {result.stderr}")
+            raise Exception(f"PowerShell retornou código {result.returncode}")
+
+        return result.stdout
+
+    def close(self):
+        pass
+
+
+class PersistentPowerShellBackend:
+    """
+    Processo powershell de longa duração controlado por stdin/stdout
+
+    O script é carregado uma única vez; cada coleta envia apenas a chamada da
+    função seguida de um marcador de fim, e a saída é lida até o marcador.
+    O processo é recriado se morrer, estourar o timeout ou atingir
+    max_invocations (evita acúmulo de memória no host).
+    """
+
+    def __init__(self, script, max_invocations=1000):
+        self.script = script
+        self.max_invocations = max_invocations
+        self._process = None
+        self._lines = None
+        self._invocations = 0
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        process = subprocess.Popen(
+            ['powershell', '-NoLogo', '-NoProfile', '-NonInteractive',
+             '-ExecutionPolicy', 'Bypass', '-Command', '-'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            creationflags=subprocess.CREATE_NO_WINDOW if platform.system() == "Windows" else 0
+        )
+
+        lines = queue.Queue()
+
+        def pump(stream, target):
+            for line in stream:
+                if target is not None:
+                    target.put(line)
+                else:
+                    logger.debug(f"PowerShell stderr: {line.rstrip()}")
+            if target is not None:
+                target.put(None)
+
+        Thread(target=pump, args=(process.stdout, lines), daemon=True).start()
+        Thread(target=pump, args=(process.stderr, None), daemon=True).start()
+
+        process.stdin.write(self.bootstrap_line(self.script))
+        process.stdin.flush()
+
+        self._process = process
+        self._lines = lines
+        self._invocations = 0
+        logger.info(f"Host PowerShell iniciado (pid {process.pid})")
+
+    @staticmethod
+    def bootstrap_line(script):
+        """
+        Carga do script em uma linha (base64), sem depender do parser
+        interativo de blocos multilinha do "-Command -"
+        """
+        encoded = base64.b64encode(script.encode('utf-8')).decode('ascii')
+        return (
+            "[Console]::OutputEncoding = [Text.Encoding]::UTF8; "
+            f"Invoke-Expression ([Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{encoded}')))\n"
+        )
+
+    @staticmethod
+    def call_line(function, marker):
+        return f"{function}; Write-Output '{marker}'\n"
+
+    @staticmethod
+    def read_until_marker(lines, marker, timeout):
+        """
+        Lê as linhas de `lines` (queue.Queue; None = fim do processo) até o marcador
+
+        Returns:
+            str: Saída da função, sem o marcador
+        Raises:
+            PowerShellTimeout, EOFError
+        """
+        deadline = time.monotonic() + timeout
+        output = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PowerShellTimeout()
+            try:
+                line = lines.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                raise EOFError()
+            if line.strip() == marker:
+                return ''.join(output)
+            output.append(line)
+
+    def _alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def invoke(self, function, timeout=30):
+        with self._lock:
+            if not self._alive() or self._invocations >= self.max_invocations:
+                self._stop()
+                self._start()
+
+            marker = f"__END_{uuid.uuid4().hex}__"
+            try:
+                self._process.stdin.write(self.call_line(function, marker))
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                self._stop()
+                raise Exception("Host PowerShell encerrado")
+
+            self._invocations += 1
+            try:
+                return self.read_until_marker(self._lines, marker, timeout)
+            except PowerShellTimeout:
+                self._stop()
+                raise PowerShellTimeout(function)
+            except EOFError:
+                self._stop()
+                raise Exception("Host PowerShell encerrado durante a coleta")
+
+    def _stop(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+
+class FakePowerShellBackend:
+    """
+    Backend sem PowerShell (testes e desenvolvimento em Linux)
+
+    Args:
+        responses (dict): função -> dict/str ou callable retornando dict/str
+    """
+
+    SYSTEM_INFO_FUNCTIONS = ('Get-SystemInfo', 'Get-VolatileInfo', 'Get-NetworkInfo', 'Get-StaticInfo')
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.calls = []
+
+    def _default_system_info(self):
+        disk = psutil.disk_usage(os.path.abspath(os.sep))
+        memory = psutil.virtual_memory()
+        return {
+            'hostname': socket.gethostname(),
+            'ip_address': socket.gethostbyname(socket.gethostname()),
+            'logged_user': os.environ.get('USER') or os.environ.get('USERNAME'),
+            'os_caption': platform.platform(),
+            'os_architecture': platform.machine(),
+            'cpu': platform.processor(),
+            'ram_gb': round(memory.total / 1024 ** 3, 2),
+            'disk_space_gb': round(disk.total / 1024 ** 3, 2),
+            'disk_free_gb': round(disk.free / 1024 ** 3, 2),
+            'disk_used_gb': round(disk.used / 1024 ** 3, 2),
+            'uptime_days': round((time.time() - psutil.boot_time()) / 86400, 2),
+        }
+
+    def invoke(self, function, timeout=30):
+        self.calls.append(function)
+        response = self.responses.get(function)
+        if callable(response):
+            response = response()
+        if response is None and function in self.SYSTEM_INFO_FUNCTIONS:
+            response = self._default_system_info()
+        if response is None:
+            raise Exception(f"Função sem resposta no backend fake: {function}")
+        return response if isinstance(response, str) else json.dumps(response)
+
+    def close(self):
+        pass
 
 
 class PowerShellCollector:
     """Coletor de informações via PowerShell - IGUAL AO AGENT.PS1"""
 
+    # Cada função corresponde a um nível de coleta (TieredCollector);
+    # Get-SystemInfo junta os três e mantém o formato do agent.ps1
     POWERSHELL_SCRIPT = r'''
     $ErrorActionPreference = "SilentlyContinue"
 
-    function Get-SystemInfo {
+    function Get-VolatileInfo {
         # Usuário logado
         $loggedUser = ((Get-CimInstance Win32_ComputerSystem).UserName -split '\\')[-1]
 
-        # MAC principal
-        $primaryNet = Get-CimInstance Win32_NetworkAdapterConfiguration |
-                      Where-Object { $_.IPEnabled } | Select-Object -First 1
-        $macAddress = $primaryNet.MACAddress
+        # Antivírus: escolhe primeiro não Defender, senão o primeiro da lista
+        $avList = Get-CimInstance -Namespace "root\SecurityCenter2" -ClassName AntiVirusProduct -ErrorAction SilentlyContinue
+        $av = $avList | Where-Object { $_.displayName -notmatch "Defender" } | Select-Object -First 1
+        if (-not $av) { $av = $avList | Select-Object -First 1 }
+
+        $os    = Get-CimInstance Win32_OperatingSystem
+        $upt   = (Get-Date) - $os.LastBootUpTime
+        $disk  = Get-CimInstance Win32_LogicalDisk -Filter "DeviceID='C:'"
+
+        # Espaço em disco usado
+        $diskUsedGb = [math]::Round(($disk.Size - $disk.FreeSpace)/1GB, 2)
+
+        [pscustomobject]@{
+            hostname               = $env:COMPUTERNAME
+            logged_user            = $loggedUser
+            last_boot              = $os.LastBootUpTime
+            uptime_days            = [math]::Round($upt.TotalDays,2)
+            disk_space_gb          = [math]::Round($disk.Size/1GB,2)
+            disk_free_gb           = [math]::Round($disk.FreeSpace/1GB,2)
+            disk_used_gb           = $diskUsedGb
+            antivirus_name         = $av.displayName
+            av_state               = if ($av.productState) { $av.productState.ToString() } else { $null }
+        } | ConvertTo-Json -Depth 10 -Compress
+    }
+
+    function Get-NetworkInfo {
+        $net = Get-CimInstance Win32_NetworkAdapterConfiguration | Where-Object IPEnabled
+
+        # MAC e IP principais
+        $primaryNet = $net | Select-Object -First 1
+        $ipAddress = if ($primaryNet.IPAddress) { $primaryNet.IPAddress[0] } else { "127.0.0.1" }
+
+        [pscustomobject]@{
+            ip_address             = $ipAddress
+            mac_address            = $primaryNet.MACAddress
+            network_adapters       = @($net | ForEach-Object {
+                [pscustomobject]@{
+                    name    = $_.Description
+                    mac     = $_.MACAddress
+                    ip      = ($_.IPAddress -join ",")
+                    gateway = ($_.DefaultIPGateway -join ",")
+                    dns     = ($_.DNSServerSearchOrder -join ",")
+                    dhcp    = $_.DHCPEnabled
+                }
+            })
+        } | ConvertTo-Json -Depth 10 -Compress
+    }
 
+    function Get-StaticInfo {
         # Slots e módulos de RAM
         $arrays         = Get-CimInstance Win32_PhysicalMemoryArray
         $totalSlots     = ($arrays | Measure-Object -Property MemoryDevices -Sum).Sum
@@ -278,19 +845,10 @@ class PowerShellCollector:
         }
         $populatedSlots = $modules.Count
 
-        # Antivírus: escolhe primeiro não Defender, senão o primeiro da lista
-        $avList = Get-CimInstance -Namespace "root\SecurityCenter2" -ClassName AntiVirusProduct -ErrorAction SilentlyContinue
-        $av = $avList | Where-Object { $_.displayName -notmatch "Defender" } | Select-Object -First 1
-        if (-not $av) { $av = $avList | Select-Object -First 1 }
-
-        # Outras infos
         $os    = Get-CimInstance Win32_OperatingSystem
         $cs    = Get-CimInstance Win32_ComputerSystem
         $bios  = Get-CimInstance Win32_BIOS
-        $upt   = (Get-Date) - $os.LastBootUpTime
         $proc  = Get-CimInstance Win32_Processor
-        $disk  = Get-CimInstance Win32_LogicalDisk -Filter "DeviceID='C:'"
-        $net   = Get-CimInstance Win32_NetworkAdapterConfiguration | Where-Object IPEnabled
         $gpu   = Get-CimInstance Win32_VideoController | Select-Object -First 1
 
         # TPM
@@ -317,33 +875,13 @@ class PowerShellCollector:
             }
         }
 
-        # Converter datas para timestamp JSON
-        $installDateJson = $null
-        if ($os.InstallDate) {
-            $installDateJson = "/Date($([Math]::Floor((Get-Date $os.InstallDate).ToUniversalTime().Subtract((Get-Date '1970-01-01')).TotalMilliseconds)))/"
-        }
-
-        $lastBootJson = $null
-        if ($os.LastBootUpTime) {
-            $lastBootJson = "/Date($([Math]::Floor((Get-Date $os.LastBootUpTime).ToUniversalTime().Subtract((Get-Date '1970-01-01')).TotalMilliseconds)))/"
-        }
-
+        # Converter data para timestamp JSON
         $biosReleaseJson = $null
         if ($bios.ReleaseDate) {
             $biosReleaseJson = "/Date($([Math]::Floor((Get-Date $bios.ReleaseDate).ToUniversalTime().Subtract((Get-Date '1970-01-01')).TotalMilliseconds)))/"
         }
 
-        # Espaço em disco usado
-        $diskUsedGb = [math]::Round(($disk.Size - $disk.FreeSpace)/1GB, 2)
-
-        # IP Address
-        $ipAddress = if ($primaryNet.IPAddress) { $primaryNet.IPAddress[0] } else { "127.0.0.1" }
-
-        $result = [pscustomobject]@{
-            hostname               = $env:COMPUTERNAME
-            ip_address             = $ipAddress
-            logged_user            = $loggedUser
-
+        [pscustomobject]@{
             manufacturer           = $cs.Manufacturer
             model                  = $cs.Model
             serial_number          = $bios.SerialNumber
@@ -354,69 +892,62 @@ class PowerShellCollector:
             os_architecture        = $os.OSArchitecture
             os_build               = $os.BuildNumber
             install_date           = $os.InstallDate
-            last_boot              = $os.LastBootUpTime
-            uptime_days            = [math]::Round($upt.TotalDays,2)
 
             cpu                    = $proc.Name
             ram_gb                 = [math]::Round(($cs.TotalPhysicalMemory/1GB),2)
-            disk_space_gb          = [math]::Round($disk.Size/1GB,2)
-            disk_free_gb           = [math]::Round($disk.FreeSpace/1GB,2)
-            disk_used_gb           = $diskUsedGb
 
-            mac_address            = $macAddress
             total_memory_slots     = $totalSlots
             populated_memory_slots = $populatedSlots
             memory_modules         = @($modules)
 
-            network_adapters       = @($net | ForEach-Object {
-                [pscustomobject]@{
-                    name    = $_.Description
-                    mac     = $_.MACAddress
-                    ip      = ($_.IPAddress -join ",")
-                    gateway = ($_.DefaultIPGateway -join ",")
-                    dns     = ($_.DNSServerSearchOrder -join ",")
-                    dhcp    = $_.DHCPEnabled
-                }
-            })
-
             gpu_name               = $gpu.Name
             gpu_driver             = $gpu.DriverVersion
 
-            antivirus_name         = $av.displayName
-            av_state               = if ($av.productState) { $av.productState.ToString() } else { $null }
-
             tpm                    = $tpmInfo
-        }
-
-        return $result | ConvertTo-Json -Depth 10 -Compress
+        } | ConvertTo-Json -Depth 10 -Compress
     }
 
-    # Executar e retornar JSON
-    Get-SystemInfo
+    function Get-SystemInfo {
+        $result = @{}
+        foreach ($part in @((Get-StaticInfo), (Get-NetworkInfo), (Get-VolatileInfo))) {
+            ($part | ConvertFrom-Json).PSObject.Properties | ForEach-Object { $result[$_.Name] = $_.Value }
+        }
+        return [pscustomobject]$result | ConvertTo-Json -Depth 10 -Compress
+    }
     '''
 
+    _backend = None
+    _backend_lock = threading.Lock()
+
+    @classmethod
+    def get_backend(cls, config=None):
+        """Backend criado na primeira coleta (AGENT_POWERSHELL_BACKEND)"""
+        with cls._backend_lock:
+            if cls._backend is None:
+                name = (config.get('powershell_backend') if config else None) or 'persistent'
+                if name == 'fake':
+                    cls._backend = FakePowerShellBackend()
+                elif name == 'subprocess':
+                    cls._backend = SubprocessPowerShellBackend(cls.POWERSHELL_SCRIPT)
+                else:
+                    cls._backend = PersistentPowerShellBackend(cls.POWERSHELL_SCRIPT)
+            return cls._backend
+
+    @classmethod
+    def set_backend(cls, backend):
+        with cls._backend_lock:
+            if cls._backend is not None and cls._backend is not backend:
+                cls._backend.close()
+            cls._backend = backend
+
     @staticmethod
-    def get_system_info():
-        """Executa PowerShell e retorna informações coletadas"""
+    def get_system_info(config=None):
+        """Executa Get-SystemInfo no backend e retorna informações coletadas"""
         try:
             logger.info("Coletando informações via PowerShell...")
 
-            # Executar PowerShell
-            result = subprocess.run(
-                ['powershell', '-NoProfile', '-ExecutionPolicy', 'Bypass', '-Command',
-                 PowerShellCollector.POWERSHELL_SCRIPT],
-                capture_output=True,
-                text=True,
-                timeout=30,
-                creationflags=subprocess.CREATE_NO_WINDOW if platform.system() == "Windows" else 0
-            )
-
-            if result.returncode != 0:
-                logger.error(f"PowerShell erro: {result.stderr}")
-                raise Exception(f"PowerShell retornou código {result.returncode}")
-
-            # Parse do JSON retornado
-            output = result.stdout.strip()
+            backend = PowerShellCollector.get_backend(config)
+            output = backend.invoke('Get-SystemInfo', timeout=30).strip()
 
             if not output:
                 raise Exception("PowerShell não retornou dados")
@@ -427,13 +958,13 @@ class PowerShellCollector:
 
             return data
 
-        except subprocess.TimeoutExpired:
+        except PowerShellTimeout:
             logger.error("Timeout ao executar PowerShell")
             raise Exception("Timeout na coleta de dados")
 
         except json.JSONDecodeError as e:
             logger.error(f"Erro ao parsear JSON do PowerShell: {e}")
-            logger.error(f"Output recebido: {result.stdout}")
+            logger.error(f"Output recebido: {output}")
             raise Exception("Dados inválidos retornados pelo PowerShell")
 
         except Exception as e:
@@ -441,33 +972,54 @@ class PowerShellCollector:
             raise
 
     @staticmethod
-    def send_data(config, data):
-        """Envia dados para o servidor - FORMATO IGUAL AO POWERSHELL"""
+    def send_data(config, data, delta=None, schedule=None):
+        """
+        Envia dados para o servidor - FORMATO IGUAL AO POWERSHELL
+
+        Com um InventoryDelta o envio é incremental (heartbeat/diff) e o
+        servidor pode pedir ressincronização respondendo HTTP 409. Com um
+        CheckinSchedule a resposta ajusta o intervalo do próximo check-in.
+        """
         try:
             url = config.get('server_url') + config.get("endpoint_checkin")
 
-            # FORMATO IDÊNTICO AO POWERSHELL
-            payload = {
-                "hostname": data["hostname"],
-                "ip": data.get("ip_address", ""),
-                "hardware": data,
-                "token": config.get("token_hash")
-            }
+            if delta is not None:
+                payload = delta.build_payload(config, data)
+            else:
+                # FORMATO IDÊNTICO AO POWERSHELL
+                payload = {
+                    "hostname": data["hostname"],
+                    "ip": data.get("ip_address", ""),
+                    "hardware": data,
+                    "token": config.get("token_hash")
+                }
 
-            logger.info(f"Enviando dados para {url}")
+            logger.info(f"Enviando dados para {url} (modo: {payload.get('mode', 'full')})")
             logger.debug(f"Payload: {json.dumps(payload, indent=2)}")
 
+            body, headers = encode_json_body(config, payload)
+
             session = RequestsSession.get_session()
             response = session.post(
                 url,
-                json=payload,
+                data=body,
+                headers=headers,
                 verify=False,
                 timeout=10
             )
 
+            if schedule is not None:
+                schedule.observe(response)
+
             if response.status_code in [200, 201]:
                 logger.info("Dados enviados com sucesso")
+                if delta is not None:
+                    delta.confirm(data, response.json().get('inventory_hash'))
                 return True
+            elif response.status_code == 409 and delta is not None and payload.get('mode') != 'full':
+                logger.info("Servidor solicitou ressincronização do inventário")
+                delta.reset()
+                return PowerShellCollector.send_data(config, data, delta, schedule)
             else:
                 logger.error(f"Erro HTTP {response.status_code}: {response.text}")
                 return False
@@ -483,13 +1035,56 @@ class PowerShellCollector:
             return False
 
 
+class BlockedSitesPolicy:
+    """
+    Sites bloqueados da máquina (GET endpoint_checkin?host=...)
+
+    Guarda o ETag da última resposta e o reenvia em If-None-Match; com a
+    política inalterada o servidor responde 304 sem corpo.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.etag = None
+        self.urls = []
+
+    def refresh(self):
+        """
+        Returns:
+            bool: True se a lista mudou
+        """
+        session = RequestsSession.get_session()
+        url = f"{self.config.get('server_url')}{self.config.get('endpoint_checkin')}"
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+
+        response = session.get(
+            url,
+            params={'host': self.config.get('machine_name')},
+            headers=headers,
+            verify=False,
+            timeout=10
+        )
+
+        if response.status_code == 304:
+            return False
+        if response.status_code != 200:
+            logger.warning(f"Erro HTTP {response.status_code} ao buscar sites bloqueados")
+            return False
+
+        self.urls = response.json()
+        self.etag = response.headers.get('ETag')
+        logger.info(f"Sites bloqueados atualizados: {len(self.urls)}")
+        return True
+
+
 class NotificationManager:
     """
     Gerenciador de notificações com popup customizado (tkinter).
     Não usa APIs nativas do sistema operacional.
     """
 
-    NOTIFICATION_CHECK_INTERVAL = 120  # segundos (2 minutos)
+    NOTIFICATION_CHECK_INTERVAL = 120  # segundos (2 minutos) - usado sem long-poll
+    NOTIFICATION_LONG_POLL_TIMEOUT = 55  # segundos que o servidor segura a requisição
     NOTIFICATION_DISPLAY_DELAY = 2  # segundos entre notificações
 
     def __init__(self, config):
@@ -502,6 +1097,17 @@ class NotificationManager:
         self.config = config
         self.server_url = config.get('server_url', 'http://192.168.1.54:5001')
         self.endpoint = config.get('endpoint_notifications', '/api/notifications/')
+        self.endpoint_wait = config.get('endpoint_notifications_wait', '/api/notifications/wait/')
+        self.endpoint_ack = config.get('endpoint_notifications_ack', '/api/notifications/ack/')
+        self.long_poll_available = True
+        self.last_notification_id = 0
+
+        # Confirmações de leitura aguardando envio em lote
+        self.pending_acks = []
+
+        # OfflineSpool para confirmações que não puderam ser entregues
+        self.spool = None
+        self.batch_ack_available = True
         self.machine_name = config.get('machine_name', '')
         self.notifications_enabled = config.get('notifications', True)
 
@@ -784,6 +1390,56 @@ class NotificationManager:
             logger.error(f"Erro ao buscar notificações: {e}")
             return []
 
+    def wait_for_notifications(self):
+        """
+        Long-poll: aguarda no servidor por notificações com id > last_notification_id
+
+        Returns:
+            list: Notificações recebidas, ou None se o long-poll falhou
+                  (servidor antigo sem o endpoint, erro de rede, etc.)
+        """
+        try:
+            session = RequestsSession.get_session()
+
+            url = f"{self.server_url}{self.endpoint_wait}"
+            params = {
+                'machine_name': self.machine_name,
+                'after_id': self.last_notification_id,
+                'timeout': self.NOTIFICATION_LONG_POLL_TIMEOUT,
+                'limit': 20
+            }
+
+            response = session.get(
+                url,
+                params=params,
+                verify=False,
+                timeout=self.NOTIFICATION_LONG_POLL_TIMEOUT + 15
+            )
+
+            if response.status_code == 404:
+                logger.info("Servidor sem long-poll de notificações, usando polling")
+                self.long_poll_available = False
+                return None
+
+            if response.status_code == 429:
+                # Servidor no limite de long-polls: consulta simples neste ciclo
+                logger.info("Long-poll recusado pelo servidor (429), usando polling neste ciclo")
+                return None
+
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('success'):
+                    return data.get('notifications', [])
+                logger.warning(f"API retornou erro: {data.get('error')}")
+                return None
+
+            logger.warning(f"Erro HTTP {response.status_code} no long-poll")
+            return None
+
+        except Exception as e:
+            logger.error(f"Erro no long-poll de notificações: {e}")
+            return None
+
     def mark_as_read(self, notification_id):
         """
         Marca notificação como lida no servidor
@@ -829,24 +1485,131 @@ class NotificationManager:
             logger.error(f"Erro ao marcar como lida: {e}")
             return False
 
-    def process_pending_notifications(self):
+    def queue_acknowledgement(self, notification_id):
+        """Enfileira a confirmação de leitura para envio em lote"""
+        if notification_id not in self.pending_acks:
+            self.pending_acks.append(notification_id)
+
+    def flush_acknowledgements(self):
+        """
+        Envia as confirmações pendentes em uma única requisição
+
+        Se o servidor não tiver o endpoint em lote, usa mark_as_read por ID.
+        Confirmações que falharem vão para o spool em disco (se houver) ou
+        continuam na fila para o próximo ciclo.
+
+        Returns:
+            bool: True se a fila foi esvaziada
+        """
+        if not self.pending_acks:
+            return True
+
+        ids = list(self.pending_acks)
+
+        if not self.batch_ack_available:
+            failed = [notif_id for notif_id in ids if not self.mark_as_read(notif_id)]
+            self.pending_acks = [i for i in self.pending_acks if i not in ids]
+            if failed:
+                self.spool_acknowledgements(failed)
+            return not self.pending_acks
+
+        try:
+            session = RequestsSession.get_session()
+            url = f"{self.server_url}{self.endpoint_ack}"
+
+            response = session.post(
+                url,
+                json={'machine_name': self.machine_name, 'notification_ids': ids},
+                verify=False,
+                timeout=10
+            )
+
+            if response.status_code == 404 and not response.text.lstrip().startswith('{'):
+                logger.info("Servidor sem confirmação em lote, usando confirmação individual")
+                self.batch_ack_available = False
+                return self.flush_acknowledgements()
+
+            if response.status_code == 200 and response.json().get('success'):
+                logger.info(f"{len(ids)} notificações confirmadas como lidas")
+                self.pending_acks = [i for i in self.pending_acks if i not in ids]
+                return True
+
+            logger.warning(f"Falha ao confirmar notificações: HTTP {response.status_code}")
+
+        except Exception as e:
+            logger.error(f"Erro ao confirmar notificações: {e}")
+
+        self.spool_acknowledgements(ids)
+        return not self.pending_acks
+
+    def spool_acknowledgements(self, ids):
+        """Move confirmações não entregues para o spool em disco"""
+        if self.spool is None:
+            # Sem spool, falhas voltam para o início da fila em memória
+            self.pending_acks = ids + [i for i in self.pending_acks if i not in ids]
+            return
+
+        self.spool.append('ack', ids=ids)
+        self.pending_acks = [i for i in self.pending_acks if i not in ids]
+        logger.info(f"{len(ids)} confirmações guardadas no spool")
+
+    def process_pending_notifications(self, wait=False):
         """
         Processa todas as notificações pendentes
 
         Busca notificações do servidor, exibe as não vistas e marca como lidas
         APENAS APÓS o usuário fechar o popup.
+
+        Args:
+            wait (bool): Usa o long-poll do servidor quando disponível
+
+        Returns:
+            bool: True se a busca foi feita via long-poll com sucesso
+        """
+        notifications, long_polled = self.fetch_notifications(wait)
+        return self.display_notifications(notifications) and long_polled
+
+    def fetch_notifications(self, wait=False):
+        """
+        Busca as notificações pendentes, sem exibir
+
+        Returns:
+            tuple: (notificações, True se veio do long-poll)
         """
         if not self.notifications_enabled:
-            return
+            return [], False
 
         logger.info("Verificando notificações do servidor...")
 
+        # Reenvia confirmações que falharam no ciclo anterior
+        self.flush_acknowledgements()
+
         # Buscar notificações
-        notifications = self.fetch_pending_notifications()
+        long_polled = False
+        notifications = None
+
+        if wait and self.long_poll_available:
+            notifications = self.wait_for_notifications()
+            long_polled = notifications is not None
+
+        if notifications is None:
+            notifications = self.fetch_pending_notifications()
+
+        return notifications or [], long_polled
 
+    def display_notifications(self, notifications):
+        """
+        Exibe as notificações e aguarda cada popup ser fechado (até ~17s cada)
+
+        Returns:
+            bool: True se todas foram exibidas ou já tinham sido
+        """
         if not notifications:
             logger.debug("Nenhuma notificação pendente")
-            return
+            return True
+
+        # Exibidas ou confirmadas; o cursor do long-poll só passa por elas
+        handled = set()
 
         # Processar cada notificação
         for notif in notifications:
@@ -855,6 +1618,7 @@ class NotificationManager:
             # Verificar se já foi exibida
             if notif_id in self.shown_notifications:
                 logger.debug(f"Notificação {notif_id} já foi exibida")
+                handled.add(notif_id)
                 continue
 
             # Exibir notificação
@@ -888,11 +1652,354 @@ class NotificationManager:
                 self.shown_notifications.add(notif_id)
                 self._save_history()
 
-                # Marcar como lida no servidor
-                self.mark_as_read(notif_id)
+                # Marcar como lida no servidor (enviado em lote ao final)
+                self.queue_acknowledgement(notif_id)
+                handled.add(notif_id)
 
                 # Aguardar entre notificações
                 time.sleep(self.NOTIFICATION_DISPLAY_DELAY)
+            else:
+                logger.warning(f"Notificação {notif_id} não exibida, será tentada de novo")
+
+        self.flush_acknowledgements()
+
+        self.advance_cursor(notifications, handled)
+
+        # Com falhas o long-poll responderia de imediato com as mesmas
+        # notificações; o loop espera o intervalo de polling antes de tentar
+        return len(handled) == len(notifications)
+
+    def advance_cursor(self, notifications, handled):
+        """
+        Avança last_notification_id até a primeira notificação não tratada
+
+        O servidor só devolve id > after_id, então o cursor não pode passar
+        de uma notificação cujo popup falhou.
+        """
+        for notif_id in sorted(n.get('id') or 0 for n in notifications):
+            if notif_id not in handled:
+                break
+            self.last_notification_id = max(self.last_notification_id, notif_id)
+
+
+class OfflineSpool:
+    """
+    Spool em disco para check-ins e confirmações não entregues
+
+    Registros JSON, um por linha, anexados ao segmento atual; ao passar de
+    segment_bytes o segmento é fechado e os fechados são compactados (só o
+    check-in mais recente importa, confirmações sem repetição). Se o total
+    passar de max_bytes os segmentos mais antigos são descartados.
+
+    O reenvio usa backoff exponencial com jitter e, após uma reconexão, uma
+    espera aleatória inicial, para que os agentes não reenviem todos juntos.
+
+    take() sela os segmentos que devolve: append() passa a escrever em um
+    segmento novo e a compactação não os toca, então commit() só remove o
+    que foi de fato reenviado.
+    """
+
+    def __init__(self, directory=None, max_bytes=SPOOL_MAX_BYTES, segment_bytes=SPOOL_SEGMENT_BYTES):
+        self.directory = directory or os.path.join(os.path.dirname(__file__), 'spool')
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.failures = 0
+        self.next_attempt = 0.0
+        self._lock = threading.Lock()
+        self._sealed = set()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _segments(self):
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith('spool-') and name.endswith('.jsonl')
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _new_segment_path(self, segments):
+        stamp = time.time_ns()
+        if segments:
+            # O relógio do Windows tem resolução de ~15 ms: nunca repete o último nome
+            last = os.path.basename(segments[-1])[len('spool-'):-len('.jsonl')]
+            stamp = max(stamp, int(last) + 1)
+        return os.path.join(self.directory, f"spool-{stamp:020d}.jsonl")
+
+    def _current(self):
+        segments = self._segments()
+        if (segments and segments[-1] not in self._sealed
+                and os.path.getsize(segments[-1]) < self.segment_bytes):
+            return segments[-1]
+        return self._new_segment_path(segments)
+
+    @staticmethod
+    def _read(path):
+        records = []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # linha truncada por desligamento
+        except OSError:
+            pass
+        return records
+
+    @staticmethod
+    def compact_records(records):
+        """Último check-in e confirmações sem repetição"""
+        checkin = None
+        ack_ids = {}
+        for record in records:
+            if record.get('kind') == 'checkin':
+                checkin = record
+            elif record.get('kind') == 'ack':
+                ack_ids.update(dict.fromkeys(record.get('ids', [])))
+
+        compacted = [checkin] if checkin else []
+        if ack_ids:
+            compacted.append({'kind': 'ack', 'ids': list(ack_ids)})
+        return compacted
+
+    def _compact_closed(self):
+        closed = [path for path in self._segments() if path not in self._sealed]
+        if len(closed) < 2:
+            return
+
+        records = []
+        for path in closed:
+            records.extend(self._read(path))
+
+        target = closed[0] + '.tmp'
+        with open(target, 'w', encoding='utf-8') as f:
+            for record in self.compact_records(records):
+                f.write(json.dumps(record) + '\n')
+        os.replace(target, closed[0])
+        for path in closed[1:]:
+            os.remove(path)
+
+    def _enforce_limit(self):
+        segments = self._segments()
+        total = sum(os.path.getsize(path) for path in segments)
+        while segments and total > self.max_bytes:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            logger.warning(f"Spool cheio, descartado: {os.path.basename(oldest)}")
+
+    def append(self, kind, **fields):
+        record = dict(fields, kind=kind, spooled_at=time.time())
+        with self._lock:
+            path = self._current()
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+
+            if os.path.getsize(path) >= self.segment_bytes:
+                self._compact_closed()
+                self._enforce_limit()
+
+    def has_pending(self):
+        with self._lock:
+            return bool(self._segments())
+
+    def take(self):
+        """
+        Registros compactados de todos os segmentos atuais
+
+        Returns:
+            tuple: (registros, segmentos) — passe os segmentos para commit()
+        """
+        with self._lock:
+            segments = self._segments()
+            self._sealed = set(segments)
+            records = []
+            for path in segments:
+                records.extend(self._read(path))
+            return self.compact_records(records), segments
+
+    def commit(self, segments):
+        """Remove os segmentos reenviados com sucesso"""
+        with self._lock:
+            for path in segments:
+                self._sealed.discard(path)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def ready(self):
+        return time.monotonic() >= self.next_attempt
+
+    def on_reconnect(self):
+        self.next_attempt = time.monotonic() + random.uniform(0, SPOOL_REPLAY_JITTER)
+
+    def record_failure(self):
+        self.failures += 1
+        delay = min(SPOOL_BACKOFF_MAX, SPOOL_BACKOFF_BASE * (2 ** self.failures))
+        self.next_attempt = time.monotonic() + random.uniform(delay / 2, delay)
+
+    def record_success(self):
+        self.failures = 0
+        self.next_attempt = 0.0
+
+
+class TieredCollector:
+    """
+    Coleta em níveis com intervalos independentes
+
+        volatile  Get-VolatileInfo  a cada volatile_interval
+        network   Get-NetworkInfo   a cada network_interval
+        static    Get-StaticInfo    a cada static_interval ou após um boot
+
+    O retorno é sempre o inventário completo (os níveis não coletados no
+    ciclo vêm do último snapshot), então o hash do InventoryDelta continua
+    o mesmo e só as chaves que mudaram vão no diff. O snapshot estático é
+    gravado em disco para sobreviver a reinícios do agente.
+    """
+
+    TIERS = (
+        ('static', 'Get-StaticInfo', 'static_interval'),
+        ('network', 'Get-NetworkInfo', 'network_interval'),
+        ('volatile', 'Get-VolatileInfo', 'volatile_interval'),
+    )
+
+    def __init__(self, config, cache_path=None):
+        self.config = config
+        self.cache_path = cache_path or os.path.join(os.path.dirname(__file__), 'static_inventory.json')
+        self.snapshots = {}
+        self.collected_at = {}
+        self._load_static()
+
+    def _load_static(self):
+        """Reaproveita o snapshot estático do mesmo boot, se ainda no prazo"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        age = time.time() - cached.get('collected_at', 0)
+        same_boot = abs(cached.get('boot_time', 0) - psutil.boot_time()) < 5
+        if same_boot and 0 <= age < self.config.get('static_interval'):
+            self.snapshots['static'] = cached.get('data') or {}
+            # Converte a idade para o relógio monotônico usado nos demais níveis
+            self.collected_at['static'] = time.monotonic() - age
+            logger.info("Inventário estático carregado do cache")
+
+    def _save_static(self):
+        try:
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'collected_at': time.time(),
+                    'boot_time': psutil.boot_time(),
+                    'data': self.snapshots.get('static', {}),
+                }, f)
+        except OSError as e:
+            logger.warning(f"Erro ao gravar cache do inventário estático: {e}")
+
+    def due_tiers(self, now=None):
+        now = now if now is not None else time.monotonic()
+        return [
+            tier for tier, _, interval_key in self.TIERS
+            if tier not in self.collected_at
+            or now - self.collected_at[tier] >= self.config.get(interval_key)
+        ]
+
+    def invalidate(self, tier=None):
+        """Força a coleta do nível (ou de todos) no próximo ciclo"""
+        if tier is None:
+            self.collected_at.clear()
+        else:
+            self.collected_at.pop(tier, None)
+
+    def collect(self):
+        """
+        Returns:
+            dict: Inventário completo, mesmo formato de Get-SystemInfo
+        """
+        backend = PowerShellCollector.get_backend(self.config)
+        due = self.due_tiers()
+
+        for tier, function, _ in self.TIERS:
+            if tier not in due:
+                continue
+
+            output = backend.invoke(function, timeout=30).strip()
+            if not output:
+                raise Exception(f"PowerShell não retornou dados ({function})")
+
+            self.snapshots[tier] = json.loads(output)
+            self.collected_at[tier] = time.monotonic()
+            if tier == 'static':
+                self._save_static()
+
+        if due:
+            logger.info(f"Níveis coletados: {', '.join(due)}")
+
+        data = {}
+        for tier, _, _ in self.TIERS:
+            data.update(self.snapshots.get(tier, {}))
+        return data
+
+
+class AgentScheduler:
+    """
+    Agenda única das tarefas periódicas do agente
+
+    Um heap ordenado pelo próximo vencimento e uma thread que dorme até ele
+    (ou até add() acordá-la). Tarefas que vencem dentro de COALESCE_WINDOW
+    rodam na mesma volta. Cada tarefa devolve os segundos até a próxima
+    execução, ou None para sair da agenda.
+    """
+
+    def __init__(self, coalesce_window=COALESCE_WINDOW):
+        self.coalesce_window = coalesce_window
+        self.running = False
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def add(self, name, func, delay=0):
+        with self._lock:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), name, func))
+        self._wakeup.set()
+
+    def _due(self):
+        limit = time.monotonic() + self.coalesce_window
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= limit:
+                due.append(heapq.heappop(self._heap))
+        return due
+
+    def _timeout(self):
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def run_pending(self):
+        for _, _, name, func in self._due():
+            try:
+                delay = func()
+            except Exception as e:
+                logger.error(f"Erro na tarefa {name}: {e}")
+                delay = jittered(OFFLINE_CHECK_INTERVAL)
+
+            if delay is not None:
+                self.add(name, func, delay)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self._wakeup.wait(self._timeout())
+            self._wakeup.clear()
+            self.run_pending()
+
+    def stop(self):
+        self.running = False
+        self._wakeup.set()
 
 
 class InventoryAgent:
@@ -918,6 +2025,15 @@ class InventoryAgent:
         self.network = NetworkMonitor(self.config)
         self.updater = AutoUpdater(self.config)
         self.notification_manager = NotificationManager(self.config)
+        self.inventory_delta = InventoryDelta()
+        self.checkin_schedule = CheckinSchedule(self.config.get('check_interval'))
+        self.scheduler = AgentScheduler()
+        self.collector = TieredCollector(self.config)
+        self.spool = OfflineSpool(max_bytes=self.config.get('spool_max_bytes'))
+        self.notification_manager.spool = self.spool
+        self.policy = BlockedSitesPolicy(self.config)
+        # Notificações buscadas pela agenda e exibidas na thread de notificações
+        self.notification_queue = queue.Queue()
         self.running = False
         self.last_status = None
 
@@ -930,83 +2046,249 @@ class InventoryAgent:
         """Inicia o agente"""
         self.running = True
 
-        threading.Thread(target=self.network_monitor_loop, daemon=True).start()
-        threading.Thread(target=self.data_sender_loop, daemon=True).start()
-        threading.Thread(target=self.notification_checker_loop, daemon=True).start()
+        self.scheduler.add('network', self.network_task)
+        self.scheduler.add('checkin', self.checkin_task, self.checkin_schedule.initial_delay())
 
         if self.config.get('auto_update'):
-            threading.Thread(target=self.update_checker_loop, daemon=True).start()
+            self.scheduler.add('update', self.update_task, random.uniform(0, OFFLINE_CHECK_INTERVAL * 5))
 
-        logger.info("Threads iniciadas com sucesso")
+        self.scheduler.add('policy', self.policy_task, random.uniform(0, POLICY_CHECK_INTERVAL))
+
+        # O long-poll bloqueia até 55s no servidor e fica em thread própria
+        if self.notification_manager.notifications_enabled:
+            threading.Thread(target=self.notification_checker_loop, daemon=True).start()
+
+        logger.info("Agenda de tarefas iniciada")
 
         try:
-            while self.running:
-                time.sleep(1)
+            self.scheduler.run()
         except KeyboardInterrupt:
             logger.info("Agente interrompido pelo usuário")
+        finally:
             self.running = False
+            self.scheduler.stop()
 
-    def network_monitor_loop(self):
-        """Loop de monitoramento de rede"""
-        while self.running:
-            status = None
+    def network_task(self):
+        """Health check, dispensado se outra requisição já falou com o servidor"""
+        was_online = self.last_status != "offline"
+
+        if not self.network.recently_reachable(OFFLINE_CHECK_INTERVAL):
+            self.network.check_connectivity()
+
+        if self.network.is_online:
+            if not was_online:
+                logger.info("Conexão restaurada")
+                self.spool.on_reconnect()
+            self.last_status = "online"
+        else:
+            if was_online:
+                logger.warning("Servidor offline")
+            self.last_status = "offline"
+
+        return jittered(OFFLINE_CHECK_INTERVAL)
 
-            if self.network.check_connectivity():
-                if self.last_status == "offline":
-                    status = "reconnected"
-                    logger.info("Conexão restaurada")
+    def checkin_task(self):
+        """Coleta via PowerShell e envia (ou guarda no spool)"""
+        try:
+            # USA POWERSHELL PARA COLETAR
+            data = self.collector.collect()
+
+            if self.network.is_online and self.replay_spool():
+                # USA PYTHON PARA ENVIAR
+                sent = PowerShellCollector.send_data(
+                    self.config, data, self.inventory_delta, self.checkin_schedule
+                )
+                if sent:
+                    self.network.mark_reachable()
+                else:
+                    self.spool_checkin(data)
             else:
-                if self.last_status != "offline":
-                    status = "offline"
-                    logger.warning("Servidor offline")
+                logger.debug("Servidor offline ou spool pendente, guardando check-in")
+                self.spool_checkin(data)
 
-            self.last_status = status
+        except Exception as e:
+            logger.error(f"Erro no ciclo de envio: {e}")
 
-            time.sleep(OFFLINE_CHECK_INTERVAL)
+        return self.checkin_schedule.next_delay()
 
-    def data_sender_loop(self):
-        """Loop de envio de dados usando PowerShell para coleta"""
-        while self.running:
-            is_online = self.network.check_connectivity()
+    def spool_checkin(self, data):
+        """Guarda o inventário completo para reenvio (o diff depende do servidor)"""
+        self.spool.append('checkin', payload={
+            "hostname": data["hostname"],
+            "ip": data.get("ip_address", ""),
+            "hardware": data,
+            "token": self.config.get("token_hash"),
+            "mode": "full",
+        })
 
-            if is_online:
-                try:
-                    # USA POWERSHELL PARA COLETAR
-                    data = PowerShellCollector.get_system_info()
+    def replay_spool(self):
+        """
+        Reenvia o conteúdo do spool respeitando o backoff
 
-                    # USA PYTHON PARA ENVIAR
-                    PowerShellCollector.send_data(self.config, data)
+        Returns:
+            bool: True se o spool está vazio (o envio normal pode seguir)
+        """
+        if not self.spool.has_pending():
+            return True
+        if not self.spool.ready() or self.checkin_schedule.backoff_until > time.monotonic():
+            return False
 
-                except Exception as e:
-                    logger.error(f"Erro no ciclo de envio: {e}")
-            else:
-                logger.debug("Servidor offline, aguardando reconexão")
+        records, segments = self.spool.take()
+        checkins = [r['payload'] for r in records if r['kind'] == 'checkin']
+        ack_ids = [i for r in records if r['kind'] == 'ack' for i in r['ids']]
 
-            time.sleep(HEARTBEAT_INTERVAL)
+        failed = []
+        if checkins and not self.replay_checkins(checkins):
+            failed.extend(r for r in records if r['kind'] == 'checkin')
 
-    def update_checker_loop(self):
-        """Loop de verificação de atualizações"""
-        while self.running:
-            if self.network.is_online:
-                try:
-                    update_info = self.updater.check_for_updates()
-                    if update_info:
-                        self.updater.download_update(update_info)
-                except Exception as e:
-                    logger.error(f"Erro ao verificar atualizações: {e}")
+        failed_ids = self.replay_acknowledgements(ack_ids)
+        if failed_ids:
+            failed.append({'kind': 'ack', 'ids': failed_ids})
+
+        # Segmentos lidos saem do disco; o que falhou volta para um segmento novo
+        self.spool.commit(segments)
+        for record in failed:
+            fields = {k: v for k, v in record.items() if k not in ('kind', 'spooled_at')}
+            self.spool.append(record['kind'], **fields)
+
+        if failed:
+            self.spool.record_failure()
+            logger.warning("Reenvio do spool incompleto, nova tentativa com backoff")
+            return False
+
+        self.spool.record_success()
+        logger.info(f"Spool reenviado: {len(checkins)} check-ins, {len(ack_ids)} confirmações")
+        return True
 
-            time.sleep(UPDATE_CHECK_INTERVAL)
+    def replay_checkins(self, checkins):
+        """Reenvia check-ins pelo endpoint em lote"""
+        url = self.config.get('server_url') + self.config.get('endpoint_checkin_batch')
+        body, headers = encode_json_body(self.config, {
+            'token': self.config.get('token_hash'),
+            'checkins': checkins,
+        })
+
+        try:
+            response = RequestsSession.get_session().post(
+                url, data=body, headers=headers, verify=False, timeout=30
+            )
+        except Exception as e:
+            logger.error(f"Erro ao reenviar check-ins: {e}")
+            return False
+
+        self.checkin_schedule.observe(response)
+        if response.status_code != 200:
+            logger.error(f"Erro HTTP {response.status_code} ao reenviar check-ins")
+            return False
+
+        latest = checkins[-1]
+        for result in response.json().get('results', []):
+            if result.get('status') == 'ok' and result.get('hostname') == latest['hostname']:
+                self.inventory_delta.confirm(latest['hardware'], result.get('inventory_hash'))
+            elif result.get('status') == 'error':
+                # Rejeitado pelo servidor: reenviar não adianta
+                logger.error(f"Check-in do spool rejeitado: {result}")
+        return True
+
+    def replay_acknowledgements(self, ids):
+        """
+        Returns:
+            list: IDs que não puderam ser confirmados
+        """
+        failed = []
+        manager = self.notification_manager
+        for start in range(0, len(ids), ACK_BATCH_SIZE):
+            chunk = ids[start:start + ACK_BATCH_SIZE]
+            try:
+                response = RequestsSession.get_session().post(
+                    f"{manager.server_url}{manager.endpoint_ack}",
+                    json={'machine_name': manager.machine_name, 'notification_ids': chunk},
+                    verify=False,
+                    timeout=10
+                )
+                if response.status_code == 200 and response.json().get('success'):
+                    continue
+                logger.warning(f"Falha ao reenviar confirmações: HTTP {response.status_code}")
+            except Exception as e:
+                logger.error(f"Erro ao reenviar confirmações: {e}")
+            failed.extend(chunk)
+        return failed
+
+    def update_task(self):
+        """Verificação de atualizações; o download roda fora da agenda"""
+        if self.network.is_online:
+            try:
+                update_info = self.updater.check_for_updates()
+                if update_info:
+                    threading.Thread(
+                        target=self.updater.download_update, args=(update_info,), daemon=True
+                    ).start()
+            except Exception as e:
+                logger.error(f"Erro ao verificar atualizações: {e}")
+
+        return self.updater.next_check_delay()
+
+    def policy_task(self):
+        """Política de sites bloqueados; sem mudança o servidor responde 304"""
+        if self.network.is_online:
+            try:
+                self.policy.refresh()
+            except Exception as e:
+                logger.error(f"Erro ao buscar sites bloqueados: {e}")
+
+        return jittered(POLICY_CHECK_INTERVAL)
 
     def notification_checker_loop(self):
-        """Loop de verificação de notificações"""
-        time.sleep(30)
-        while self.running:
+        """
+        Loop de long-poll de notificações
+
+        Se o servidor não tiver long-poll a busca passa a ser uma tarefa
+        periódica da agenda e esta thread só exibe o que ela buscou: os popups
+        aguardam o usuário e não podem segurar a agenda.
+        """
+        time.sleep(random.uniform(15, 45))
+        while self.running and self.notification_manager.long_poll_available:
+            long_polled = False
             if self.network.is_online:
                 try:
-                    self.notification_manager.process_pending_notifications()
+                    long_polled = self.notification_manager.process_pending_notifications(wait=True)
                 except Exception as e:
                     logger.error(f"Erro ao verificar notificações: {e}")
-            time.sleep(NotificationManager.NOTIFICATION_CHECK_INTERVAL)
+
+            # O long-poll já aguardou no servidor; só dorme no modo polling
+            if not long_polled and self.notification_manager.long_poll_available:
+                time.sleep(jittered(NotificationManager.NOTIFICATION_CHECK_INTERVAL))
+
+        if self.running:
+            logger.info("Servidor sem long-poll, notificações passam para a agenda")
+            self.scheduler.add(
+                'notifications', self.notification_task,
+                jittered(NotificationManager.NOTIFICATION_CHECK_INTERVAL)
+            )
+
+        while self.running:
+            try:
+                notifications = self.notification_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self.notification_manager.display_notifications(notifications)
+            except Exception as e:
+                logger.error(f"Erro ao exibir notificações: {e}")
+            finally:
+                self.notification_queue.task_done()
+
+    def notification_task(self):
+        """Só a busca roda na agenda; a exibição fica na thread de notificações"""
+        # Lote anterior ainda na tela: as mesmas notificações viriam de novo
+        if self.network.is_online and not self.notification_queue.unfinished_tasks:
+            try:
+                notifications, _ = self.notification_manager.fetch_notifications()
+                if notifications:
+                    self.notification_queue.put(notifications)
+            except Exception as e:
+                logger.error(f"Erro ao verificar notificações: {e}")
+        return jittered(NotificationManager.NOTIFICATION_CHECK_INTERVAL)
 
 
 def test_notification_simple():
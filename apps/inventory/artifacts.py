@@ -0,0 +1,239 @@
+"""
+Artefatos do agente (agent.ps1 e arquivos de AgentVersion)
+
+    - prepare_version: calcula SHA-256 e tamanho uma única vez no upload e
+      grava uma variante gzip quando ela compensa
+    - file_digest_cache: digest e conteúdo de arquivos locais (agent.ps1),
+      recalculados apenas quando mtime/tamanho mudam
+    - serve_artifact: resposta com ETag/Last-Modified (304), Range (206/416)
+      e a variante pré-comprimida para clientes que aceitam gzip
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from django.core.files import File
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# A variante gzip só é gravada se reduzir pelo menos 10%
+GZIP_MIN_RATIO = 0.9
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def hash_stream(stream):
+    """
+    Returns:
+        tuple: (sha256 hex, tamanho em bytes)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def prepare_version(version):
+    """
+    Calcula digest/tamanho do arquivo da versão e gera a variante gzip
+
+    Chamado no upload (AgentVersionCreateView) e, para versões antigas sem
+    digest, no primeiro download.
+    """
+    with version.file_path.open('rb') as source:
+        sha256, size = hash_stream(source)
+
+        source.seek(0)
+        with tempfile.TemporaryFile() as compressed:
+            with gzip.GzipFile(fileobj=compressed, mode='wb', mtime=0) as gz:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    gz.write(chunk)
+            compressed_size = compressed.tell()
+
+            if version.gzip_file:
+                version.gzip_file.delete(save=False)
+
+            if size and compressed_size < size * GZIP_MIN_RATIO:
+                compressed.seek(0)
+                name = os.path.basename(version.file_path.name) + '.gz'
+                version.gzip_file.save(name, File(compressed), save=False)
+
+    version.sha256 = sha256
+    version.file_size = size
+    version.save(update_fields=['sha256', 'file_size', 'gzip_file'])
+
+    logger.info(
+        f"Artefato da versão {version.version}: {size} bytes, sha256 {sha256}"
+        + (f", gzip {compressed_size} bytes" if version.gzip_file else "")
+    )
+    return version
+
+
+class FileDigestCache:
+    """Conteúdo, digest e variante gzip de arquivos locais pequenos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, path):
+        """
+        Returns:
+            dict: content, gzip, sha256, size, mtime — ou None se não existir
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry['key'] == key:
+                return entry
+
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        compressed = gzip.compress(content, mtime=0)
+        entry = {
+            'key': key,
+            'content': content,
+            'gzip': compressed if len(compressed) < len(content) * GZIP_MIN_RATIO else None,
+            'sha256': hashlib.sha256(content).hexdigest(),
+            'size': len(content),
+            'mtime': int(stat.st_mtime),
+        }
+        with self._lock:
+            self._entries[path] = entry
+        return entry
+
+
+file_digest_cache = FileDigestCache()
+
+
+def etag_matches(header, etags):
+    """
+    Compara um If-None-Match (lista de ETags, fracos ou não, ou *) com `etags`
+
+    A comparação é exata por ETag; não basta uma ser substring do header.
+    """
+    if header.strip() == '*':
+        return True
+    candidates = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return bool(candidates & etags)
+
+
+def _parse_range(header, size):
+    """
+    Apenas um intervalo por requisição
+
+    Returns:
+        tuple: (início, fim) inclusivo; None para ignorar o header e
+               False se o intervalo não puder ser atendido
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _range_stream(open_file, start, length):
+    with open_file() as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_artifact(request, open_file, size, sha256, last_modified, content_type, filename,
+                   open_gzip=None, gzip_size=None, cache_control='no-cache'):
+    """
+    Resposta HTTP para um artefato com digest conhecido
+
+    Args:
+        open_file (callable): Abre o arquivo original em modo binário
+        size (int): Tamanho do original
+        sha256 (str): Digest do original (base do ETag)
+        last_modified (int): Timestamp Unix
+        open_gzip (callable): Abre a variante gzip, se existir
+    """
+    etag = f'"{sha256}"'
+    gzip_etag = f'"{sha256}-gzip"'
+
+    def headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = cache_control
+        response['X-Content-SHA256'] = sha256
+        if open_gzip is not None:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        if etag_matches(if_none_match, {etag, gzip_etag}):
+            return headers(HttpResponse(status=304))
+    else:
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if since is not None and int(last_modified) <= since:
+            return headers(HttpResponse(status=304))
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is False:
+            response = headers(HttpResponse(status=416))
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            response = headers(StreamingHttpResponse(
+                _range_stream(open_file, start, length), status=206, content_type=content_type
+            ))
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+
+    accepts_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+    if open_gzip is not None and accepts_gzip:
+        response = headers(FileResponse(open_gzip(), content_type=content_type))
+        response['ETag'] = gzip_etag
+        response['Content-Encoding'] = 'gzip'
+        if gzip_size is not None:
+            response['Content-Length'] = str(gzip_size)
+    else:
+        response = headers(FileResponse(open_file(), content_type=content_type))
+        response['Content-Length'] = str(size)
+
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,57 @@
+"""
+Envio de uma notificação para várias máquinas (grupo, online ou frota inteira)
+
+As linhas de Notification são criadas com bulk_create em blocos dentro de uma
+única transação, sem passar pelo post_save de cada notificação. Depois do
+commit os long-polls das máquinas são acordados de uma vez.
+"""
+from django.db import transaction
+from django.utils import timezone
+from .models import Notification
+from .broker import notification_broker
+
+# Notificações por INSERT
+BROADCAST_CHUNK_SIZE = 500
+
+
+def broadcast_notification(machines, title, message, type='info', priority='normal',
+                           expires_at=None, chunk_size=BROADCAST_CHUNK_SIZE, progress=None):
+    """
+    Cria a mesma notificação para todas as máquinas do queryset
+
+    Args:
+        machines (QuerySet): Máquinas de destino
+        progress (callable): Chamado como progress(criadas, total) a cada bloco
+
+    Returns:
+        int: Número de notificações criadas
+    """
+    machine_ids = list(machines.order_by().values_list('pk', flat=True))
+    total = len(machine_ids)
+
+    # Mesma regra de Notification.save()
+    status = 'expired' if expires_at and timezone.now() > expires_at else 'pending'
+
+    created = 0
+    with transaction.atomic():
+        for i in range(0, total, chunk_size):
+            chunk = machine_ids[i:i + chunk_size]
+            Notification.objects.bulk_create([
+                Notification(
+                    machine_id=pk,
+                    title=title,
+                    message=message,
+                    type=type,
+                    priority=priority,
+                    status=status,
+                    expires_at=expires_at,
+                )
+                for pk in chunk
+            ])
+            created += len(chunk)
+            if progress:
+                progress(created, total)
+
+        transaction.on_commit(lambda: [notification_broker.publish(pk) for pk in machine_ids])
+
+    return created
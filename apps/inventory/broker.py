@@ -0,0 +1,69 @@
+"""
+Pub/sub em memória para notificações das máquinas
+
+O long-poll de notificações (MachineNotificationWaitView) assina o canal da
+máquina e dorme até uma publicação ou o timeout. O signal notification_created
+publica após o commit da notificação.
+
+O canal é por processo: uma notificação criada em outro worker não acorda o
+long-poll, que ainda assim a encontra ao consultar o banco no fim do timeout.
+
+Cada long-poll ocupa uma thread do servidor WSGI durante todo o timeout.
+INVENTORY_NOTIFICATION_MAX_WAITERS limita os long-polls simultâneos por
+processo; acima dele a view responde 429 e o agente tenta de novo depois.
+Dimensione os workers com folga: com gunicorn --worker-class gthread,
+threads por worker >= MAX_WAITERS + as requisições comuns (check-in,
+ações), senão os long-polls deixam o check-in sem thread livre.
+"""
+import threading
+from django.conf import settings
+
+# Long-polls simultâneos por processo
+NOTIFICATION_MAX_WAITERS = getattr(settings, 'INVENTORY_NOTIFICATION_MAX_WAITERS', 16)
+
+
+class NotificationBroker:
+    """Canais por machine_id baseados em threading.Event"""
+
+    def __init__(self, max_waiters=None):
+        self.max_waiters = max_waiters
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._count = 0
+
+    def subscribe(self, machine_id):
+        """
+        Returns:
+            threading.Event, ou None se já houver max_waiters assinantes
+        """
+        event = threading.Event()
+        with self._lock:
+            if self.max_waiters is not None and self._count >= self.max_waiters:
+                return None
+            self._subscribers.setdefault(machine_id, set()).add(event)
+            self._count += 1
+        return event
+
+    def unsubscribe(self, machine_id, event):
+        with self._lock:
+            events = self._subscribers.get(machine_id)
+            if events is not None and event in events:
+                events.discard(event)
+                self._count -= 1
+                if not events:
+                    del self._subscribers[machine_id]
+
+    def publish(self, machine_id):
+        """Acorda todos os long-polls da máquina"""
+        with self._lock:
+            events = list(self._subscribers.get(machine_id, ()))
+        for event in events:
+            event.set()
+        return len(events)
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+
+notification_broker = NotificationBroker(max_waiters=NOTIFICATION_MAX_WAITERS)
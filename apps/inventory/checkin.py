@@ -0,0 +1,353 @@
+"""
+Protocolo de check-in incremental do agente
+
+O servidor guarda em Machine.inventory_hash o hash do último inventário
+recebido e o devolve em toda resposta de check-in. O agente então envia:
+
+    - mode="full":      inventário completo (padrão, compatível com agent.ps1)
+    - mode="diff":      apenas as chaves alteradas desde o hash base
+    - mode="heartbeat": nenhum dado de hardware, só confirma o hash atual
+
+Em todos os modos apenas as colunas que realmente mudaram são gravadas; se
+nada mudou, last_seen é gravado em lote pelo buffer de heartbeats.
+"""
+import json
+import hashlib
+import datetime
+import logging
+from django.db import transaction
+from django.utils import timezone
+from .models import Machine
+from .heartbeat import heartbeat_buffer
+from .telemetry import telemetry_recorder
+from .components import sync_components, COMPONENT_FIELDS
+from .journal import build_changes, record_changes
+from .search import index_machines, SEARCH_FIELDS
+
+logger = logging.getLogger(__name__)
+
+MODE_FULL = 'full'
+MODE_DIFF = 'diff'
+MODE_HEARTBEAT = 'heartbeat'
+
+# Objetos por INSERT/UPDATE nas gravações em lote
+BATCH_WRITE_SIZE = 200
+
+
+class CheckinResync(Exception):
+    """O hash base enviado pelo agente não confere com o inventário armazenado"""
+
+    def __init__(self, inventory_hash):
+        super().__init__("Inventário divergente, reenvie o check-in completo")
+        self.inventory_hash = inventory_hash
+
+
+def parse_wmi_date(wmi_date_str):
+    """
+    Converte formato de data WMI/JSON do PowerShell/Python
+    Formato recebido: "/Date(1234567890000)/" (timestamp em milissegundos)
+    """
+    if not wmi_date_str:
+        return None
+
+    try:
+        # Remove /Date( e )/
+        if isinstance(wmi_date_str, str) and wmi_date_str.startswith('/Date('):
+            ms = int(wmi_date_str.replace('/Date(', '').replace(')/', ''))
+            # Converte de milissegundos para datetime
+            return datetime.datetime.utcfromtimestamp(ms / 1000).replace(tzinfo=datetime.timezone.utc)
+
+        # Se já for datetime, retorna
+        if isinstance(wmi_date_str, datetime.datetime):
+            return wmi_date_str
+
+        return None
+    except (ValueError, AttributeError) as e:
+        logger.error(f"Erro ao parsear data WMI: {wmi_date_str} - {e}")
+        return None
+
+
+# Chave do dicionário "hardware" -> (campo do Machine, conversor)
+HARDWARE_FIELD_MAP = {
+    'logged_user': ('loggedUser', None),
+    'tpm': ('tpm', None),
+    'manufacturer': ('manufacturer', None),
+    'model': ('model', None),
+    'serial_number': ('serial_number', None),
+    'bios_version': ('bios_version', None),
+    'mac_address': ('mac_address', None),
+    'total_memory_slots': ('total_memory_slots', None),
+    'populated_memory_slots': ('populated_memory_slots', None),
+    'memory_modules': ('memory_modules', None),
+    'os_caption': ('os_caption', None),
+    'os_architecture': ('os_architecture', None),
+    'os_build': ('os_build', None),
+    'install_date': ('install_date', parse_wmi_date),
+    'last_boot': ('last_boot', parse_wmi_date),
+    'uptime_days': ('uptime_days', None),
+    'cpu': ('cpu', None),
+    'ram_gb': ('ram_gb', None),
+    'disk_space_gb': ('disk_space_gb', None),
+    'disk_free_gb': ('disk_free_gb', None),
+    'network_adapters': ('network_info', None),
+    'gpu_name': ('gpu_name', None),
+    'gpu_driver': ('gpu_driver', None),
+    'antivirus_name': ('antivirus_name', None),
+    'av_state': ('av_state', str),
+}
+
+
+def compute_inventory_hash(hardware):
+    """
+    Hash SHA-256 do dicionário de hardware em JSON canônico
+
+    O agente calcula o mesmo hash (InventoryDelta.compute_hash em agent.py),
+    por isso a serialização deve permanecer idêntica nos dois lados.
+    """
+    canonical = json.dumps(hardware or {}, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def hardware_to_fields(hardware):
+    """
+    Converte as chaves presentes em "hardware" para valores de campos do Machine
+
+    Apenas as chaves enviadas são convertidas, o que permite aplicar diffs.
+    Os valores passam por field.to_python para que a comparação com o
+    registro armazenado não acuse mudanças falsas (ex.: datas em CharField).
+    """
+    values = {}
+    for key, value in hardware.items():
+        mapping = HARDWARE_FIELD_MAP.get(key)
+        if not mapping:
+            continue
+        field_name, converter = mapping
+        if converter:
+            value = converter(value)
+        values[field_name] = Machine._meta.get_field(field_name).to_python(value)
+    return values
+
+
+def full_hardware_fields(hardware):
+    """
+    Campos de um check-in completo: chaves ausentes limpam a coluna, como no
+    update_or_create original do MachineCheckinView
+    """
+    return hardware_to_fields({key: hardware.get(key) for key in HARDWARE_FIELD_MAP})
+
+
+def _build_machine(data, now):
+    """Cria (sem gravar) uma máquina a partir de um check-in completo"""
+    hardware = data.get('hardware') or {}
+    return Machine(
+        hostname=data['hostname'],
+        ip_address=data.get('ip', ''),
+        is_online=True,
+        last_seen=now,
+        inventory_hash=compute_inventory_hash(hardware),
+        **full_hardware_fields(hardware),
+    )
+
+
+def _changed_fields(data, machine):
+    """
+    Calcula as colunas que o check-in altera em uma máquina existente
+
+    Raises:
+        CheckinResync: hash base divergente
+        ValueError: modo desconhecido
+    """
+    mode = data.get('mode') or MODE_FULL
+    hardware = data.get('hardware') or {}
+
+    if mode == MODE_FULL:
+        new_values = full_hardware_fields(hardware)
+        new_values['inventory_hash'] = compute_inventory_hash(hardware)
+    elif mode == MODE_DIFF:
+        if not data.get('base_hash') or data.get('base_hash') != machine.inventory_hash:
+            raise CheckinResync(machine.inventory_hash)
+        # O hash do inventário completo só o agente conhece; sem ele o diff é recusado
+        if not data.get('inventory_hash'):
+            raise CheckinResync(machine.inventory_hash)
+        new_values = hardware_to_fields(hardware)
+        new_values['inventory_hash'] = data['inventory_hash']
+    elif mode == MODE_HEARTBEAT:
+        if not data.get('inventory_hash') or data.get('inventory_hash') != machine.inventory_hash:
+            raise CheckinResync(machine.inventory_hash)
+        new_values = {}
+    else:
+        raise ValueError(f"Modo de check-in desconhecido: {mode}")
+
+    if 'ip' in data:
+        new_values['ip_address'] = Machine._meta.get_field('ip_address').to_python(data['ip'])
+
+    return {
+        field: value for field, value in new_values.items()
+        if getattr(machine, field) != value
+    }
+
+
+def apply_checkin(data):
+    """
+    Aplica um check-in (full, diff ou heartbeat) gravando apenas colunas alteradas
+
+    Returns:
+        tuple: (machine, changed_fields)
+
+    Raises:
+        CheckinResync: quando o agente precisa reenviar o inventário completo
+    """
+    now = timezone.now()
+    machine = Machine.objects.filter(hostname=data['hostname']).first()
+
+    if machine is None:
+        if (data.get('mode') or MODE_FULL) != MODE_FULL:
+            raise CheckinResync(None)
+
+        machine = _build_machine(data, now)
+        machine.save()
+        sync_components([(machine, None)])
+        telemetry_recorder.record(machine, now)
+        return machine, ['__all__']
+
+    changed = _changed_fields(data, machine)
+
+    if not changed and machine.is_online:
+        # Nada mudou: last_seen é gravado em lote (heartbeat.py)
+        heartbeat_buffer.record(machine.pk, now)
+        machine.last_seen = now
+        telemetry_recorder.record(machine, now)
+        return machine, []
+
+    changed['last_seen'] = now
+    changed['is_online'] = True
+
+    journal = build_changes(
+        machine.pk, {field: getattr(machine, field) for field in changed}, changed, now
+    )
+
+    # update() grava só as colunas alteradas e não dispara o pre_save
+    heartbeat_buffer.discard(machine.pk)
+    Machine.objects.filter(pk=machine.pk).update(**changed)
+    record_changes(journal)
+    for field, value in changed.items():
+        setattr(machine, field, value)
+
+    if any(field in changed for field in COMPONENT_FIELDS):
+        sync_components([(machine, set(changed))])
+
+    if any(field in changed for field in SEARCH_FIELDS):
+        index_machines([machine])
+
+    telemetry_recorder.record(machine, now)
+    return machine, sorted(changed)
+
+
+def apply_checkin_batch(items, authorize=None):
+    """
+    Aplica vários check-ins (ex.: enviados por um relay) em uma transação
+
+    As máquinas são carregadas com uma única consulta, as novas são criadas
+    com bulk_create e as alteradas gravadas com bulk_update agrupadas pelo
+    conjunto de colunas modificadas. Heartbeats sem mudança vão para o buffer.
+
+    Args:
+        items (list): Payloads no mesmo formato do check-in individual
+        authorize (callable): Recebe o payload e retorna False para rejeitá-lo
+
+    Returns:
+        list: Um resultado por item, na mesma ordem
+    """
+    now = timezone.now()
+    hostnames = [item['hostname'] for item in items if isinstance(item, dict) and item.get('hostname')]
+    machines = Machine.objects.in_bulk(hostnames, field_name='hostname')
+
+    results = []
+    to_create = {}
+    to_update = {}
+    journal = []
+
+    for item in items:
+        hostname = item.get('hostname') if isinstance(item, dict) else None
+        result = {'hostname': hostname}
+        results.append(result)
+
+        if not hostname:
+            result.update(status='error', error='hostname obrigatório')
+            continue
+
+        if authorize is not None and not authorize(item):
+            result.update(status='error', error='Token inválido')
+            continue
+
+        try:
+            machine = machines.get(hostname)
+
+            if machine is None:
+                if (item.get('mode') or MODE_FULL) != MODE_FULL:
+                    raise CheckinResync(None)
+                machine = _build_machine(item, now)
+                machines[hostname] = machine
+                to_create[hostname] = machine
+            else:
+                changed = _changed_fields(item, machine)
+
+                if machine.pk is None:
+                    # Criada neste mesmo lote: basta atualizar o objeto
+                    for field, value in changed.items():
+                        setattr(machine, field, value)
+                elif not changed and machine.is_online:
+                    heartbeat_buffer.record(machine.pk, now)
+                    machine.last_seen = now
+                else:
+                    changed['last_seen'] = now
+                    changed['is_online'] = True
+                    journal.extend(build_changes(
+                        machine.pk, {field: getattr(machine, field) for field in changed}, changed, now
+                    ))
+                    for field, value in changed.items():
+                        setattr(machine, field, value)
+                    heartbeat_buffer.discard(machine.pk)
+                    to_update.setdefault(machine.pk, (machine, set()))[1].update(changed)
+
+            result.update(status='ok', machine=machine)
+
+        except CheckinResync as e:
+            result.update(status='resync', inventory_hash=e.inventory_hash)
+        except Exception as e:
+            logger.warning(f"Check-in em lote rejeitado para {hostname}: {e}")
+            result.update(status='error', error=str(e))
+
+    groups = {}
+    for machine, fields in to_update.values():
+        groups.setdefault(frozenset(fields), []).append(machine)
+
+    with transaction.atomic():
+        if to_create:
+            Machine.objects.bulk_create(list(to_create.values()), batch_size=BATCH_WRITE_SIZE)
+        for fields, group in groups.items():
+            Machine.objects.bulk_update(group, sorted(fields), batch_size=BATCH_WRITE_SIZE)
+
+        component_changes = [(machine, None) for machine in to_create.values()]
+        component_changes += [
+            (machine, fields) for machine, fields in to_update.values()
+            if any(field in fields for field in COMPONENT_FIELDS)
+        ]
+        if component_changes:
+            sync_components(component_changes)
+
+        record_changes(journal)
+
+        index_machines(list(to_create.values()) + [
+            machine for machine, fields in to_update.values()
+            if any(field in fields for field in SEARCH_FIELDS)
+        ])
+
+    for result in results:
+        machine = result.pop('machine', None)
+        if machine is not None:
+            result['machine_id'] = machine.pk
+            result['inventory_hash'] = machine.inventory_hash
+            telemetry_recorder.record(machine, now)
+
+    return results
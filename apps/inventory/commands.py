@@ -0,0 +1,439 @@
+"""
+Execução assíncrona de comandos remotos (WinRM)
+
+A view só grava um CommandJob e devolve o id; um pool de threads executa os
+jobs com limite de execuções simultâneas por máquina e timeout por job, e
+grava status, código de saída, stdout e stderr. O resultado é consultado em
+/api/inventario/jobs/<id>/ (com ?wait= para aguardar a conclusão).
+
+Os workers rodam no processo web (INVENTORY_COMMAND_WORKERS) ou em um
+processo dedicado (manage.py run_command_worker). Um job só é executado por
+quem conseguir movê-lo de 'queued' para 'running', então vários processos
+podem consumir a mesma fila.
+
+Filas privadas (ex.: run_group_command --fake) usam um `owner` próprio; os
+jobs delas levam esse owner e nunca são recuperados nem executados pela
+fila compartilhada.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .broker import NotificationBroker
+from .models import CommandJob, CommandBatch, Machine
+
+logger = logging.getLogger(__name__)
+
+# Threads de execução por processo (0 = apenas enfileira; use run_command_worker)
+COMMAND_WORKERS = getattr(settings, 'INVENTORY_COMMAND_WORKERS', 8)
+
+# Comandos simultâneos na mesma máquina
+COMMAND_PER_TARGET = getattr(settings, 'INVENTORY_COMMAND_PER_TARGET', 1)
+
+# Timeout padrão e máximo (segundos)
+COMMAND_TIMEOUT = getattr(settings, 'INVENTORY_COMMAND_TIMEOUT', 120)
+COMMAND_MAX_TIMEOUT = getattr(settings, 'INVENTORY_COMMAND_MAX_TIMEOUT', 3600)
+
+# Classe que executa os comandos (FakeTransport para testes e desenvolvimento)
+COMMAND_TRANSPORT = getattr(
+    settings, 'INVENTORY_COMMAND_TRANSPORT', 'apps.inventory.commands.WinRMTransport'
+)
+
+WINRM_USER = getattr(settings, 'INVENTORY_WINRM_USER', 'admin')
+WINRM_PASSWORD = getattr(settings, 'INVENTORY_WINRM_PASSWORD', 'senha')
+
+# Conclusão de jobs, para o ?wait= da consulta
+job_events = NotificationBroker()
+
+
+class CommandTimeout(Exception):
+    """O comando não terminou dentro do timeout do job"""
+
+
+class WinRMTransport:
+    """Executa o job na máquina via WinRM (porta 5985)"""
+
+    def run(self, machine, job):
+        """
+        Returns:
+            tuple: (status_code, stdout, stderr)
+        """
+        import winrm
+        from winrm.exceptions import WinRMOperationTimeoutError
+        from requests.exceptions import Timeout
+
+        if not machine.ip_address:
+            raise RuntimeError(f"Máquina {machine.hostname} não possui IP cadastrado.")
+
+        session = winrm.Session(
+            f"http://{machine.ip_address}:5985/wsman",
+            auth=(WINRM_USER, WINRM_PASSWORD),
+            server_cert_validation='ignore',
+            operation_timeout_sec=job.timeout_seconds,
+            read_timeout_sec=job.timeout_seconds + 10,
+        )
+
+        try:
+            if job.kind == CommandJob.KIND_CMD:
+                result = session.run_cmd(job.command, job.arguments or [])
+            else:
+                result = session.run_ps(job.command)
+        except (WinRMOperationTimeoutError, Timeout) as e:
+            raise CommandTimeout(f"Sem resposta em {job.timeout_seconds}s") from e
+
+        return (
+            result.status_code,
+            result.std_out.decode('utf-8', 'ignore'),
+            result.std_err.decode('utf-8', 'ignore'),
+        )
+
+
+class FakeTransport:
+    """
+    Transporte local, sem WinRM
+
+    Args:
+        responses (dict): hostname -> (status_code, stdout, stderr) ou
+                          callable(machine, job) com o mesmo retorno
+        default (tuple): Resposta para hostnames sem entrada; por padrão
+                         ecoa o comando
+        delay (float): Segundos simulados por comando
+    """
+
+    def __init__(self, responses=None, default=None, delay=0):
+        self.responses = responses or {}
+        self.default = default
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def run(self, machine, job):
+        with self._lock:
+            self.calls.append((machine.hostname, job.command))
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        response = self.responses.get(machine.hostname, self.default)
+        if callable(response):
+            response = response(machine, job)
+        if isinstance(response, Exception):
+            raise response
+        if response is None:
+            return 0, f'{job.command}\n', ''
+        return response
+
+
+def get_transport():
+    return import_string(COMMAND_TRANSPORT)()
+
+
+class CommandQueue:
+    """
+    Fila em memória de ids de CommandJob com pool de workers
+
+    Args:
+        owner (str): '' para a fila compartilhada; private=True gera um owner
+                     único, e a fila só enxerga os jobs criados por ela
+    """
+
+    def __init__(self, workers=COMMAND_WORKERS, per_target=COMMAND_PER_TARGET, transport=None,
+                 recover_on_start=True, private=False):
+        self.workers = workers
+        self.per_target = per_target
+        self.transport = transport or get_transport()
+        self.recover_on_start = recover_on_start
+        self.owner = f'private:{uuid.uuid4().hex}' if private else ''
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._queued_ids = set()
+        self._running = {}
+        self._threads = []
+        self._stopping = False
+
+    def submit(self, machine, command, kind=CommandJob.KIND_POWERSHELL, arguments=None,
+               timeout=None, user=None):
+        """Cria o job e o enfileira após o commit"""
+        job = CommandJob.objects.create(
+            machine=machine,
+            kind=kind,
+            command=command,
+            arguments=arguments or [],
+            timeout_seconds=min(timeout or COMMAND_TIMEOUT, COMMAND_MAX_TIMEOUT),
+            owner=self.owner,
+            created_by=user,
+        )
+        transaction.on_commit(lambda: self.enqueue(job.pk, job.machine_id))
+        return job
+
+    def enqueue(self, job_id, machine_id):
+        with self._cond:
+            # Sem workers neste processo: o job fica no banco para o run_command_worker
+            if not self.workers and not self._threads:
+                return
+            if job_id in self._queued_ids:
+                return
+            self._queued_ids.add(job_id)
+            self._pending.append((job_id, machine_id))
+            self._cond.notify()
+
+        if self.workers:
+            self.start()
+
+    def recover(self):
+        """
+        Enfileira jobs 'queued' do banco e encerra os 'running' órfãos
+
+        Um job em execução há mais que o timeout máximo pertence a um
+        processo que morreu.
+        """
+        stale = timezone.now() - timedelta(seconds=COMMAND_MAX_TIMEOUT + 60)
+        CommandJob.objects.filter(
+            owner=self.owner, status=CommandJob.STATUS_RUNNING, started_at__lt=stale
+        ).update(
+            status=CommandJob.STATUS_FAILED,
+            error='Interrompido (processo encerrado durante a execução)',
+            finished_at=timezone.now(),
+        )
+
+        queued = CommandJob.objects.filter(
+            owner=self.owner, status=CommandJob.STATUS_QUEUED
+        ).order_by('created_at').values_list('pk', 'machine_id')
+        for job_id, machine_id in queued:
+            self.enqueue(job_id, machine_id)
+
+    def start(self, workers=None):
+        """Inicia as threads (idempotente)"""
+        workers = workers or self.workers
+        with self._cond:
+            self._stopping = False
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            missing = workers - len(self._threads)
+            first_start = not self._threads
+            for _ in range(max(missing, 0)):
+                thread = threading.Thread(
+                    target=self._run,
+                    name=f'inventory-command-{len(self._threads) + 1}',
+                    daemon=True,
+                )
+                self._threads.append(thread)
+                thread.start()
+
+        if first_start and missing > 0 and self.recover_on_start:
+            threading.Thread(target=self._recover_safely, daemon=True).start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def running_count(self):
+        with self._cond:
+            return sum(self._running.values())
+
+    def _recover_safely(self):
+        try:
+            self.recover()
+        except Exception:
+            logger.exception("Erro ao recuperar jobs pendentes")
+        finally:
+            close_old_connections()
+
+    def _next(self):
+        """Primeiro job cuja máquina está abaixo do limite (com _cond adquirido)"""
+        for index, (job_id, machine_id) in enumerate(self._pending):
+            if self._running.get(machine_id, 0) < self.per_target:
+                del self._pending[index]
+                self._queued_ids.discard(job_id)
+                self._running[machine_id] = self._running.get(machine_id, 0) + 1
+                return job_id, machine_id
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                item = self._next()
+                while item is None and not self._stopping:
+                    self._cond.wait()
+                    item = self._next()
+                if item is None:
+                    return
+
+            job_id, machine_id = item
+            try:
+                self.execute(job_id)
+            except Exception:
+                logger.exception(f"Erro ao executar job {job_id}")
+            finally:
+                close_old_connections()
+                with self._cond:
+                    remaining = self._running.get(machine_id, 1) - 1
+                    if remaining:
+                        self._running[machine_id] = remaining
+                    else:
+                        self._running.pop(machine_id, None)
+                    self._cond.notify_all()
+
+    def execute(self, job_id):
+        """Executa um job 'queued' desta fila; False se outro worker já o pegou"""
+        claimed = CommandJob.objects.filter(
+            pk=job_id, owner=self.owner, status=CommandJob.STATUS_QUEUED
+        ).update(status=CommandJob.STATUS_RUNNING, started_at=timezone.now())
+        if not claimed:
+            return False
+
+        job = CommandJob.objects.select_related('machine').get(pk=job_id)
+
+        try:
+            job.status_code, job.stdout, job.stderr = self.transport.run(job.machine, job)
+            job.status = (
+                CommandJob.STATUS_SUCCEEDED if job.status_code == 0 else CommandJob.STATUS_FAILED
+            )
+        except CommandTimeout as e:
+            job.status = CommandJob.STATUS_TIMEOUT
+            job.error = str(e)
+        except Exception as e:
+            job.status = CommandJob.STATUS_FAILED
+            job.error = str(e)
+
+        job.finished_at = timezone.now()
+        job.save(update_fields=[
+            'status', 'status_code', 'stdout', 'stderr', 'error', 'finished_at'
+        ])
+        job_events.publish(job.pk)
+
+        logger.info(f"Job {job.pk} em {job.machine.hostname}: {job.status}")
+        return True
+
+
+command_queue = CommandQueue()
+
+atexit.register(command_queue.stop)
+
+
+def fan_out(group, command, kind=CommandJob.KIND_POWERSHELL, timeout=None, user=None,
+            only_online=False, queue=None):
+    """
+    Cria um job por máquina do grupo e os entrega ao pool de workers
+
+    O paralelismo é limitado pelo número de workers da fila e pelo limite
+    por máquina; os resultados ficam nos jobs do lote (aggregate_batch).
+
+    Returns:
+        CommandBatch
+    """
+    queue = queue or command_queue
+    machines = Machine.objects.filter(group=group)
+    if only_online:
+        machines = machines.filter(is_online=True)
+    machine_ids = list(machines.values_list('pk', flat=True))
+
+    timeout_seconds = min(timeout or COMMAND_TIMEOUT, COMMAND_MAX_TIMEOUT)
+
+    with transaction.atomic():
+        batch = CommandBatch.objects.create(
+            group=group,
+            kind=kind,
+            command=command,
+            total=len(machine_ids),
+            created_by=user,
+        )
+        jobs = CommandJob.objects.bulk_create([
+            CommandJob(
+                machine_id=machine_id,
+                batch=batch,
+                kind=kind,
+                command=command,
+                timeout_seconds=timeout_seconds,
+                owner=queue.owner,
+                created_by=user,
+            )
+            for machine_id in machine_ids
+        ], batch_size=500)
+
+        transaction.on_commit(
+            lambda: [queue.enqueue(job.pk, job.machine_id) for job in jobs]
+        )
+
+    return batch
+
+
+# Saídas distintas listadas no resumo do lote
+BATCH_MAX_OUTPUTS = 20
+BATCH_HOSTS_PER_OUTPUT = 10
+
+
+def aggregate_batch(batch):
+    """
+    Resumo do lote: contagem por status e saídas distintas com as máquinas
+
+    Returns:
+        dict
+    """
+    counts = {code: 0 for code, _ in CommandJob.STATUS_CHOICES}
+    outputs = {}
+    hosts = []
+
+    rows = batch.jobs.values_list(
+        'machine__hostname', 'status', 'status_code', 'stdout', 'stderr', 'error'
+    ).order_by('machine__hostname')
+
+    for hostname, job_status, status_code, stdout, stderr, error in rows:
+        counts[job_status] = counts.get(job_status, 0) + 1
+        hosts.append({
+            'hostname': hostname,
+            'status': job_status,
+            'status_code': status_code,
+            'stdout': stdout,
+            'stderr': stderr,
+            'error': error,
+        })
+
+        if job_status in CommandJob.FINISHED_STATUSES:
+            key = (stdout or '').strip() or (stderr or error or '').strip()
+            entry = outputs.setdefault(key, {'output': key, 'count': 0, 'hosts': []})
+            entry['count'] += 1
+            if len(entry['hosts']) < BATCH_HOSTS_PER_OUTPUT:
+                entry['hosts'].append(hostname)
+
+    finished = sum(counts[code] for code in CommandJob.FINISHED_STATUSES)
+    return {
+        'id': batch.pk,
+        'group': batch.group.name if batch.group else None,
+        'command': batch.command,
+        'total': batch.total,
+        'finished': finished,
+        'done': finished >= batch.total,
+        'counts': counts,
+        'distinct_outputs': len(outputs),
+        'outputs': sorted(outputs.values(), key=lambda entry: entry['count'], reverse=True)[:BATCH_MAX_OUTPUTS],
+        'hosts': hosts,
+    }
+
+
+def serialize_job(job):
+    return {
+        'id': job.pk,
+        'machine_id': job.machine_id,
+        'kind': job.kind,
+        'command': job.command,
+        'status': job.status,
+        'status_code': job.status_code,
+        'stdout': job.stdout,
+        'stderr': job.stderr,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
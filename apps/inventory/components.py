@@ -0,0 +1,130 @@
+"""
+Tabelas normalizadas de componentes de hardware
+
+Os JSONs memory_modules, network_info e tpm do Machine são espelhados em
+MachineMemoryModule, MachineNetworkAdapter e MachineTpm, que têm índices em
+part number, serial, MAC e gateway. A sincronização só acontece para as
+seções que o check-in realmente alterou.
+"""
+from django.db import transaction
+from .models import MachineMemoryModule, MachineNetworkAdapter, MachineTpm
+
+# Campos do Machine espelhados em tabelas de componentes
+COMPONENT_FIELDS = ('memory_modules', 'network_info', 'tpm')
+
+
+def _as_list(value):
+    """O ConvertTo-Json do PowerShell devolve objeto único quando há um só item"""
+    if not value:
+        return []
+    if isinstance(value, dict):
+        return [value]
+    return [item for item in value if isinstance(item, dict)]
+
+
+def _text(value, max_length):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value[:max_length] or None
+
+
+def _number(value, cast):
+    try:
+        return cast(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _bool(value):
+    return bool(value) if value is not None else None
+
+
+def _first(value, max_length):
+    """Primeiro item de listas "a,b" enviadas pelo agente"""
+    value = _text(value, 255)
+    if not value:
+        return None
+    return _text(value.split(',')[0], max_length)
+
+
+def _memory_rows(machine_id, modules):
+    return [
+        MachineMemoryModule(
+            machine_id=machine_id,
+            bank_label=_text(module.get('bank_label'), 100),
+            device_locator=_text(module.get('device_locator'), 100),
+            capacity_gb=_number(module.get('capacity_gb'), float),
+            speed_mhz=_number(module.get('speed_mhz'), int),
+            manufacturer=_text(module.get('manufacturer'), 100),
+            part_number=_text(module.get('part_number'), 100),
+            serial_number=_text(module.get('serial_number'), 100),
+        )
+        for module in _as_list(modules)
+    ]
+
+
+def _network_rows(machine_id, adapters):
+    return [
+        MachineNetworkAdapter(
+            machine_id=machine_id,
+            name=_text(adapter.get('name'), 200),
+            mac=(_text(adapter.get('mac'), 17) or '').upper() or None,
+            ip=_text(adapter.get('ip'), 255),
+            gateway=_first(adapter.get('gateway'), 45),
+            dns=_text(adapter.get('dns'), 255),
+            dhcp=_bool(adapter.get('dhcp')),
+        )
+        for adapter in _as_list(adapters)
+    ]
+
+
+def _tpm_rows(machine_id, tpm):
+    if not isinstance(tpm, dict):
+        return []
+    return [
+        MachineTpm(
+            machine_id=machine_id,
+            present=_bool(tpm.get('present')),
+            ready=_bool(tpm.get('ready')),
+            enabled=_bool(tpm.get('enabled')),
+            activated=_bool(tpm.get('activated')),
+            spec_version=_text(tpm.get('spec_version'), 100),
+            manufacturer=_text(tpm.get('manufacturer'), 100),
+            manufacturer_ver=_text(tpm.get('manufacturer_ver'), 100),
+        )
+    ]
+
+
+SECTIONS = {
+    'memory_modules': (MachineMemoryModule, _memory_rows),
+    'network_info': (MachineNetworkAdapter, _network_rows),
+    'tpm': (MachineTpm, _tpm_rows),
+}
+
+
+def sync_components(changes):
+    """
+    Regrava os componentes das seções alteradas
+
+    Args:
+        changes (list): Pares (machine, campos_alterados); apenas os campos
+                        em COMPONENT_FIELDS são considerados
+
+    Uma exclusão e um bulk_create por seção, independente do número de máquinas.
+    """
+    for field, (model, build_rows) in SECTIONS.items():
+        machines = [
+            machine for machine, fields in changes
+            if machine.pk is not None and (fields is None or field in fields)
+        ]
+        if not machines:
+            continue
+
+        rows = []
+        for machine in machines:
+            rows.extend(build_rows(machine.pk, getattr(machine, field)))
+
+        with transaction.atomic():
+            model.objects.filter(machine_id__in=[machine.pk for machine in machines]).delete()
+            model.objects.bulk_create(rows, batch_size=500)
@@ -0,0 +1,197 @@
+"""
+Deltas binários entre versões do agente
+
+O arquivo é dividido em trechos terminados em quebra de linha (em binários
+isso funciona como um chunking definido pelo conteúdo) e o difflib encontra
+os trechos comuns. O delta é uma sequência de operações, comprimida com
+zlib:
+
+    'C' + offset (8 bytes) + tamanho (4 bytes)   copia do arquivo antigo
+    'I' + tamanho (4 bytes) + bytes             insere bytes novos
+
+O agente (agents/agent.py) tem a mesma função apply_delta e confere o
+SHA-256 do resultado antes de substituir o arquivo.
+
+Os deltas ficam em AgentVersionDelta e são gerados só entre versões
+consecutivas, em segundo plano após o upload (schedule_delta) ou pelo
+build_agent_deltas. As requisições apenas servem deltas já prontos.
+"""
+import difflib
+import hashlib
+import logging
+import struct
+import threading
+import zlib
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction, close_old_connections
+from .models import AgentVersion, AgentVersionDelta
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'AGD1'
+OP_COPY = b'C'
+OP_INSERT = b'I'
+
+# Deltas maiores que esta fração do arquivo completo não compensam
+DELTA_MAX_RATIO = 0.5
+
+_lock = threading.Lock()
+
+
+def _offsets(chunks):
+    offsets = [0]
+    for chunk in chunks:
+        offsets.append(offsets[-1] + len(chunk))
+    return offsets
+
+
+def make_delta(old, new):
+    """
+    Returns:
+        bytes: Delta comprimido que transforma `old` em `new`
+    """
+    old_chunks = old.splitlines(keepends=True)
+    new_chunks = new.splitlines(keepends=True)
+    old_offsets = _offsets(old_chunks)
+
+    ops = [MAGIC]
+    matcher = difflib.SequenceMatcher(None, old_chunks, new_chunks, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            start = old_offsets[i1]
+            ops.append(OP_COPY + struct.pack('>QI', start, old_offsets[i2] - start))
+        elif j2 > j1:
+            data = b''.join(new_chunks[j1:j2])
+            ops.append(OP_INSERT + struct.pack('>I', len(data)) + data)
+
+    return zlib.compress(b''.join(ops), 9)
+
+
+def apply_delta(old, delta):
+    data = zlib.decompress(delta)
+    if data[:4] != MAGIC:
+        raise ValueError('Delta inválido')
+
+    out = []
+    pos = 4
+    while pos < len(data):
+        op = data[pos:pos + 1]
+        if op == OP_COPY:
+            start, length = struct.unpack_from('>QI', data, pos + 1)
+            out.append(old[start:start + length])
+            pos += 13
+        elif op == OP_INSERT:
+            (length,) = struct.unpack_from('>I', data, pos + 1)
+            out.append(data[pos + 5:pos + 5 + length])
+            pos += 5 + length
+        else:
+            raise ValueError('Operação de delta inválida')
+    return b''.join(out)
+
+
+def _read(field_file):
+    with field_file.open('rb') as f:
+        return f.read()
+
+
+def get_delta(source, target):
+    """
+    Delta de `source` para `target`, gerado e gravado na primeira chamada
+
+    Custo quadrático no pior caso: não chamar no ciclo de uma requisição.
+
+    Returns:
+        AgentVersionDelta ou None se o delta não compensar
+    """
+    existing = AgentVersionDelta.objects.filter(source=source, target=target).first()
+    if existing is not None:
+        return existing if existing.delta_file else None
+
+    with _lock:
+        existing = AgentVersionDelta.objects.filter(source=source, target=target).first()
+        if existing is not None:
+            return existing if existing.delta_file else None
+
+        old = _read(source.file_path)
+        new = _read(target.file_path)
+        delta = make_delta(old, new)
+
+        if apply_delta(old, delta) != new:
+            logger.error(f"Delta {source.version} -> {target.version} não reconstrói o arquivo")
+            return None
+
+        record = AgentVersionDelta(
+            source=source,
+            target=target,
+            size=len(delta),
+            sha256=hashlib.sha256(delta).hexdigest(),
+        )
+        # Delta grande demais: registra sem arquivo para não recalcular
+        if len(delta) <= len(new) * DELTA_MAX_RATIO:
+            record.delta_file.save(
+                f'{source.version}_to_{target.version}.delta', ContentFile(delta), save=False
+            )
+
+        try:
+            record.save()
+        except IntegrityError:
+            return AgentVersionDelta.objects.filter(source=source, target=target).first()
+
+    logger.info(
+        f"Delta {source.version} -> {target.version}: {len(delta)} bytes "
+        f"({len(new)} bytes completo)"
+    )
+    return record if record.delta_file else None
+
+
+def find_delta(source_id, target_id):
+    """
+    Delta já gerado, sem calcular nada
+
+    Returns:
+        AgentVersionDelta com arquivo ou None
+    """
+    return (
+        AgentVersionDelta.objects.filter(source_id=source_id, target_id=target_id)
+        .exclude(delta_file='')
+        .select_related('source', 'target')
+        .first()
+    )
+
+
+def previous_version(version):
+    return (
+        AgentVersion.objects.filter(created_at__lt=version.created_at)
+        .exclude(pk=version.pk)
+        .order_by('-created_at')
+        .first()
+    )
+
+
+def build_delta(version):
+    """Gera o delta da versão anterior para `version`"""
+    previous = previous_version(version)
+    if previous is None or not previous.file_path or not version.file_path:
+        return None
+    return get_delta(previous, version)
+
+
+def _build_in_background(version_id):
+    try:
+        version = AgentVersion.objects.filter(pk=version_id).first()
+        if version is not None:
+            build_delta(version)
+    except Exception:
+        logger.exception(f"Erro ao gerar delta da versão {version_id}")
+    finally:
+        close_old_connections()
+
+
+def schedule_delta(version):
+    """Gera o delta em uma thread após o commit do upload"""
+    transaction.on_commit(lambda: threading.Thread(
+        target=_build_in_background,
+        args=(version.pk,),
+        name=f'agent-delta-{version.pk}',
+        daemon=True,
+    ).start())
@@ -154,6 +154,38 @@ class BulkNotificationForm(forms.Form):
     )
 
 
+class NotificationBroadcastForm(BulkNotificationForm):
+    '''Form para enviar uma notificação a um grupo ou a toda a frota'''
+
+    # O destino é o grupo (ou a frota), não uma lista de máquinas
+    machines = None
+
+    group = forms.ModelChoiceField(
+        queryset=MachineGroup.objects.all(),
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+        label='Grupo',
+        help_text='Deixe em branco para enviar a todas as máquinas'
+    )
+
+    only_online = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        label='Somente máquinas online'
+    )
+
+    field_order = ['group', 'only_online', 'title', 'message', 'type', 'priority', 'expires_at']
+
+    def get_machines(self):
+        """Queryset das máquinas de destino"""
+        machines = Machine.objects.all()
+        if self.cleaned_data.get('group'):
+            machines = machines.filter(group=self.cleaned_data['group'])
+        if self.cleaned_data.get('only_online'):
+            machines = machines.filter(is_online=True)
+        return machines
+
+
 class AgentTokenGenerateForm(forms.Form):
     """Formulário para geração de tokens"""
 
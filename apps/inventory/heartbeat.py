@@ -0,0 +1,196 @@
+"""
+Buffer de heartbeats das máquinas
+
+Check-ins que não alteram nenhum dado de inventário só precisam atualizar
+last_seen/is_online. Em vez de um UPDATE por requisição, o timestamp fica em
+memória e é gravado em lote a cada INVENTORY_HEARTBEAT_FLUSH_INTERVAL segundos
+com um único UPDATE (sem passar pelo pre_save verificar_status_maquina).
+
+A resposta do check-in também traz o intervalo sugerido ao agente
+(checkin_load.interval_hint): acima da taxa alvo de check-ins o intervalo é
+esticado proporcionalmente, sem passar de um terço do timeout de offline.
+A taxa é medida em cada processo, como o buffer acima: com N workers atrás
+do balanceador, cada um vê cerca de 1/N dos check-ins, então
+INVENTORY_CHECKIN_TARGET_RATE deve ser a capacidade total dividida por N.
+"""
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Case, When, Value, DateTimeField
+from django.utils import timezone
+from .models import Machine
+from .signals import MACHINE_OFFLINE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (segundos) entre gravações do buffer
+HEARTBEAT_FLUSH_INTERVAL = getattr(settings, 'INVENTORY_HEARTBEAT_FLUSH_INTERVAL', 5)
+
+# Quantidade de máquinas pendentes que força uma gravação imediata
+HEARTBEAT_MAX_PENDING = getattr(settings, 'INVENTORY_HEARTBEAT_MAX_PENDING', 5000)
+
+# Máquinas por UPDATE (limita o número de parâmetros no SQLite)
+HEARTBEAT_CHUNK_SIZE = 400
+
+# Intervalo de check-in sugerido aos agentes (segundos)
+CHECKIN_INTERVAL = getattr(settings, 'INVENTORY_CHECKIN_INTERVAL', 60)
+
+# Check-ins por segundo POR PROCESSO acima dos quais o intervalo é esticado
+# (capacidade total do servidor dividida pelo número de workers)
+CHECKIN_TARGET_RATE = getattr(settings, 'INVENTORY_CHECKIN_TARGET_RATE', 20)
+
+# Teto do intervalo: três check-ins perdidos antes de a máquina ficar offline
+CHECKIN_MAX_INTERVAL = getattr(settings, 'INVENTORY_CHECKIN_MAX_INTERVAL', MACHINE_OFFLINE_TIMEOUT * 60 // 3)
+
+# Janela (segundos) da medição da taxa
+CHECKIN_RATE_WINDOW = 10
+
+
+class HeartbeatBuffer:
+    """Acumula (machine_id, timestamp) e grava em lote"""
+
+    def __init__(self, flush_interval=HEARTBEAT_FLUSH_INTERVAL, max_pending=HEARTBEAT_MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def record(self, machine_id, timestamp=None):
+        """Registra um heartbeat; apenas o mais recente de cada máquina é mantido"""
+        with self._lock:
+            self._pending[machine_id] = timestamp or timezone.now()
+            size = len(self._pending)
+
+        self._ensure_worker()
+
+        if size >= self.max_pending:
+            self.flush()
+
+    def discard(self, machine_id):
+        """Remove heartbeat pendente (a máquina foi gravada diretamente)"""
+        with self._lock:
+            self._pending.pop(machine_id, None)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Grava os heartbeats pendentes
+
+        Returns:
+            int: Número de máquinas atualizadas
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        updated = 0
+
+        try:
+            with transaction.atomic():
+                for i in range(0, len(items), HEARTBEAT_CHUNK_SIZE):
+                    chunk = items[i:i + HEARTBEAT_CHUNK_SIZE]
+                    updated += Machine.objects.filter(
+                        pk__in=[pk for pk, _ in chunk]
+                    ).update(
+                        is_online=True,
+                        last_seen=Case(
+                            *[When(pk=pk, then=Value(ts)) for pk, ts in chunk],
+                            output_field=DateTimeField(),
+                        ),
+                    )
+        except Exception:
+            logger.exception("Erro ao gravar heartbeats; reenfileirando")
+            with self._lock:
+                for pk, ts in items:
+                    current = self._pending.get(pk)
+                    if current is None or current < ts:
+                        self._pending[pk] = ts
+            return 0
+
+        logger.debug(f"Heartbeats gravados: {updated}")
+        return updated
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run,
+                name='inventory-heartbeat-flush',
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+heartbeat_buffer = HeartbeatBuffer()
+
+
+class CheckinLoad:
+    """
+    Taxa de check-ins deste processo em janelas fixas e o intervalo sugerido
+
+    Sem estado compartilhado entre workers: target_rate é por processo.
+    """
+
+    def __init__(self, base=CHECKIN_INTERVAL, target_rate=CHECKIN_TARGET_RATE,
+                 max_interval=CHECKIN_MAX_INTERVAL, window=CHECKIN_RATE_WINDOW):
+        self.base = base
+        self.target_rate = target_rate
+        self.max_interval = max(max_interval, base)
+        self.window = window
+        self._lock = threading.Lock()
+        self._current = None
+        self._count = 0
+        self._last_rate = 0.0
+
+    def record(self, count=1):
+        window = int(time.time() // self.window)
+        with self._lock:
+            if window != self._current:
+                # Janela anterior encerrada vira a taxa de referência
+                if self._current is not None:
+                    elapsed = window - self._current
+                    self._last_rate = self._count / self.window if elapsed == 1 else 0.0
+                self._current = window
+                self._count = 0
+            self._count += count
+
+    def rate(self):
+        with self._lock:
+            return self._last_rate
+
+    def interval_hint(self):
+        """
+        Returns:
+            int: Segundos até o próximo check-in sugerido ao agente
+        """
+        rate = self.rate()
+        if not self.target_rate or rate <= self.target_rate:
+            return self.base
+        return min(self.max_interval, int(self.base * rate / self.target_rate))
+
+
+checkin_load = CheckinLoad()
+
+atexit.register(heartbeat_buffer.flush)
@@ -0,0 +1,63 @@
+"""
+Journal de alterações das máquinas
+
+O check-in já calcula quais colunas mudaram (checkin._changed_fields), e um
+heartbeat com hash igual não compara nada. O journal reaproveita esse
+conjunto: só quando um campo rastreado aparece nele é gravado um
+MachineChange com o valor anterior e o novo. Check-ins sem mudança não
+custam nenhuma consulta extra.
+"""
+from .models import MachineChange
+
+# Campo do Machine -> seção do journal (campos voláteis ficam de fora)
+JOURNAL_SECTIONS = {
+    'manufacturer': 'hardware',
+    'model': 'hardware',
+    'serial_number': 'hardware',
+    'bios_version': 'hardware',
+    'cpu': 'hardware',
+    'disk_space_gb': 'hardware',
+    'ram_gb': 'memory',
+    'total_memory_slots': 'memory',
+    'populated_memory_slots': 'memory',
+    'memory_modules': 'memory',
+    'os_caption': 'os',
+    'os_architecture': 'os',
+    'os_build': 'os',
+    'install_date': 'os',
+    'mac_address': 'network',
+    'network_info': 'network',
+    'gpu_name': 'gpu',
+    'gpu_driver': 'gpu',
+    'antivirus_name': 'security',
+    'av_state': 'security',
+    'tpm': 'security',
+}
+
+
+def build_changes(machine_id, old_values, new_values, now):
+    """
+    Monta (sem gravar) os MachineChange dos campos rastreados que mudaram
+
+    Args:
+        old_values (dict): Valores anteriores dos campos alterados
+        new_values (dict): Valores novos dos campos alterados
+    """
+    return [
+        MachineChange(
+            machine_id=machine_id,
+            section=JOURNAL_SECTIONS[field],
+            field=field,
+            old_value=old_values.get(field),
+            new_value=value,
+            changed_at=now,
+        )
+        for field, value in new_values.items()
+        if field in JOURNAL_SECTIONS
+    ]
+
+
+def record_changes(changes):
+    if changes:
+        MachineChange.objects.bulk_create(changes, batch_size=500)
+    return len(changes)
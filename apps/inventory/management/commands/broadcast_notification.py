@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.inventory.models import Machine, MachineGroup, Notification
+from apps.inventory.broadcast import broadcast_notification
+
+
+class Command(BaseCommand):
+    help = 'Envia uma notificação para um grupo de máquinas ou para toda a frota'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--title', required=True, help='Título da notificação')
+        parser.add_argument('--message', required=True, help='Mensagem da notificação')
+        parser.add_argument(
+            '--group',
+            help='ID ou nome do grupo de máquinas (padrão: toda a frota)'
+        )
+        parser.add_argument(
+            '--online',
+            action='store_true',
+            help='Somente máquinas online'
+        )
+        parser.add_argument(
+            '--type',
+            default='info',
+            choices=[choice for choice, _ in Notification.TYPE_CHOICES]
+        )
+        parser.add_argument(
+            '--priority',
+            default='normal',
+            choices=[choice for choice, _ in Notification.PRIORITY_CHOICES]
+        )
+
+    def handle(self, *args, **options):
+        machines = Machine.objects.all()
+
+        if options['group']:
+            group_ref = options['group']
+            if group_ref.isdigit():
+                group = MachineGroup.objects.filter(pk=int(group_ref)).first()
+            else:
+                group = MachineGroup.objects.filter(name=group_ref).first()
+            if group is None:
+                raise CommandError(f'Grupo {group_ref} não encontrado')
+            machines = machines.filter(group=group)
+
+        if options['online']:
+            machines = machines.filter(is_online=True)
+
+        def progress(created, total):
+            self.stdout.write(f'{created}/{total} notificações criadas')
+
+        created = broadcast_notification(
+            machines,
+            title=options['title'],
+            message=options['message'],
+            type=options['type'],
+            priority=options['priority'],
+            progress=progress,
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'{created} notificações enviadas'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.delta import build_delta
+from apps.inventory.models import AgentVersion
+
+
+class Command(BaseCommand):
+    help = 'Gera os deltas entre versões consecutivas do agente que ainda não existem'
+
+    def handle(self, *args, **options):
+        total = 0
+        for version in AgentVersion.objects.order_by('created_at'):
+            delta = build_delta(version)
+            if delta is not None and delta.delta_file:
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f'{total} deltas disponíveis'))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.inventory.signals import MACHINE_OFFLINE_TIMEOUT
+from apps.inventory.tasks import check_machines_status
+
+
+class Command(BaseCommand):
+    help = 'Marca como offline as máquinas que pararam de fazer check-in'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=MACHINE_OFFLINE_TIMEOUT,
+            help='Minutos sem check-in para considerar a máquina offline'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Repetir a cada N segundos (0 = executar uma vez)'
+        )
+
+    def handle(self, *args, **options):
+        timeout = options['timeout']
+        interval = options['interval']
+
+        while True:
+            updated = check_machines_status(timeout)
+            self.stdout.write(f'{updated} máquinas marcadas como offline')
+
+            if interval <= 0:
+                break
+
+            close_old_connections()
+            time.sleep(interval)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.search import rebuild_index, create_index
+
+
+class Command(BaseCommand):
+    help = 'Recria o índice de busca (FTS5) das máquinas'
+
+    def handle(self, *args, **options):
+        if not create_index():
+            self.stdout.write(self.style.WARNING(
+                'Banco sem suporte a FTS5/trigram; a busca usa icontains e não precisa de índice'
+            ))
+            return
+
+        total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'{total} máquinas indexadas'))
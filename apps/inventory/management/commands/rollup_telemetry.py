@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.telemetry import rollup_telemetry
+
+
+class Command(BaseCommand):
+    help = (
+        'Consolida a telemetria das máquinas (bruto -> hora -> dia) e remove '
+        'dados fora da retenção. Execute ao menos uma vez por hora.'
+    )
+
+    def handle(self, *args, **options):
+        result = rollup_telemetry()
+
+        for key, value in result.items():
+            self.stdout.write(f'{key}: {value}')
+
+        self.stdout.write(self.style.SUCCESS('Telemetria consolidada'))
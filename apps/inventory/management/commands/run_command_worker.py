@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.inventory.commands import command_queue, COMMAND_PER_TARGET
+
+
+class Command(BaseCommand):
+    help = 'Executa os comandos remotos (CommandJob) enfileirados pelo servidor web'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Comandos executados em paralelo'
+        )
+        parser.add_argument(
+            '--per-target',
+            type=int,
+            default=COMMAND_PER_TARGET,
+            help='Comandos simultâneos na mesma máquina'
+        )
+        parser.add_argument(
+            '--poll',
+            type=int,
+            default=2,
+            help='Segundos entre consultas por novos jobs'
+        )
+
+    def handle(self, *args, **options):
+        command_queue.per_target = options['per_target']
+        command_queue.start(workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f"{options['workers']} workers iniciados"))
+
+        try:
+            while True:
+                command_queue.recover()
+                close_old_connections()
+                time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            command_queue.stop()
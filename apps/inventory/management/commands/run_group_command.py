@@ -0,0 +1,58 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.inventory.commands import CommandQueue, FakeTransport, fan_out, aggregate_batch, command_queue
+from apps.inventory.models import MachineGroup
+
+
+class Command(BaseCommand):
+    help = 'Executa um comando em todas as máquinas de um grupo e mostra o resumo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('group', help='Nome ou id do grupo')
+        parser.add_argument('command', help='Comando PowerShell')
+        parser.add_argument('--workers', type=int, default=16, help='Máquinas em paralelo')
+        parser.add_argument('--timeout', type=int, default=None, help='Timeout por máquina (s)')
+        parser.add_argument('--only-online', action='store_true', help='Apenas máquinas online')
+        parser.add_argument(
+            '--fake',
+            action='store_true',
+            help='Usa o transporte local (não conecta nas máquinas)'
+        )
+
+    def handle(self, *args, **options):
+        group_ref = options['group']
+        if group_ref.isdigit():
+            group = MachineGroup.objects.filter(pk=int(group_ref)).first()
+        else:
+            group = MachineGroup.objects.filter(name=group_ref).first()
+        if group is None:
+            raise CommandError(f'Grupo não encontrado: {group_ref}')
+
+        queue = CommandQueue(
+            workers=options['workers'],
+            transport=FakeTransport() if options['fake'] else command_queue.transport,
+            recover_on_start=False,
+            # Jobs próprios: o run_command_worker e a fila do processo web não os pegam
+            private=options['fake'],
+        )
+        batch = fan_out(
+            group,
+            options['command'],
+            timeout=options['timeout'],
+            only_online=options['only_online'],
+            queue=queue,
+        )
+        self.stdout.write(f'{batch.total} máquinas no lote {batch.pk}')
+
+        summary = aggregate_batch(batch)
+        while not summary['done']:
+            time.sleep(1)
+            summary = aggregate_batch(batch)
+            self.stdout.write(f"{summary['finished']}/{summary['total']} concluídas")
+
+        queue.stop()
+        summary.pop('hosts')
+        self.stdout.write(json.dumps(summary, indent=2, ensure_ascii=False))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from apps.inventory.models import Machine
+from apps.inventory.components import sync_components, COMPONENT_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Preenche as tabelas de componentes (memória, rede, TPM) a partir dos JSONs do Machine'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Máquinas processadas por lote'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        machines = Machine.objects.only('pk', *COMPONENT_FIELDS).order_by('pk')
+
+        chunk = []
+        total = 0
+        for machine in machines.iterator(chunk_size=chunk_size):
+            chunk.append((machine, None))
+            if len(chunk) >= chunk_size:
+                sync_components(chunk)
+                total += len(chunk)
+                chunk = []
+                self.stdout.write(f'{total} máquinas sincronizadas')
+
+        if chunk:
+            sync_components(chunk)
+            total += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} máquinas sincronizadas'))
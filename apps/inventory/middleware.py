@@ -0,0 +1,78 @@
+import io
+import zlib
+import logging
+from django.conf import settings
+from django.http import JsonResponse
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Prefixo das rotas usadas pelo agente
+AGENT_API_PREFIX = getattr(settings, 'INVENTORY_AGENT_API_PREFIX', '/api/')
+
+# Tamanho máximo (bytes) do corpo depois de descompactado
+MAX_DECOMPRESSED_BODY = getattr(settings, 'INVENTORY_MAX_DECOMPRESSED_BODY', 10 * 1024 * 1024)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _gunzip(data, limit):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    result = decompressor.decompress(data, limit + 1)
+    if len(result) > limit or decompressor.unconsumed_tail:
+        raise BodyTooLarge()
+    return result
+
+
+def _unzstd(data, limit):
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+    result = reader.read(limit + 1)
+    if len(result) > limit:
+        raise BodyTooLarge()
+    return result
+
+
+class CompressedRequestMiddleware:
+    """
+    Descompacta corpos de requisição com Content-Encoding gzip (ou zstd,
+    se o pacote zstandard estiver instalado) nas rotas do agente
+
+    O corpo descompactado substitui request.body/stream, então as views
+    (Django e DRF) não precisam saber que o payload veio compactado.
+    O tamanho final é limitado por INVENTORY_MAX_DECOMPRESSED_BODY.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+
+        if encoding and encoding != 'identity' and request.path.startswith(AGENT_API_PREFIX):
+            if encoding in ('gzip', 'x-gzip'):
+                decompress = _gunzip
+            elif encoding == 'zstd' and zstandard is not None:
+                decompress = _unzstd
+            else:
+                return JsonResponse({'error': f'Content-Encoding não suportado: {encoding}'}, status=415)
+
+            try:
+                body = decompress(request.body, MAX_DECOMPRESSED_BODY)
+            except BodyTooLarge:
+                return JsonResponse({'error': 'Corpo da requisição muito grande'}, status=413)
+            except Exception as e:
+                logger.warning(f"Erro ao descompactar requisição {request.path}: {e}")
+                return JsonResponse({'error': 'Corpo compactado inválido'}, status=400)
+
+            request._body = body
+            request._stream = io.BytesIO(body)
+            request.META['CONTENT_LENGTH'] = str(len(body))
+            del request.META['HTTP_CONTENT_ENCODING']
+
+        return self.get_response(request)
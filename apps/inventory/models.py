@@ -1,5 +1,6 @@
 from django.utils import timezone
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.conf import settings
 import secrets
 import string
@@ -55,6 +56,9 @@ class Machine(models.Model):
     antivirus_name  = models.CharField("Antivírus", max_length=200, null=True, blank=True)
     av_state        = models.CharField("Estado AV", max_length=50, null=True, blank=True)
 
+    # Hash do último inventário recebido (check-in incremental)
+    inventory_hash  = models.CharField("Hash do Inventário", max_length=64, null=True, blank=True)
+
     last_seen = models.DateTimeField("Última Conexão", auto_now=True)
     is_online = models.BooleanField("Online", default=False)
     group     = models.ForeignKey(MachineGroup, on_delete=models.SET_NULL, null=True, blank=True)
@@ -82,6 +86,194 @@ class BlockedSite(models.Model):
         return f"{self.url} → {target}"
 
 
+class MachinePolicy(models.Model):
+    """
+    Política materializada de sites bloqueados de uma máquina
+
+    Reconstruída pelos signals de BlockedSite/Machine/MachineGroup (policy.py)
+    e servida ao agente com ETag = version.
+    """
+    machine = models.OneToOneField(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name='policy',
+        verbose_name="Máquina"
+    )
+    blocked_urls = models.JSONField("URLs Bloqueadas", default=list)
+    version = models.CharField("Versão", max_length=64)
+    updated_at = models.DateTimeField("Atualizada em", auto_now=True)
+
+    class Meta:
+        verbose_name = "Política da Máquina"
+        verbose_name_plural = "Políticas das Máquinas"
+
+    def __str__(self):
+        return f"{self.machine} ({len(self.blocked_urls)} sites)"
+
+
+class MachineMemoryModule(models.Model):
+    """Módulo de memória da máquina (normalizado de Machine.memory_modules)"""
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name='memory_module_set',
+        verbose_name="Máquina"
+    )
+    bank_label = models.CharField("Banco", max_length=100, null=True, blank=True)
+    device_locator = models.CharField("Slot", max_length=100, null=True, blank=True)
+    capacity_gb = models.FloatField("Capacidade (GB)", null=True, blank=True)
+    speed_mhz = models.IntegerField("Velocidade (MHz)", null=True, blank=True)
+    manufacturer = models.CharField("Fabricante", max_length=100, null=True, blank=True)
+    part_number = models.CharField("Part Number", max_length=100, null=True, blank=True, db_index=True)
+    serial_number = models.CharField("Serial", max_length=100, null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Módulo de Memória"
+        verbose_name_plural = "Módulos de Memória"
+
+    def __str__(self):
+        return f"{self.machine_id} {self.device_locator} {self.capacity_gb}GB"
+
+
+class MachineNetworkAdapter(models.Model):
+    """Adaptador de rede da máquina (normalizado de Machine.network_info)"""
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name='network_adapter_set',
+        verbose_name="Máquina"
+    )
+    name = models.CharField("Nome", max_length=200, null=True, blank=True)
+    mac = models.CharField("MAC Address", max_length=17, null=True, blank=True, db_index=True)
+    ip = models.CharField("IPs", max_length=255, null=True, blank=True)
+    gateway = models.CharField("Gateway", max_length=45, null=True, blank=True, db_index=True)
+    dns = models.CharField("DNS", max_length=255, null=True, blank=True)
+    dhcp = models.BooleanField("DHCP", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Adaptador de Rede"
+        verbose_name_plural = "Adaptadores de Rede"
+
+    def __str__(self):
+        return f"{self.machine_id} {self.mac}"
+
+
+class MachineTpm(models.Model):
+    """TPM da máquina (normalizado de Machine.tpm)"""
+    machine = models.OneToOneField(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name='tpm_info',
+        verbose_name="Máquina"
+    )
+    present = models.BooleanField("Presente", null=True, blank=True)
+    ready = models.BooleanField("Pronto", null=True, blank=True)
+    enabled = models.BooleanField("Habilitado", null=True, blank=True)
+    activated = models.BooleanField("Ativado", null=True, blank=True)
+    spec_version = models.CharField("Versão da Especificação", max_length=100, null=True, blank=True, db_index=True)
+    manufacturer = models.CharField("Fabricante", max_length=100, null=True, blank=True)
+    manufacturer_ver = models.CharField("Versão do Fabricante", max_length=100, null=True, blank=True)
+
+    class Meta:
+        verbose_name = "TPM"
+        verbose_name_plural = "TPMs"
+
+    def __str__(self):
+        return f"{self.machine_id} TPM {self.spec_version}"
+
+
+class MachineChange(models.Model):
+    """
+    Histórico de alterações de hardware/software detectadas no check-in
+
+    Uma linha por campo alterado, com valor anterior e novo (journal.py).
+    Métricas voláteis (uptime, disco livre, usuário logado) não entram.
+    """
+
+    SECTION_CHOICES = [
+        ('hardware', 'Hardware'),
+        ('memory', 'Memória'),
+        ('os', 'Sistema Operacional'),
+        ('network', 'Rede'),
+        ('gpu', 'Vídeo'),
+        ('security', 'Segurança'),
+    ]
+
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name='changes',
+        verbose_name="Máquina"
+    )
+    section = models.CharField("Seção", max_length=20, choices=SECTION_CHOICES)
+    field = models.CharField("Campo", max_length=50)
+    old_value = models.JSONField("Valor Anterior", null=True, blank=True, encoder=DjangoJSONEncoder)
+    new_value = models.JSONField("Valor Novo", null=True, blank=True, encoder=DjangoJSONEncoder)
+    changed_at = models.DateTimeField("Alterado em", default=timezone.now)
+
+    class Meta:
+        ordering = ['-changed_at']
+        verbose_name = "Alteração da Máquina"
+        verbose_name_plural = "Alterações das Máquinas"
+        indexes = [
+            models.Index(fields=['machine', '-changed_at'], name='inventory_change_machine'),
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id} {self.field}: {self.old_value} -> {self.new_value}"
+
+
+class MachineTelemetry(models.Model):
+    """
+    Série temporal compacta de métricas da máquina
+
+    Amostras brutas são gravadas a partir do check-in (telemetry.py) e
+    consolidadas em médias por hora e por dia pelo comando rollup_telemetry,
+    que também remove os dados antigos de cada resolução.
+    """
+
+    RESOLUTION_RAW = 'raw'
+    RESOLUTION_HOUR = 'hour'
+    RESOLUTION_DAY = 'day'
+
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_RAW, 'Bruto'),
+        (RESOLUTION_HOUR, 'Hora'),
+        (RESOLUTION_DAY, 'Dia'),
+    ]
+
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name='telemetry',
+        verbose_name="Máquina"
+    )
+    resolution = models.CharField("Resolução", max_length=4, choices=RESOLUTION_CHOICES, default=RESOLUTION_RAW)
+    timestamp = models.DateTimeField("Momento")
+    samples = models.PositiveIntegerField("Amostras", default=1)
+
+    disk_free_gb = models.FloatField("Disco Livre (GB)", null=True, blank=True)
+    disk_free_min_gb = models.FloatField("Disco Livre Mínimo (GB)", null=True, blank=True)
+    uptime_days = models.FloatField("Uptime (dias)", null=True, blank=True)
+    ram_gb = models.FloatField("RAM (GB)", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Telemetria da Máquina"
+        verbose_name_plural = "Telemetria das Máquinas"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['machine', 'resolution', 'timestamp'],
+                name='inventory_telemetry_unique_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'timestamp'], name='inventory_telemetry_res_ts'),
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id} {self.resolution} {self.timestamp:%Y-%m-%d %H:%M}"
+
+
 class Notification(models.Model):
     """
     Notificação para ser exibida no agente da máquina cliente
@@ -390,11 +582,48 @@ class AgentVersion(models.Model):
         verbose_name="Arquivo"
     )
     release_notes = models.TextField(verbose_name="Notas de Lançamento")
+
+    # Calculados uma vez no upload (apps/inventory/artifacts.py)
+    sha256 = models.CharField("SHA-256", max_length=64, null=True, blank=True, editable=False)
+    file_size = models.BigIntegerField("Tamanho (bytes)", null=True, blank=True, editable=False)
+    gzip_file = models.FileField(
+        upload_to='agent_versions/',
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Arquivo (gzip)"
+    )
+
     is_active = models.BooleanField(default=True, verbose_name="Ativo")
     is_mandatory = models.BooleanField(
         default=False,
         verbose_name="Atualização Obrigatória"
     )
+
+    # Rollout gradual (apps/inventory/rollout.py)
+    rollout_percentage = models.PositiveSmallIntegerField(
+        default=100,
+        verbose_name="Rollout (%)",
+        help_text="Percentual da frota que recebe a versão; aumente em ondas"
+    )
+    rollout_groups = models.ManyToManyField(
+        MachineGroup,
+        blank=True,
+        related_name='canary_versions',
+        verbose_name="Grupos canário",
+        help_text="Grupos que recebem a versão independente do percentual"
+    )
+    rollout_slots_per_minute = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Downloads por minuto",
+        help_text="Limite de máquinas liberadas por minuto (vazio = sem limite)"
+    )
+    rollout_halted = models.BooleanField(
+        default=False,
+        verbose_name="Rollout interrompido"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -413,8 +642,158 @@ class AgentVersion(models.Model):
 
     def get_status_display(self):
         """Retorna o status da versão para exibição"""
+        if self.is_active and self.rollout_halted:
+            return {'text': 'Rollout interrompido', 'class': 'danger'}
         if self.is_active:
             if self.is_mandatory:
                 return {'text': 'Ativa (Obrigatória)', 'class': 'danger'}
             return {'text': 'Ativa', 'class': 'success'}
-        return {'text': 'Inativa', 'class': 'secondary'}
\ No newline at end of file
+        return {'text': 'Inativa', 'class': 'secondary'}
+
+
+class AgentVersionDelta(models.Model):
+    """Delta binário entre dois artefatos do agente (apps/inventory/delta.py)"""
+
+    source = models.ForeignKey(
+        AgentVersion,
+        on_delete=models.CASCADE,
+        related_name='deltas_from',
+        verbose_name="Versão de origem"
+    )
+    target = models.ForeignKey(
+        AgentVersion,
+        on_delete=models.CASCADE,
+        related_name='deltas_to',
+        verbose_name="Versão de destino"
+    )
+    delta_file = models.FileField(
+        upload_to='agent_versions/deltas/',
+        null=True,
+        blank=True,
+        verbose_name="Arquivo"
+    )
+    size = models.BigIntegerField("Tamanho (bytes)")
+    sha256 = models.CharField("SHA-256", max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Criado em")
+
+    class Meta:
+        unique_together = ('source', 'target')
+        verbose_name = "Delta de Versão"
+        verbose_name_plural = "Deltas de Versão"
+
+    def __str__(self):
+        return f"{self.source.version} → {self.target.version}"
+
+
+class CommandBatch(models.Model):
+    """Mesmo comando enviado a todas as máquinas de um grupo"""
+
+    group = models.ForeignKey(
+        MachineGroup,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='command_batches',
+        verbose_name="Grupo"
+    )
+    kind = models.CharField("Tipo", max_length=20, default='powershell')
+    command = models.TextField("Comando")
+    total = models.PositiveIntegerField("Máquinas", default=0)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Criado por"
+    )
+    created_at = models.DateTimeField("Criado em", auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Comando em Grupo"
+        verbose_name_plural = "Comandos em Grupo"
+
+    def __str__(self):
+        return f"{self.group or '-'} - {self.command[:50]}"
+
+
+class CommandJob(models.Model):
+    """
+    Comando remoto (WinRM) executado em segundo plano (apps/inventory/commands.py)
+
+    A requisição só cria o job; o pool de workers executa e grava a saída.
+    """
+
+    KIND_POWERSHELL = 'powershell'
+    KIND_CMD = 'cmd'
+    KIND_CHOICES = [
+        (KIND_POWERSHELL, 'PowerShell'),
+        (KIND_CMD, 'CMD'),
+    ]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_TIMEOUT = 'timeout'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Na fila'),
+        (STATUS_RUNNING, 'Executando'),
+        (STATUS_SUCCEEDED, 'Concluído'),
+        (STATUS_FAILED, 'Falhou'),
+        (STATUS_TIMEOUT, 'Tempo esgotado'),
+    ]
+    FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_TIMEOUT)
+
+    machine = models.ForeignKey(
+        Machine,
+        on_delete=models.CASCADE,
+        related_name='command_jobs',
+        verbose_name="Máquina"
+    )
+    batch = models.ForeignKey(
+        CommandBatch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        verbose_name="Lote"
+    )
+    kind = models.CharField("Tipo", max_length=20, choices=KIND_CHOICES, default=KIND_POWERSHELL)
+    command = models.TextField("Comando")
+    arguments = models.JSONField("Argumentos", default=list, blank=True)
+    timeout_seconds = models.PositiveIntegerField("Timeout (s)", default=120)
+    # Fila que pode executar o job ('' = fila compartilhada; ver CommandQueue.owner)
+    owner = models.CharField("Fila", max_length=64, blank=True, default='', db_index=True)
+
+    status = models.CharField("Status", max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    status_code = models.IntegerField("Código de saída", null=True, blank=True)
+    stdout = models.TextField("Saída", blank=True)
+    stderr = models.TextField("Erros", blank=True)
+    error = models.TextField("Falha", blank=True)
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Criado por"
+    )
+    created_at = models.DateTimeField("Criado em", auto_now_add=True)
+    started_at = models.DateTimeField("Iniciado em", null=True, blank=True)
+    finished_at = models.DateTimeField("Finalizado em", null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        verbose_name = "Comando Remoto"
+        verbose_name_plural = "Comandos Remotos"
+
+    def __str__(self):
+        return f"{self.machine} - {self.command[:50]} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
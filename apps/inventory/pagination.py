@@ -0,0 +1,145 @@
+"""
+Paginação por cursor (keyset) para as listagens do inventário
+
+Em vez de OFFSET, cada página guarda o valor da coluna de ordenação e o id
+do último item, e a página seguinte filtra a partir dele. A consulta usa o
+índice da ordenação e custa o mesmo na primeira ou na milésima página, sem
+COUNT(*) da tabela inteira.
+
+O cursor vai na query string (?after=... ou ?before=...) codificado em
+base64; os demais parâmetros (filtros) são preservados nos links.
+"""
+import base64
+import datetime
+import json
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class KeysetPage:
+    """Página de resultados com os links de navegação por cursor"""
+
+    def __init__(self, object_list, has_next, has_previous, next_query, previous_query):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_query = next_query
+        self.previous_query = previous_query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Datas com microssegundos: o DjangoJSONEncoder corta em milissegundos"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value, pk], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """
+    Returns:
+        tuple: (valor, pk) ou None se o cursor for inválido
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if value is not None and field is not None:
+            value = field.to_python(value)
+        return value, int(pk)
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+class KeysetPaginationMixin:
+    """
+    Substitui a paginação por OFFSET do ListView
+
+    Atributos:
+        keyset_ordering: Coluna de ordenação (ex.: '-last_seen'); o id é
+                         usado como desempate na mesma direção
+    """
+    keyset_ordering = '-id'
+
+    def get_keyset_ordering(self):
+        """None desativa o cursor (ex.: busca ordenada por relevância)"""
+        return self.keyset_ordering
+
+    def _query_with(self, key, value):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params.pop('page', None)
+        params[key] = value
+        return params.urlencode()
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        if not ordering:
+            # Resultado já limitado (ex.: busca): paginação comum, mesmos links
+            paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+            page.next_query = self._query_with('page', page.next_page_number()) if page.has_next() else ''
+            page.previous_query = (
+                self._query_with('page', page.previous_page_number()) if page.has_previous() else ''
+            )
+            return paginator, page, object_list, is_paginated
+
+        descending = ordering.startswith('-')
+        name = ordering.lstrip('-')
+        field = None if name in ('id', 'pk') else queryset.model._meta.get_field(name)
+
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        cursor = decode_cursor(after or before, field) if (after or before) else None
+        backwards = cursor is not None and not after
+
+        # Ao voltar, percorre na direção inversa e reverte o resultado
+        desc = descending != backwards
+        lookup = 'lt' if desc else 'gt'
+        if field is None:
+            order_by = ['-pk' if desc else 'pk']
+        else:
+            order_by = [f'-{name}' if desc else name, '-pk' if desc else 'pk']
+
+        queryset = queryset.order_by(*order_by)
+        if cursor is not None:
+            value, pk = cursor
+            if field is None:
+                queryset = queryset.filter(**{f'pk__{lookup}': pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{name}__{lookup}': value}) | Q(**{name: value, f'pk__{lookup}': pk})
+                )
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+
+        has_next = has_more if not backwards else True
+        has_previous = cursor is not None and (has_more if backwards else True)
+
+        def key(obj):
+            return encode_cursor(getattr(obj, name) if field is not None else None, obj.pk)
+
+        page = KeysetPage(
+            rows,
+            has_next=bool(rows) and has_next,
+            has_previous=bool(rows) and has_previous,
+            next_query=self._query_with('after', key(rows[-1])) if rows else '',
+            previous_query=self._query_with('before', key(rows[0])) if rows else '',
+        )
+        return (None, page, rows, page.has_next or page.has_previous)
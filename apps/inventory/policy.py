@@ -0,0 +1,116 @@
+"""
+Política de sites bloqueados por máquina
+
+A lista de URLs de cada máquina (sites diretos + sites do grupo) fica
+materializada em MachinePolicy junto com um hash de versão. Os signals
+reconstroem apenas as máquinas afetadas quando BlockedSite, o grupo da
+máquina ou o próprio MachineGroup mudam; o GET do check-in só lê a linha
+pronta e responde 304 quando o ETag do agente ainda é o atual.
+"""
+import hashlib
+from django.utils import timezone
+from .models import Machine, BlockedSite, MachinePolicy
+
+# Máquinas por consulta/gravação (limite de parâmetros do SQLite)
+POLICY_CHUNK_SIZE = 500
+
+
+def policy_version(urls):
+    """Hash estável de uma lista ordenada de URLs"""
+    return hashlib.sha256('\n'.join(urls).encode('utf-8')).hexdigest()
+
+
+def _rebuild_chunk(machine_ids):
+    machines = dict(Machine.objects.filter(pk__in=machine_ids).values_list('pk', 'group_id'))
+    if not machines:
+        return 0
+
+    urls_by_machine = {pk: set() for pk in machines}
+
+    for machine_id, url in BlockedSite.objects.filter(
+        machine_id__in=list(machines)
+    ).values_list('machine_id', 'url'):
+        urls_by_machine[machine_id].add(url)
+
+    group_ids = {group_id for group_id in machines.values() if group_id}
+    urls_by_group = {}
+    if group_ids:
+        for group_id, url in BlockedSite.objects.filter(
+            group_id__in=group_ids
+        ).values_list('group_id', 'url'):
+            urls_by_group.setdefault(group_id, set()).add(url)
+
+    existing = {
+        policy.machine_id: policy
+        for policy in MachinePolicy.objects.filter(machine_id__in=list(machines))
+    }
+
+    to_create = []
+    to_update = []
+    now = timezone.now()
+
+    for pk, group_id in machines.items():
+        urls = sorted(urls_by_machine[pk] | urls_by_group.get(group_id, set()))
+        version = policy_version(urls)
+
+        policy = existing.get(pk)
+        if policy is None:
+            to_create.append(MachinePolicy(machine_id=pk, blocked_urls=urls, version=version))
+        elif policy.version != version:
+            policy.blocked_urls = urls
+            policy.version = version
+            policy.updated_at = now
+            to_update.append(policy)
+
+    if to_create:
+        MachinePolicy.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_update:
+        MachinePolicy.objects.bulk_update(to_update, ['blocked_urls', 'version', 'updated_at'])
+
+    return len(to_create) + len(to_update)
+
+
+def rebuild_policies(machine_ids):
+    """
+    Reconstrói a política das máquinas informadas
+
+    Returns:
+        int: Número de políticas criadas ou alteradas
+    """
+    machine_ids = sorted({pk for pk in machine_ids if pk})
+    changed = 0
+    for i in range(0, len(machine_ids), POLICY_CHUNK_SIZE):
+        changed += _rebuild_chunk(machine_ids[i:i + POLICY_CHUNK_SIZE])
+    return changed
+
+
+def rebuild_group_policies(group_ids):
+    """Reconstrói a política de todas as máquinas dos grupos informados"""
+    group_ids = [pk for pk in group_ids if pk]
+    if not group_ids:
+        return 0
+    return rebuild_policies(
+        Machine.objects.filter(group_id__in=group_ids).values_list('pk', flat=True)
+    )
+
+
+def get_policy(hostname):
+    """
+    Retorna (urls, version) da máquina, materializando se ainda não existir
+
+    Hostnames desconhecidos recebem a política vazia.
+    """
+    row = MachinePolicy.objects.filter(
+        machine__hostname=hostname
+    ).values_list('blocked_urls', 'version').first()
+
+    if row is None:
+        machine_id = Machine.objects.filter(hostname=hostname).values_list('pk', flat=True).first()
+        if machine_id is None:
+            return [], policy_version([])
+        rebuild_policies([machine_id])
+        row = MachinePolicy.objects.filter(
+            machine_id=machine_id
+        ).values_list('blocked_urls', 'version').first()
+
+    return row
@@ -0,0 +1,93 @@
+"""
+Rollout gradual de versões do agente
+
+Cada máquina cai em um bucket de 0 a 99 pelo hash do hostname (com a versão
+como sal, para que os primeiros da fila mudem a cada release). A versão é
+oferecida quando o bucket está abaixo de rollout_percentage ou a máquina
+pertence a um grupo canário; aumentar o percentual só adiciona máquinas.
+
+Uma versão interrompida (rollout_halted) deixa de ser oferecida e as
+máquinas passam a ver a versão ativa anterior. O limite de downloads por
+minuto é contado por processo, como os demais caches em memória do app.
+"""
+import hashlib
+import threading
+import time
+from .models import AgentVersion, Machine
+
+# Versões ativas consideradas na escolha (mais recentes primeiro)
+ROLLOUT_CANDIDATES = 10
+
+
+def version_tuple(value):
+    try:
+        return tuple(map(int, value.split('.')))
+    except (AttributeError, ValueError):
+        return (0, 0, 0)
+
+
+def rollout_bucket(hostname, version):
+    """Bucket determinístico 0-99 da máquina para a versão"""
+    digest = hashlib.sha256(f'{version}:{(hostname or "").lower()}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % 100
+
+
+def is_eligible(version, hostname, group_id):
+    if group_id is not None and any(group.pk == group_id for group in version.rollout_groups.all()):
+        return True
+    return rollout_bucket(hostname, version.version) < version.rollout_percentage
+
+
+class DownloadSlots:
+    """Janela fixa de um minuto com contador por versão"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window = None
+        self._counts = {}
+
+    def acquire(self, version_id, limit):
+        """
+        Returns:
+            int: 0 se o slot foi concedido, senão segundos até a próxima janela
+        """
+        if not limit:
+            return 0
+
+        now = time.time()
+        window = int(now // 60)
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._counts = {}
+            used = self._counts.get(version_id, 0)
+            if used >= limit:
+                return int(60 - now % 60) + 1
+            self._counts[version_id] = used + 1
+        return 0
+
+
+download_slots = DownloadSlots()
+
+
+def select_version(hostname):
+    """
+    Versão mais recente liberada para a máquina
+
+    Returns:
+        AgentVersion ou None
+    """
+    group_id = (
+        Machine.objects.filter(hostname=hostname).values_list('group_id', flat=True).first()
+        if hostname else None
+    )
+
+    candidates = (
+        AgentVersion.objects.filter(is_active=True, rollout_halted=False)
+        .prefetch_related('rollout_groups')
+        .order_by('-created_at')[:ROLLOUT_CANDIDATES]
+    )
+    for version in candidates:
+        if is_eligible(version, hostname, group_id):
+            return version
+    return None
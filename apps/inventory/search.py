@@ -0,0 +1,238 @@
+"""
+Índice de busca da frota
+
+No SQLite o índice é uma tabela virtual FTS5 com tokenizer trigram, que
+aceita buscas por trechos ("192.168.1", "i7-12", parte do serial) e ordena
+por bm25. A tabela é criada e populada no post_migrate (signals.py), fora
+de qualquer transação de requisição, e mantida pelo check-in e pelos
+signals de Machine. Em outros bancos, em SQLite sem FTS5/trigram ou se a
+tabela sumir, a busca usa icontains nos mesmos campos.
+
+Campos indexados: hostname, usuário logado, serial, IP, MACs, CPU e build do SO.
+"""
+import logging
+import threading
+from django.db import connection, connections, transaction, OperationalError, DatabaseError
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Machine
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'inventory_machine_search'
+
+# Campos do Machine cujo valor vai para o índice
+SEARCH_FIELDS = (
+    'hostname', 'loggedUser', 'serial_number', 'ip_address',
+    'mac_address', 'network_info', 'cpu', 'os_build',
+)
+
+# O tokenizer trigram exige termos com pelo menos 3 caracteres
+MIN_TERM_LENGTH = 3
+
+_state = {'available': None}
+_lock = threading.Lock()
+
+
+def _document(machine):
+    """Colunas do índice para uma máquina"""
+    macs = [machine.mac_address or '']
+    adapters = machine.network_info
+    if isinstance(adapters, dict):
+        adapters = [adapters]
+    for adapter in adapters or []:
+        if isinstance(adapter, dict) and adapter.get('mac'):
+            macs.append(str(adapter['mac']))
+
+    return (
+        machine.pk,
+        machine.hostname or '',
+        machine.loggedUser or '',
+        machine.serial_number or '',
+        machine.ip_address or '',
+        ' '.join(sorted({mac.upper() for mac in macs if mac})),
+        machine.cpu or '',
+        machine.os_build or '',
+    )
+
+
+def _write(cursor, machines):
+    docs = [_document(machine) for machine in machines if machine.pk is not None]
+    if not docs:
+        return
+    cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(doc[0],) for doc in docs])
+    cursor.executemany(
+        f'INSERT INTO {SEARCH_TABLE} '
+        f'(rowid, hostname, logged_user, serial_number, ip_address, mac, cpu, os_build) '
+        f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+        docs
+    )
+
+
+def create_index(using='default'):
+    """
+    Cria a tabela FTS5 se não existir e a popula
+
+    Chamado pelo post_migrate e pelo rebuild_search_index.
+
+    Returns:
+        bool: False se o banco não suportar FTS5/trigram
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return False
+
+    try:
+        with conn.cursor() as cursor:
+            exists = _table_exists(cursor)
+            if not exists:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+                    f'hostname, logged_user, serial_number, ip_address, mac, cpu, os_build, '
+                    f"tokenize='trigram')"
+                )
+    except DatabaseError as e:
+        logger.warning(f"FTS5/trigram indisponível, busca usará icontains: {e}")
+        return False
+
+    if not exists:
+        total = rebuild_index(using)
+        logger.info(f"Índice de busca criado com {total} máquinas")
+
+    reset_state()
+    return True
+
+
+def rebuild_index(using='default'):
+    """Recria o conteúdo do índice com todas as máquinas"""
+    conn = connections[using]
+    total = 0
+    with transaction.atomic(using=using), conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        chunk = []
+        for machine in Machine.objects.using(using).only(*SEARCH_FIELDS).iterator(chunk_size=1000):
+            chunk.append(machine)
+            if len(chunk) >= 1000:
+                _write(cursor, chunk)
+                total += len(chunk)
+                chunk = []
+        _write(cursor, chunk)
+        total += len(chunk)
+
+    return total
+
+
+def _table_exists(cursor):
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE]
+    )
+    return cursor.fetchone() is not None
+
+
+def reset_state():
+    """Esquece o resultado em cache; a próxima chamada verifica a tabela de novo"""
+    _state['available'] = None
+
+
+def fts_available():
+    """True se a tabela FTS5 existe (resultado em cache até reset_state)"""
+    if _state['available'] is not None:
+        return _state['available']
+
+    with _lock:
+        if _state['available'] is None:
+            if connection.vendor != 'sqlite':
+                _state['available'] = False
+            else:
+                try:
+                    with connection.cursor() as cursor:
+                        _state['available'] = _table_exists(cursor)
+                except DatabaseError:
+                    return False
+        return _state['available']
+
+
+def index_machines(machines):
+    """Atualiza o índice das máquinas informadas"""
+    if not fts_available():
+        return
+    try:
+        with connection.cursor() as cursor:
+            _write(cursor, machines)
+    except DatabaseError as e:
+        logger.warning(f"Erro ao atualizar índice de busca: {e}")
+        reset_state()
+
+
+def remove_machine(machine_id):
+    if not fts_available():
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [machine_id])
+    except DatabaseError as e:
+        logger.warning(f"Erro ao remover máquina do índice de busca: {e}")
+        reset_state()
+
+
+def _fallback_filter(terms):
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(hostname__icontains=term)
+            | Q(loggedUser__icontains=term)
+            | Q(serial_number__icontains=term)
+            | Q(ip_address__icontains=term)
+            | Q(mac_address__icontains=term)
+            | Q(network_info__icontains=term)
+            | Q(cpu__icontains=term)
+            | Q(os_build__icontains=term)
+        )
+    return condition
+
+
+def search_machines(queryset, query):
+    """
+    Filtra o queryset pela busca livre, ordenado por relevância quando há FTS
+
+    O MATCH entra como subconsulta, então os demais filtros do queryset são
+    aplicados no mesmo SELECT, sem limite sobre o resultado do índice.
+
+    Returns:
+        QuerySet
+    """
+    terms = query.split()
+    if not terms:
+        return queryset
+
+    if not fts_available() or any(len(term) < MIN_TERM_LENGTH for term in terms):
+        return queryset.filter(_fallback_filter(terms)).order_by('-last_seen')
+
+    match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+    # O queryset é preguiçoso; a consulta de teste garante que a tabela existe
+    # antes de devolvê-lo à view
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT 1', [match]
+            )
+    except OperationalError as e:
+        logger.warning(f"Índice de busca indisponível, usando icontains: {e}")
+        reset_state()
+        return queryset.filter(_fallback_filter(terms)).order_by('-last_seen')
+
+    machine_pk = (
+        f'{connection.ops.quote_name(Machine._meta.db_table)}.'
+        f'{connection.ops.quote_name(Machine._meta.pk.column)}'
+    )
+
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f'SELECT bm25({SEARCH_TABLE}) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = {machine_pk}',
+            [match]
+        )
+    ).order_by('search_rank', '-last_seen')
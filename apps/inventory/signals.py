@@ -1,6 +1,11 @@
-from .models import Notification, Machine
+from .models import Notification, Machine, AgentToken, BlockedSite, MachineGroup
+from .token_cache import token_cache
+from .policy import rebuild_policies, rebuild_group_policies
+from .broker import notification_broker
+from .search import index_machines, remove_machine, create_index
 import logging
-from django.db.models.signals import pre_save, post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
 from django.dispatch import receiver
 from django.utils import timezone
 from django.conf import settings
@@ -19,12 +24,23 @@ def notification_created(sender, instance, created, **kwargs):
     if created:
         # Notificação foi criada
         print(f"Nova notificação criada: {instance.title}")
+
+        # Acorda o long-poll do agente depois que a notificação estiver visível
+        machine_id = instance.machine_id
+        transaction.on_commit(lambda: notification_broker.publish(machine_id))
     else:
         # Notificação foi atualizada
         if instance.is_read:
             print(f"Notificação marcada como lida: {instance.title}")
 
 
+@receiver(post_save, sender=AgentToken)
+@receiver(post_delete, sender=AgentToken)
+def invalidar_cache_token(sender, instance, **kwargs):
+    """Remove o token do cache de validação ao criar/alterar/remover"""
+    token_cache.invalidate(instance.token_hash)
+
+
 @receiver(pre_save, sender=Machine)
 def verificar_status_maquina(sender, instance, **kwargs):
     """
@@ -65,4 +81,70 @@ def verificar_status_maquina(sender, instance, **kwargs):
 
     except sender.DoesNotExist:
         # Máquina nova
-        instance.is_online = True
\ No newline at end of file
+        instance.is_online = True
+
+
+# ==================== POLÍTICA DE SITES BLOQUEADOS ====================
+
+@receiver(pre_save, sender=BlockedSite)
+def guardar_alvo_anterior_site(sender, instance, **kwargs):
+    """Guarda máquina/grupo anteriores para reconstruir também o alvo antigo"""
+    instance._previous_target = None
+    if instance.pk:
+        instance._previous_target = sender.objects.filter(
+            pk=instance.pk
+        ).values_list('machine_id', 'group_id').first()
+
+
+@receiver(post_save, sender=BlockedSite)
+@receiver(post_delete, sender=BlockedSite)
+def reconstruir_politica_site(sender, instance, **kwargs):
+    """Reconstrói a política das máquinas afetadas pelo site bloqueado"""
+    machine_ids = [instance.machine_id]
+    group_ids = [instance.group_id]
+
+    previous = getattr(instance, '_previous_target', None)
+    if previous:
+        machine_ids.append(previous[0])
+        group_ids.append(previous[1])
+
+    rebuild_policies(machine_ids)
+    rebuild_group_policies(group_ids)
+
+
+@receiver(post_save, sender=Machine)
+def reconstruir_politica_maquina(sender, instance, created, update_fields=None, **kwargs):
+    """Máquina nova ou com grupo possivelmente alterado"""
+    if created or update_fields is None or 'group' in update_fields:
+        rebuild_policies([instance.pk])
+
+
+@receiver(pre_delete, sender=MachineGroup)
+def guardar_maquinas_grupo(sender, instance, **kwargs):
+    """As máquinas do grupo ficam sem grupo (SET_NULL) sem disparar signals"""
+    instance._machine_ids = list(instance.machine_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=MachineGroup)
+def reconstruir_politica_grupo_removido(sender, instance, **kwargs):
+    rebuild_policies(getattr(instance, '_machine_ids', []))
+
+
+# ==================== ÍNDICE DE BUSCA ====================
+
+@receiver(post_migrate)
+def criar_indice_busca(sender, using='default', **kwargs):
+    """Cria a tabela FTS5 após o migrate, fora das transações das requisições"""
+    if sender.name == 'apps.inventory':
+        create_index(using)
+
+
+@receiver(post_save, sender=Machine)
+def indexar_maquina(sender, instance, **kwargs):
+    """Mantém o índice de busca em dia para edições fora do check-in"""
+    index_machines([instance])
+
+
+@receiver(post_delete, sender=Machine)
+def remover_maquina_indice(sender, instance, **kwargs):
+    remove_machine(instance.pk)
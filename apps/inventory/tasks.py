@@ -0,0 +1,23 @@
+from datetime import timedelta
+from django.utils import timezone
+# from celery import shared_task
+
+from .models import Machine
+from .signals import MACHINE_OFFLINE_TIMEOUT
+
+
+# @shared_task
+def check_machines_status(timeout_minutes=MACHINE_OFFLINE_TIMEOUT):
+    """
+    Marca como offline as máquinas sem check-in há mais de timeout_minutes
+
+    Um único UPDATE, independente do tamanho da frota.
+
+    Returns:
+        int: Número de máquinas marcadas como offline
+    """
+    threshold = timezone.now() - timedelta(minutes=timeout_minutes)
+    return Machine.objects.filter(
+        is_online=True,
+        last_seen__lt=threshold
+    ).update(is_online=False)
@@ -0,0 +1,292 @@
+"""
+Telemetria de hardware das máquinas (disco livre, uptime, RAM)
+
+    - TelemetryRecorder: amostra no check-in, no máximo uma linha por máquina
+      a cada INVENTORY_TELEMETRY_SAMPLE_INTERVAL, gravadas com bulk_create
+      por tamanho do buffer ou por uma thread a cada TELEMETRY_FLUSH_AGE
+    - rollup_telemetry: bruto -> hora -> dia; todo bucket que ainda tem
+      linhas na resolução de origem é recalculado e regravado se a contagem
+      de amostras mudou (amostras atrasadas entram no bucket certo), e
+      remoção dos dados fora da retenção
+    - machines_filling_disk: máquinas cujo disco livre caiu no período
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Avg, Min, Max, Sum
+from django.db.models.functions import TruncHour, TruncDay
+from django.utils import timezone
+from .models import MachineTelemetry
+
+logger = logging.getLogger(__name__)
+
+# Intervalo mínimo (segundos) entre amostras brutas da mesma máquina
+TELEMETRY_SAMPLE_INTERVAL = getattr(settings, 'INVENTORY_TELEMETRY_SAMPLE_INTERVAL', 900)
+
+# Amostras acumuladas antes de gravar / idade máxima do buffer (segundos)
+TELEMETRY_FLUSH_SIZE = 200
+TELEMETRY_FLUSH_AGE = 60
+
+# Amostras ficam até TELEMETRY_FLUSH_AGE no buffer de cada processo; o rollup
+# só fecha buckets que terminaram antes deste atraso
+TELEMETRY_ROLLUP_DELAY = timedelta(seconds=TELEMETRY_FLUSH_AGE * 2)
+
+# Retenção (dias) por resolução
+TELEMETRY_RETENTION = getattr(settings, 'INVENTORY_TELEMETRY_RETENTION', {
+    MachineTelemetry.RESOLUTION_RAW: 7,
+    MachineTelemetry.RESOLUTION_HOUR: 90,
+    MachineTelemetry.RESOLUTION_DAY: 730,
+})
+
+# Campos recalculados pelo rollup
+ROLLUP_FIELDS = ['samples', 'disk_free_gb', 'disk_free_min_gb', 'uptime_days', 'ram_gb']
+
+
+class TelemetryRecorder:
+    """Amostragem das métricas no caminho do check-in"""
+
+    def __init__(self, sample_interval=TELEMETRY_SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self._last_sample = {}
+        self._pending = []
+        self._oldest_pending = None
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def record(self, machine, now=None):
+        """Registra as métricas atuais da máquina se o intervalo de amostragem passou"""
+        if machine.pk is None:
+            return False
+
+        monotonic = time.monotonic()
+
+        with self._lock:
+            last = self._last_sample.get(machine.pk)
+            if last is not None and monotonic - last < self.sample_interval:
+                return False
+            self._last_sample[machine.pk] = monotonic
+
+            self._pending.append(MachineTelemetry(
+                machine_id=machine.pk,
+                timestamp=now or timezone.now(),
+                disk_free_gb=machine.disk_free_gb,
+                disk_free_min_gb=machine.disk_free_gb,
+                uptime_days=machine.uptime_days,
+                ram_gb=machine.ram_gb,
+            ))
+            if self._oldest_pending is None:
+                self._oldest_pending = monotonic
+
+            should_flush = len(self._pending) >= TELEMETRY_FLUSH_SIZE
+
+        self._ensure_worker()
+
+        if should_flush:
+            self.flush()
+        return True
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._oldest_pending = None
+
+        if not pending:
+            return 0
+
+        try:
+            MachineTelemetry.objects.bulk_create(pending, ignore_conflicts=True)
+        except Exception:
+            logger.exception("Erro ao gravar telemetria")
+            return 0
+        return len(pending)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run,
+                name='inventory-telemetry-flush',
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _run(self):
+        # Nenhuma amostra fica mais que TELEMETRY_FLUSH_AGE no buffer, mesmo sem check-ins
+        while True:
+            time.sleep(TELEMETRY_FLUSH_AGE)
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+telemetry_recorder = TelemetryRecorder()
+
+atexit.register(telemetry_recorder.flush)
+
+
+def _rollup(source, target, db_trunc, trunc, since, until):
+    """
+    Consolida os buckets de `source` entre `since` e `until` em `target`
+
+    Todo bucket com linhas em `source` é recalculado; só os novos ou cuja
+    contagem de amostras mudou (amostras que chegaram depois da última
+    execução) são gravados.
+
+    Returns:
+        set: Início dos buckets criados ou atualizados
+    """
+    since, until = trunc(since), trunc(until)
+    if since >= until:
+        return set()
+
+    aggregated = (
+        MachineTelemetry.objects.filter(resolution=source, timestamp__gte=since, timestamp__lt=until)
+        .annotate(bucket=db_trunc('timestamp'))
+        .values('machine_id', 'bucket')
+        .annotate(
+            total=Sum('samples'),
+            disk_free=Avg('disk_free_gb'),
+            disk_free_min=Min('disk_free_min_gb'),
+            uptime=Max('uptime_days'),
+            ram=Avg('ram_gb'),
+        )
+        .order_by()
+    )
+
+    existing = {
+        (row.machine_id, row.timestamp): row
+        for row in MachineTelemetry.objects.filter(
+            resolution=target, timestamp__gte=since, timestamp__lt=until
+        )
+    }
+
+    created, updated, changed = [], [], set()
+    for row in aggregated.iterator():
+        values = {
+            'samples': row['total'] or 0,
+            'disk_free_gb': row['disk_free'],
+            'disk_free_min_gb': row['disk_free_min'],
+            'uptime_days': row['uptime'],
+            'ram_gb': row['ram'],
+        }
+        current = existing.get((row['machine_id'], row['bucket']))
+        if current is None:
+            created.append(MachineTelemetry(
+                machine_id=row['machine_id'], resolution=target, timestamp=row['bucket'], **values
+            ))
+        elif current.samples != values['samples']:
+            for field, value in values.items():
+                setattr(current, field, value)
+            updated.append(current)
+        else:
+            continue
+        changed.add(row['bucket'])
+
+    MachineTelemetry.objects.bulk_create(created, batch_size=500, ignore_conflicts=True)
+    MachineTelemetry.objects.bulk_update(updated, ROLLUP_FIELDS, batch_size=500)
+    return changed
+
+
+def _hour_start(dt):
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def _day_start(dt):
+    return timezone.localtime(dt).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_telemetry(now=None):
+    """
+    Consolida bruto -> hora -> dia e remove o que passou da retenção
+
+    Returns:
+        dict: Buckets gravados e linhas removidas por resolução
+    """
+    now = now or timezone.now()
+    # Buckets ainda sujeitos a amostras nos buffers dos workers ficam para a próxima execução
+    settled = now - TELEMETRY_ROLLUP_DELAY
+    # Primeiro bucket inteiro de cada origem: o anterior já perdeu linhas para a retenção
+    raw_since = now - timedelta(days=TELEMETRY_RETENTION[MachineTelemetry.RESOLUTION_RAW]) + timedelta(hours=1)
+    hour_since = now - timedelta(days=TELEMETRY_RETENTION[MachineTelemetry.RESOLUTION_HOUR]) + timedelta(days=1)
+    result = {}
+
+    with transaction.atomic():
+        hours = _rollup(
+            MachineTelemetry.RESOLUTION_RAW, MachineTelemetry.RESOLUTION_HOUR,
+            TruncHour, _hour_start, raw_since, settled
+        )
+        result['hour_written'] = len(hours)
+
+        # Dias novos e os que receberam horas recalculadas
+        last_day = MachineTelemetry.objects.filter(
+            resolution=MachineTelemetry.RESOLUTION_DAY
+        ).aggregate(last=Max('timestamp'))['last']
+        day_since = last_day + timedelta(days=1) if last_day else hour_since
+        if hours:
+            day_since = min(day_since, min(hours))
+        days = _rollup(
+            MachineTelemetry.RESOLUTION_HOUR, MachineTelemetry.RESOLUTION_DAY,
+            TruncDay, _day_start, max(day_since, hour_since), settled
+        )
+        result['day_written'] = len(days)
+
+        for resolution, retention in TELEMETRY_RETENTION.items():
+            deleted, _ = MachineTelemetry.objects.filter(
+                resolution=resolution,
+                timestamp__lt=now - timedelta(days=retention)
+            ).delete()
+            result[f'{resolution}_deleted'] = deleted
+
+    return result
+
+
+def machines_filling_disk(days=30, min_drop_gb=5.0, now=None):
+    """
+    Máquinas cujo disco livre caiu pelo menos min_drop_gb nos últimos `days` dias
+
+    Compara a média horária do primeiro dia do período com a do último dia,
+    com duas consultas agregadas sobre o índice (resolution, timestamp).
+
+    Returns:
+        list: [{'machine_id', 'start_gb', 'end_gb', 'drop_gb'}] ordenada pela queda
+    """
+    now = now or timezone.now()
+    start = now - timedelta(days=days)
+    hourly = MachineTelemetry.objects.filter(resolution=MachineTelemetry.RESOLUTION_HOUR)
+
+    def averages(since, until):
+        return dict(
+            hourly.filter(timestamp__gte=since, timestamp__lt=until)
+            .values('machine_id')
+            .annotate(value=Avg('disk_free_gb'))
+            .order_by()
+            .values_list('machine_id', 'value')
+        )
+
+    first = averages(start, start + timedelta(days=1))
+    last = averages(now - timedelta(days=1), now)
+
+    result = []
+    for machine_id, start_gb in first.items():
+        end_gb = last.get(machine_id)
+        if start_gb is None or end_gb is None:
+            continue
+        drop = start_gb - end_gb
+        if drop >= min_drop_gb:
+            result.append({
+                'machine_id': machine_id,
+                'start_gb': round(start_gb, 2),
+                'end_gb': round(end_gb, 2),
+                'drop_gb': round(drop, 2),
+            })
+
+    return sorted(result, key=lambda row: row['drop_gb'], reverse=True)
@@ -1,3 +1,910 @@
-from django.test import TestCase
+import base64
+import datetime
+import gzip
+import importlib.util
+import io
+import json
+import queue
+import re
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from django.views.generic import ListView
+from .artifacts import serve_artifact
+from .commands import CommandQueue, CommandTimeout, FakeTransport, fan_out, aggregate_batch
+from .checkin import apply_checkin_batch, compute_inventory_hash
+from .heartbeat import HeartbeatBuffer, heartbeat_buffer
+from .models import (
+    Machine, MachineGroup, CommandJob, MachineTelemetry, AgentToken, MachinePolicy, BlockedSite,
+    AgentVersion,
+)
+from .policy import get_policy
+from .rollout import rollout_bucket, select_version
+from .pagination import KeysetPaginationMixin, encode_cursor, decode_cursor
+from . import search
+from .search import search_machines, _fallback_filter
+from .token_cache import TokenCache, token_cache
+from .telemetry import rollup_telemetry
 
-# Create your tests here.
+
+class MachineKeysetView(KeysetPaginationMixin, ListView):
+    model = Machine
+    keyset_ordering = '-last_seen'
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        base = timezone.now().replace(microsecond=123000)
+        for i in range(5):
+            machine = Machine.objects.create(hostname=f'PC-{i:02d}', ip_address='10.0.0.1')
+            # Todas no mesmo milissegundo, diferindo só nos microssegundos
+            Machine.objects.filter(pk=machine.pk).update(
+                last_seen=base + datetime.timedelta(microseconds=i * 100)
+            )
+
+    def paginate(self, ordering, query=''):
+        view = MachineKeysetView()
+        view.keyset_ordering = ordering
+        view.request = self.factory.get('/' + query)
+        _, page, rows, _ = view.paginate_queryset(Machine.objects.all(), 2)
+        return page, rows
+
+    def walk(self, ordering):
+        seen = []
+        page, rows = self.paginate(ordering)
+        seen.extend(m.hostname for m in rows)
+        while page.has_next:
+            page, rows = self.paginate(ordering, '?' + page.next_query)
+            seen.extend(m.hostname for m in rows)
+        return seen
+
+    def test_cursor_keeps_microseconds(self):
+        value = timezone.now().replace(microsecond=123456)
+        field = Machine._meta.get_field('last_seen')
+        self.assertEqual(decode_cursor(encode_cursor(value, 7), field), (value, 7))
+
+    def test_descending_pages_same_millisecond(self):
+        self.assertEqual(self.walk('-last_seen'), [f'PC-{i:02d}' for i in range(4, -1, -1)])
+
+    def test_ascending_pages_same_millisecond(self):
+        self.assertEqual(self.walk('last_seen'), [f'PC-{i:02d}' for i in range(5)])
+
+
+class FanOutTests(TestCase):
+    def setUp(self):
+        self.group = MachineGroup.objects.create(name='Laboratório')
+        other = MachineGroup.objects.create(name='Financeiro')
+        for i in range(1, 4):
+            Machine.objects.create(hostname=f'LAB-{i}', ip_address='10.0.1.1', group=self.group)
+        Machine.objects.create(hostname='FIN-1', ip_address='10.0.2.1', group=other)
+
+    def private_queue(self, transport):
+        # Sem workers: os jobs são executados pelo teste, em ordem
+        return CommandQueue(workers=0, transport=transport, recover_on_start=False, private=True)
+
+    def run_batch(self, queue, command='hostname'):
+        with self.captureOnCommitCallbacks(execute=True):
+            batch = fan_out(self.group, command, queue=queue)
+        for job in batch.jobs.all():
+            queue.execute(job.pk)
+        return batch
+
+    def test_fan_out_aggregates_results(self):
+        transport = FakeTransport(responses={
+            'LAB-1': (0, 'ok\n', ''),
+            'LAB-2': (0, 'ok\n', ''),
+            'LAB-3': (1, '', 'acesso negado'),
+        })
+        batch = self.run_batch(self.private_queue(transport))
+
+        summary = aggregate_batch(batch)
+        self.assertEqual(summary['total'], 3)
+        self.assertTrue(summary['done'])
+        self.assertEqual(summary['counts'][CommandJob.STATUS_SUCCEEDED], 2)
+        self.assertEqual(summary['counts'][CommandJob.STATUS_FAILED], 1)
+        self.assertEqual(summary['outputs'][0], {'output': 'ok', 'count': 2, 'hosts': ['LAB-1', 'LAB-2']})
+        self.assertEqual(sorted(host for host, _ in transport.calls), ['LAB-1', 'LAB-2', 'LAB-3'])
+
+    def test_transport_errors_and_timeouts(self):
+        transport = FakeTransport(responses={
+            'LAB-1': RuntimeError('sem rota'),
+            'LAB-2': CommandTimeout('Sem resposta em 120s'),
+        })
+        batch = self.run_batch(self.private_queue(transport))
+
+        status = dict(batch.jobs.values_list('machine__hostname', 'status'))
+        self.assertEqual(status, {
+            'LAB-1': CommandJob.STATUS_FAILED,
+            'LAB-2': CommandJob.STATUS_TIMEOUT,
+            'LAB-3': CommandJob.STATUS_SUCCEEDED,
+        })
+        self.assertEqual(batch.jobs.get(machine__hostname='LAB-3').stdout, 'hostname\n')
+
+    def test_private_jobs_are_not_taken_by_shared_queue(self):
+        queue = self.private_queue(FakeTransport())
+        with self.captureOnCommitCallbacks(execute=True):
+            batch = fan_out(self.group, 'hostname', queue=queue)
+
+        shared_transport = FakeTransport()
+        shared = CommandQueue(workers=0, transport=shared_transport, recover_on_start=False)
+        shared.recover()
+        for job in batch.jobs.all():
+            self.assertFalse(shared.execute(job.pk))
+
+        self.assertEqual(shared_transport.calls, [])
+        self.assertFalse(CommandJob.objects.filter(owner='').exists())
+        self.assertEqual(batch.jobs.filter(status=CommandJob.STATUS_QUEUED).count(), 3)
+
+
+class CommandQueueTests(TestCase):
+    def setUp(self):
+        self.machine = Machine.objects.create(hostname='LAB-1', ip_address='10.0.1.1')
+        self.transport = FakeTransport()
+        self.queue = CommandQueue(workers=0, transport=self.transport, recover_on_start=False, private=True)
+
+    def submit(self, command='hostname'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.queue.submit(self.machine, command)
+
+    def test_job_is_claimed_once(self):
+        job = self.submit()
+
+        self.assertTrue(self.queue.execute(job.pk))
+        # Outro worker (ou o mesmo id enfileirado duas vezes) não executa de novo
+        self.assertFalse(self.queue.execute(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, CommandJob.STATUS_SUCCEEDED)
+        self.assertEqual(len(self.transport.calls), 1)
+
+    def test_recover_requeues_and_fails_orphans(self):
+        queued = [self.submit(f'cmd-{i}') for i in range(2)]
+        orphan, running = self.submit('orfao'), self.submit('rodando')
+        now = timezone.now()
+        CommandJob.objects.filter(pk=orphan.pk).update(
+            status=CommandJob.STATUS_RUNNING, started_at=now - datetime.timedelta(days=1)
+        )
+        CommandJob.objects.filter(pk=running.pk).update(status=CommandJob.STATUS_RUNNING, started_at=now)
+
+        with mock.patch.object(self.queue, 'enqueue') as enqueue:
+            self.queue.recover()
+
+        self.assertEqual(
+            [call.args for call in enqueue.call_args_list],
+            [(job.pk, self.machine.pk) for job in queued]
+        )
+        self.assertEqual(CommandJob.objects.get(pk=orphan.pk).status, CommandJob.STATUS_FAILED)
+        self.assertEqual(CommandJob.objects.get(pk=running.pk).status, CommandJob.STATUS_RUNNING)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.lab = MachineGroup.objects.create(name='Laboratório')
+        for i in range(3):
+            Machine.objects.create(
+                hostname=f'LAB-{i}', ip_address=f'10.0.1.{i}', group=self.lab if i else None,
+                network_info=[{'name': 'Ethernet', 'mac': f'AA:BB:CC:00:00:0{i}'}],
+            )
+
+    def test_search_applies_queryset_filters(self):
+        found = search_machines(Machine.objects.filter(group=self.lab), 'LAB')
+        self.assertEqual(sorted(m.hostname for m in found), ['LAB-1', 'LAB-2'])
+
+    def test_adapter_mac_found_by_index_and_fallback(self):
+        found = search_machines(Machine.objects.all(), 'CC:00:00:02')
+        self.assertEqual([m.hostname for m in found], ['LAB-2'])
+
+        fallback = Machine.objects.filter(_fallback_filter(['CC:00:00:02']))
+        self.assertEqual([m.hostname for m in fallback], ['LAB-2'])
+
+    def test_missing_table_falls_back_to_icontains(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {search.SEARCH_TABLE}')
+
+        found = search_machines(Machine.objects.filter(group=self.lab), 'LAB-2')
+        self.assertEqual([m.hostname for m in found], ['LAB-2'])
+        self.assertFalse(search.fts_available())
+
+        # Gravações seguintes não falham sem a tabela
+        Machine.objects.create(hostname='LAB-9', ip_address='10.0.1.9')
+
+
+def create_agent_token(token='ABCD1234', **fields):
+    user = get_user_model().objects.create_user(f'admin-{token}', password='senha')
+    return AgentToken.objects.create(
+        token=token, token_hash=f'hash-{token}', created_by=user,
+        expires_at=timezone.now() + datetime.timedelta(days=1), **fields
+    )
+
+
+class CheckinProtocolTests(TestCase):
+    url = '/api/inventario/checkin/'
+
+    def setUp(self):
+        self.token = create_agent_token()
+        self.addCleanup(heartbeat_buffer.flush)
+
+    def checkin(self, **payload):
+        payload.setdefault('hostname', 'LAB-1')
+        payload.setdefault('token', self.token.token_hash)
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_full_checkin_clears_missing_keys(self):
+        self.checkin(ip='10.0.1.1', hardware={'cpu': 'i5', 'ram_gb': 8})
+        response = self.checkin(ip='10.0.1.1', hardware={'cpu': 'i5'})
+
+        self.assertEqual(response.status_code, 200)
+        machine = Machine.objects.get(hostname='LAB-1')
+        self.assertEqual(machine.cpu, 'i5')
+        self.assertIsNone(machine.ram_gb)
+        self.assertEqual(response.json()['inventory_hash'], compute_inventory_hash({'cpu': 'i5'}))
+
+    def test_diff_with_stale_base_hash_asks_resync(self):
+        self.checkin(ip='10.0.1.1', hardware={'cpu': 'i5'})
+        stored = Machine.objects.get(hostname='LAB-1').inventory_hash
+
+        response = self.checkin(
+            mode='diff', base_hash='outro', inventory_hash='novo', hardware={'cpu': 'i7'}
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'resync')
+        self.assertEqual(response.json()['inventory_hash'], stored)
+        self.assertEqual(Machine.objects.get(hostname='LAB-1').cpu, 'i5')
+
+    def test_heartbeat_with_matching_hash(self):
+        self.checkin(ip='10.0.1.1', hardware={'cpu': 'i5'})
+        machine = Machine.objects.get(hostname='LAB-1')
+        before = machine.last_seen
+
+        response = self.checkin(mode='heartbeat', inventory_hash=machine.inventory_hash)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ok')
+
+        heartbeat_buffer.flush()
+        machine.refresh_from_db()
+        self.assertGreater(machine.last_seen, before)
+        self.assertEqual(machine.cpu, 'i5')
+
+    def test_invalid_token(self):
+        self.assertEqual(self.checkin(token='desconhecido').status_code, 401)
+
+
+class PolicyETagTests(TestCase):
+    url = '/api/inventario/checkin/'
+
+    def setUp(self):
+        self.machine = Machine.objects.create(hostname='LAB-1', ip_address='10.0.1.1')
+        BlockedSite.objects.create(url='jogos.example.com', machine=self.machine)
+
+    def get(self, if_none_match=None):
+        headers = {'If-None-Match': if_none_match} if if_none_match else {}
+        return self.client.get(self.url, {'host': 'LAB-1'}, headers=headers)
+
+    def test_not_modified_for_matching_etag(self):
+        response = self.get()
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), ['jogos.example.com'])
+
+        for header in (etag, f'W/{etag}', f'"outro", {etag}', '*'):
+            self.assertEqual(self.get(header).status_code, 304, header)
+
+    def test_partial_etag_does_not_match(self):
+        etag = self.get()['ETag']
+        version = etag.strip('"')
+
+        for header in (version, f'"{version}x"', f'"x{version}"', '"outro"'):
+            self.assertEqual(self.get(header).status_code, 200, header)
+
+    def test_etag_changes_when_rule_is_edited(self):
+        etag = self.get()['ETag']
+
+        site = BlockedSite.objects.get(machine=self.machine)
+        site.url = 'videos.example.com'
+        site.save()
+
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json(), ['videos.example.com'])
+
+
+class CompressedRequestTests(TestCase):
+    url = '/api/inventario/checkin/'
+
+    def setUp(self):
+        self.token = create_agent_token()
+        self.payload = json.dumps({
+            'hostname': 'LAB-1', 'ip': '10.0.1.1', 'token': self.token.token_hash,
+            'hardware': {'cpu': 'i5', 'memory_modules': [{'slot': i} for i in range(50)]},
+        }).encode('utf-8')
+
+    def post(self, body, encoding):
+        return self.client.post(
+            self.url, body, content_type='application/json', headers={'Content-Encoding': encoding}
+        )
+
+    def test_gzip_body_is_decoded(self):
+        response = self.post(gzip.compress(self.payload), 'gzip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Machine.objects.get(hostname='LAB-1').cpu, 'i5')
+
+    def test_body_over_limit(self):
+        with mock.patch('apps.inventory.middleware.MAX_DECOMPRESSED_BODY', len(self.payload) - 1):
+            response = self.post(gzip.compress(self.payload), 'gzip')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Machine.objects.exists())
+
+    def test_unknown_encoding(self):
+        response = self.post(self.payload, 'br')
+
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Machine.objects.exists())
+
+    def test_invalid_gzip(self):
+        self.assertEqual(self.post(b'nao e gzip', 'gzip').status_code, 400)
+
+
+class ServeArtifactTests(SimpleTestCase):
+    content = bytes(range(256)) * 4
+    modified = 1700000000
+
+    def serve(self, gzip_variant=False, **headers):
+        request = RequestFactory().get('/agent.exe', headers=headers)
+        compressed = gzip.compress(self.content)
+        return serve_artifact(
+            request,
+            open_file=lambda: io.BytesIO(self.content),
+            size=len(self.content),
+            sha256='abc',
+            last_modified=self.modified,
+            content_type='application/octet-stream',
+            filename='agent.exe',
+            open_gzip=(lambda: io.BytesIO(compressed)) if gzip_variant else None,
+            gzip_size=len(compressed) if gzip_variant else None,
+        )
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"abc"')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(self.body(response), self.content)
+
+    def test_etag_not_modified(self):
+        self.assertEqual(self.serve(**{'If-None-Match': '"abc"'}).status_code, 304)
+        self.assertEqual(self.serve(**{'If-None-Match': 'W/"abc"'}).status_code, 304)
+        self.assertEqual(self.serve(**{'If-None-Match': '"abc-gzip"'}).status_code, 304)
+        self.assertEqual(self.serve(**{'If-None-Match': '"ab"'}).status_code, 200)
+
+    def test_if_modified_since(self):
+        self.assertEqual(self.serve(**{'If-Modified-Since': http_date(self.modified)}).status_code, 304)
+        self.assertEqual(self.serve(**{'If-Modified-Since': http_date(self.modified - 60)}).status_code, 200)
+        # If-None-Match tem precedência
+        response = self.serve(**{'If-None-Match': '"outro"', 'If-Modified-Since': http_date(self.modified)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_ranges(self):
+        size = len(self.content)
+        cases = {
+            'bytes=0-9': (0, 9),
+            'bytes=1000-': (1000, size - 1),
+            'bytes=-24': (size - 24, size - 1),
+            'bytes=-5000': (0, size - 1),
+            'bytes=1020-9999': (1020, size - 1),
+        }
+        for header, (start, end) in cases.items():
+            response = self.serve(Range=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+            self.assertEqual(self.body(response), self.content[start:end + 1])
+
+    def test_unsatisfiable_ranges(self):
+        size = len(self.content)
+        for header in ('bytes=5000-', f'bytes={size}-{size + 10}', 'bytes=-0', 'bytes=10-5'):
+            response = self.serve(Range=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # Header malformado é ignorado
+        self.assertEqual(self.serve(Range='linhas=0-9').status_code, 200)
+
+    def test_if_range_with_old_etag_sends_full_file(self):
+        response = self.serve(Range='bytes=0-9', **{'If-Range': '"antigo"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip_variant(self):
+        response = self.serve(gzip_variant=True, **{'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], '"abc-gzip"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(self.body(response)), self.content)
+
+        plain = self.serve(gzip_variant=True)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(self.body(plain), self.content)
+
+
+class RolloutTests(TestCase):
+    url = '/api/inventario/agent/update/'
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('admin', password='senha')
+        self.lab = MachineGroup.objects.create(name='Laboratório')
+        Machine.objects.create(hostname='LAB-1', ip_address='10.0.1.1', group=self.lab)
+        Machine.objects.create(hostname='FIN-1', ip_address='10.0.2.1')
+        self.created = timezone.now() - datetime.timedelta(days=30)
+
+    def version(self, number, **fields):
+        version = AgentVersion.objects.create(
+            version=number, file_path=f'agent_versions/agent-{number}.exe', release_notes='',
+            created_by=self.user, **fields
+        )
+        # Ordem de criação explícita: select_version ordena por created_at
+        self.created += datetime.timedelta(days=1)
+        AgentVersion.objects.filter(pk=version.pk).update(created_at=self.created)
+        return version
+
+    def check_update(self, machine_name, current_version):
+        return self.client.post(
+            self.url, {'machine_name': machine_name, 'current_version': current_version},
+            content_type='application/json'
+        ).json()
+
+    def test_bucket_is_stable_and_percentage_only_adds_machines(self):
+        hostnames = [f'PC-{i:04d}' for i in range(2000)]
+        self.assertEqual(rollout_bucket('PC-0001', '2.0.0'), rollout_bucket('pc-0001', '2.0.0'))
+
+        buckets = {hostname: rollout_bucket(hostname, '2.0.0') for hostname in hostnames}
+        self.assertTrue(all(0 <= bucket < 100 for bucket in buckets.values()))
+        wave_10 = {h for h, b in buckets.items() if b < 10}
+        wave_30 = {h for h, b in buckets.items() if b < 30}
+        self.assertLess(wave_10, wave_30)
+        self.assertAlmostEqual(len(wave_30) / len(hostnames), 0.3, delta=0.05)
+
+        # A versão é o sal: outra release escolhe outras máquinas primeiro
+        other = {h for h in hostnames if rollout_bucket(h, '2.1.0') < 10}
+        self.assertNotEqual(wave_10, other)
+
+    def test_canary_group_receives_version_at_zero_percent(self):
+        stable = self.version('1.0.0')
+        canary = self.version('2.0.0', rollout_percentage=0)
+        canary.rollout_groups.add(self.lab)
+
+        self.assertEqual(select_version('LAB-1'), canary)
+        self.assertEqual(select_version('FIN-1'), stable)
+
+    def test_halted_version_is_not_offered(self):
+        self.version('1.0.0')
+        self.version('2.0.0', rollout_halted=True)
+
+        response = self.check_update('FIN-1', '1.0.0')
+        self.assertFalse(response['update_available'])
+        self.assertEqual(response['latest_version'], '1.0.0')
+
+    def test_mandatory_version_downgrades_agents_on_halted_release(self):
+        """
+        Comportamento intencional: com a 2.0.0 interrompida, a versão liberada
+        volta a ser a 1.0.0; se ela for obrigatória, agentes já na 2.0.0
+        recebem update_available para voltar a ela
+        """
+        stable = self.version('1.0.0')
+        self.version('2.0.0', rollout_halted=True)
+
+        response = self.check_update('FIN-1', '2.0.0')
+        self.assertFalse(response['update_available'])
+
+        AgentVersion.objects.filter(pk=stable.pk).update(is_mandatory=True)
+        response = self.check_update('FIN-1', '2.0.0')
+        self.assertTrue(response['update_available'])
+        self.assertEqual(response['version'], '1.0.0')
+
+    def test_retry_after_when_download_slots_are_used(self):
+        self.version('2.0.0', rollout_slots_per_minute=1)
+
+        with mock.patch('apps.inventory.rollout.time.time', return_value=1700000010.0):
+            first = self.check_update('LAB-1', '1.0.0')
+            second = self.check_update('FIN-1', '1.0.0')
+
+        self.assertTrue(first['update_available'])
+        self.assertFalse(second['update_available'])
+        self.assertEqual(second['retry_after'], 31)
+
+
+class CheckinBatchTests(TestCase):
+    def setUp(self):
+        self.addCleanup(heartbeat_buffer.flush)
+        apply_checkin_batch([
+            {'hostname': 'PC-1', 'ip': '10.0.0.1', 'hardware': {'cpu': 'i5'}},
+            {'hostname': 'PC-2', 'ip': '10.0.0.2', 'hardware': {'cpu': 'i5'}},
+        ])
+
+    def test_bulk_create_sets_pks(self):
+        machines = {m.hostname: m.pk for m in Machine.objects.all()}
+        results = apply_checkin_batch([
+            {'hostname': 'NEW-1', 'ip': '10.0.0.9', 'hardware': {'cpu': 'i3'}},
+            {'hostname': 'PC-1', 'ip': '10.0.0.1', 'hardware': {'cpu': 'i5'}},
+        ])
+
+        new = Machine.objects.get(hostname='NEW-1')
+        self.assertEqual(results[0]['machine_id'], new.pk)
+        self.assertEqual(results[1]['machine_id'], machines['PC-1'])
+        self.assertEqual(results[0]['inventory_hash'], compute_inventory_hash({'cpu': 'i3'}))
+
+    def test_mixed_create_and_update(self):
+        results = apply_checkin_batch([
+            {'hostname': 'PC-1', 'ip': '10.0.0.1', 'hardware': {'cpu': 'i7'}},
+            {'hostname': 'NEW-1', 'ip': '10.0.0.9', 'hardware': {'cpu': 'i3'}},
+            # Mesma máquina duas vezes no lote: vale o último
+            {'hostname': 'NEW-1', 'ip': '10.0.0.9', 'hardware': {'cpu': 'i5'}},
+            {'hostname': 'PC-3', 'mode': 'diff', 'base_hash': 'x', 'inventory_hash': 'y'},
+            {'ip': '10.0.0.4'},
+        ])
+
+        self.assertEqual([r['status'] for r in results], ['ok', 'ok', 'ok', 'resync', 'error'])
+        self.assertEqual(results[1]['machine_id'], results[2]['machine_id'])
+        self.assertEqual(Machine.objects.get(hostname='PC-1').cpu, 'i7')
+        self.assertEqual(Machine.objects.get(hostname='NEW-1').cpu, 'i5')
+        self.assertEqual(Machine.objects.count(), 3)
+
+    def test_updates_grouped_by_changed_fields(self):
+        with mock.patch.object(Machine.objects, 'bulk_update', wraps=Machine.objects.bulk_update) as bulk_update:
+            apply_checkin_batch([
+                {'hostname': 'PC-1', 'ip': '10.0.0.1', 'hardware': {'cpu': 'i7'}},
+                {'hostname': 'PC-2', 'ip': '10.0.0.20', 'hardware': {'cpu': 'i5'}},
+            ])
+
+        field_sets = sorted(tuple(call.args[1]) for call in bulk_update.call_args_list)
+        self.assertEqual(field_sets, [
+            ('cpu', 'inventory_hash', 'is_online', 'last_seen'),
+            ('ip_address', 'is_online', 'last_seen'),
+        ])
+        self.assertEqual(Machine.objects.get(hostname='PC-2').ip_address, '10.0.0.20')
+
+    def test_side_effects_skipped_by_bulk_create(self):
+        apply_checkin_batch([{'hostname': 'NEW-1', 'ip': '10.0.0.9', 'hardware': {'cpu': 'i3'}}])
+        new = Machine.objects.get(hostname='NEW-1')
+
+        # bulk_create não dispara post_save: busca indexada pelo lote, política sob demanda
+        self.assertEqual([m.hostname for m in search_machines(Machine.objects.all(), 'NEW-1')], ['NEW-1'])
+        self.assertFalse(MachinePolicy.objects.filter(machine=new).exists())
+        urls, _ = get_policy('NEW-1')
+        self.assertEqual(urls, [])
+        self.assertTrue(MachinePolicy.objects.filter(machine=new).exists())
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        self.token = create_agent_token()
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+    def test_ttl_expiry(self):
+        cache = TokenCache(ttl=10, negative_ttl=5)
+        with mock.patch('apps.inventory.token_cache.time.monotonic') as monotonic:
+            monotonic.return_value = 100.0
+            self.assertTrue(cache.is_valid(self.token.token_hash))
+            self.assertFalse(cache.is_valid('desconhecido'))
+
+            monotonic.return_value = 104.0
+            self.assertTrue(cache.is_valid(self.token.token_hash))
+            self.assertFalse(cache.is_valid('desconhecido'))
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+            # Negativo expira primeiro, positivo depois do ttl
+            monotonic.return_value = 106.0
+            cache.is_valid('desconhecido')
+            cache.is_valid(self.token.token_hash)
+            self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+            monotonic.return_value = 111.0
+            cache.is_valid(self.token.token_hash)
+            self.assertEqual((cache.hits, cache.misses), (3, 4))
+
+    def test_save_and_delete_invalidate(self):
+        self.assertTrue(token_cache.is_valid(self.token.token_hash))
+
+        self.token.is_active = False
+        self.token.save()
+        self.assertFalse(token_cache.is_valid(self.token.token_hash))
+
+        self.token.is_active = True
+        self.token.save()
+        self.assertTrue(token_cache.is_valid(self.token.token_hash))
+
+        self.token.delete()
+        self.assertFalse(token_cache.is_valid(self.token.token_hash))
+
+    def test_revoked_token_is_rejected_on_next_checkin(self):
+        payload = json.dumps({'hostname': 'LAB-1', 'ip': '10.0.1.1', 'token': self.token.token_hash})
+        url = '/api/inventario/checkin/'
+        self.assertEqual(self.client.post(url, payload, content_type='application/json').status_code, 200)
+
+        self.client.force_login(self.token.created_by)
+        self.client.post(reverse('inventario:token_deactivate', args=[self.token.pk]))
+
+        self.assertEqual(self.client.post(url, payload, content_type='application/json').status_code, 401)
+
+    def test_lookup_racing_invalidation_is_not_cached(self):
+        cache = TokenCache()
+
+        def exists():
+            # Token desativado enquanto a consulta estava em andamento
+            cache.invalidate(self.token.token_hash)
+            return True
+
+        with mock.patch('apps.inventory.token_cache.AgentToken') as model:
+            model.objects.filter.return_value.exists.side_effect = exists
+            self.assertTrue(cache.is_valid(self.token.token_hash))
+
+        self.assertEqual(cache.stats()['size'], 0)
+
+
+class HeartbeatBufferTests(TestCase):
+    def setUp(self):
+        # Intervalo longo: só o flush() do teste grava
+        self.buffer = HeartbeatBuffer(flush_interval=3600)
+        self.now = timezone.now()
+        self.machines = [
+            Machine.objects.create(hostname=f'LAB-{i}', ip_address='10.0.1.1') for i in range(3)
+        ]
+        Machine.objects.update(is_online=False, last_seen=self.now - datetime.timedelta(hours=1))
+
+    def test_flush_writes_latest_heartbeat_per_machine(self):
+        first, second, third = self.machines
+        self.buffer.record(first.pk, self.now - datetime.timedelta(seconds=30))
+        self.buffer.record(first.pk, self.now)
+        self.buffer.record(second.pk, self.now - datetime.timedelta(seconds=10))
+        self.assertEqual(self.buffer.pending_count(), 2)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.buffer.pending_count(), 0)
+
+        rows = {m.pk: m for m in Machine.objects.all()}
+        self.assertEqual(rows[first.pk].last_seen, self.now)
+        self.assertTrue(rows[first.pk].is_online)
+        self.assertEqual(rows[second.pk].last_seen, self.now - datetime.timedelta(seconds=10))
+        self.assertTrue(rows[second.pk].is_online)
+        self.assertFalse(rows[third.pk].is_online)
+
+    def test_discard_drops_pending_heartbeat(self):
+        self.buffer.record(self.machines[0].pk, self.now)
+        self.buffer.discard(self.machines[0].pk)
+
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertFalse(Machine.objects.get(pk=self.machines[0].pk).is_online)
+
+
+class TelemetryRollupTests(TestCase):
+    def setUp(self):
+        self.machine = Machine.objects.create(hostname='LAB-1', ip_address='10.0.1.1')
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+        self.hour = self.now.replace(minute=0) - datetime.timedelta(hours=2)
+
+    def sample(self, minutes, disk):
+        MachineTelemetry.objects.create(
+            machine=self.machine,
+            timestamp=self.hour + datetime.timedelta(minutes=minutes),
+            disk_free_gb=disk,
+            disk_free_min_gb=disk,
+        )
+
+    def test_late_sample_updates_closed_bucket(self):
+        self.sample(5, 100.0)
+        rollup_telemetry(self.now)
+
+        # Amostra do mesmo bucket gravada depois da consolidação
+        self.sample(50, 90.0)
+        result = rollup_telemetry(self.now)
+
+        hour = MachineTelemetry.objects.get(resolution=MachineTelemetry.RESOLUTION_HOUR)
+        self.assertEqual(result['hour_written'], 1)
+        self.assertEqual(hour.timestamp, self.hour)
+        self.assertEqual(hour.samples, 2)
+        self.assertEqual(hour.disk_free_gb, 95.0)
+        self.assertEqual(hour.disk_free_min_gb, 90.0)
+
+        # Sem amostras novas nada é regravado
+        self.assertEqual(rollup_telemetry(self.now)['hour_written'], 0)
+
+
+AGENT_PATH = Path(__file__).resolve().parent / 'agents' / 'agent.py'
+_agent_module = {}
+
+
+def load_agent():
+    """agents/agent.py não é um pacote; carregado pelo caminho"""
+    if 'module' not in _agent_module:
+        spec = importlib.util.spec_from_file_location('inventory_agent', AGENT_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _agent_module['module'] = module
+    return _agent_module['module']
+
+
+class AgentTestCase(SimpleTestCase):
+    """Testes do agente; pulados se as dependências dele (psutil, tkinter) faltarem"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            cls.agent = load_agent()
+        except ImportError as e:
+            raise unittest.SkipTest(f'Dependência do agente ausente: {e}')
+
+
+class PowerShellBackendTests(AgentTestCase):
+    def tearDown(self):
+        self.agent.PowerShellCollector.set_backend(None)
+
+    def test_backend_selection(self):
+        collector = self.agent.PowerShellCollector
+        expected = {
+            'fake': self.agent.FakePowerShellBackend,
+            'subprocess': self.agent.SubprocessPowerShellBackend,
+            'persistent': self.agent.PersistentPowerShellBackend,
+            None: self.agent.PersistentPowerShellBackend,
+        }
+        for name, backend_class in expected.items():
+            collector.set_backend(None)
+            backend = collector.get_backend({'powershell_backend': name})
+            self.assertIsInstance(backend, backend_class)
+            # Criado uma vez e reaproveitado
+            self.assertIs(collector.get_backend({'powershell_backend': 'fake'}), backend)
+
+    def test_fake_backend_feeds_collector(self):
+        backend = self.agent.FakePowerShellBackend({
+            'Get-SystemInfo': {'hostname': 'LAB-01', 'ram_gb': 16},
+        })
+        self.agent.PowerShellCollector.set_backend(backend)
+
+        data = self.agent.PowerShellCollector.get_system_info()
+        self.assertEqual(data, {'hostname': 'LAB-01', 'ram_gb': 16})
+        self.assertEqual(backend.calls, ['Get-SystemInfo'])
+
+    def test_fake_backend_defaults(self):
+        backend = self.agent.FakePowerShellBackend({'Get-Custom': lambda: 'texto'})
+        self.assertEqual(backend.invoke('Get-Custom'), 'texto')
+
+        info = json.loads(backend.invoke('Get-VolatileInfo'))
+        self.assertIn('hostname', info)
+        self.assertIn('disk_free_gb', info)
+
+        with self.assertRaises(Exception):
+            backend.invoke('Get-Inexistente')
+
+
+class PowerShellFramingTests(AgentTestCase):
+    def lines(self, *items):
+        q = queue.Queue()
+        for item in items:
+            q.put(item)
+        return q
+
+    def test_reads_until_marker(self):
+        backend = self.agent.PersistentPowerShellBackend
+        lines = self.lines('{"a":\n', '1}\n', '__END_x__\r\n', 'próxima\n')
+
+        self.assertEqual(backend.read_until_marker(lines, '__END_x__', 1), '{"a":\n1}\n')
+        # A linha seguinte fica para a próxima chamada
+        self.assertEqual(lines.get_nowait(), 'próxima\n')
+
+    def test_process_exit_and_timeout(self):
+        backend = self.agent.PersistentPowerShellBackend
+        with self.assertRaises(EOFError):
+            backend.read_until_marker(self.lines('parcial\n', None), '__END_x__', 1)
+        with self.assertRaises(self.agent.PowerShellTimeout):
+            backend.read_until_marker(self.lines('parcial\n'), '__END_x__', 0.05)
+
+    def test_bootstrap_and_call_lines(self):
+        backend = self.agent.PersistentPowerShellBackend
+        script = "function Get-X { Write-Output 'ação' }\nGet-X"
+
+        line = backend.bootstrap_line(script)
+        self.assertTrue(line.endswith('\n'))
+        self.assertEqual(line.count('\n'), 1)
+        encoded = re.search(r"FromBase64String\('([^']+)'\)", line).group(1)
+        self.assertEqual(base64.b64decode(encoded).decode('utf-8'), script)
+
+        self.assertEqual(
+            backend.call_line('Get-SystemInfo', '__END_x__'),
+            "Get-SystemInfo; Write-Output '__END_x__'\n"
+        )
+
+
+class NotificationCursorTests(AgentTestCase):
+    def manager(self, last_id=0):
+        manager = self.agent.NotificationManager.__new__(self.agent.NotificationManager)
+        manager.last_notification_id = last_id
+        return manager
+
+    def test_cursor_stops_before_failed_popup(self):
+        manager = self.manager(10)
+        notifications = [{'id': 11}, {'id': 12}, {'id': 13}]
+
+        manager.advance_cursor(notifications, handled={11, 13})
+        self.assertEqual(manager.last_notification_id, 11)
+
+        manager.advance_cursor(notifications, handled={11, 12, 13})
+        self.assertEqual(manager.last_notification_id, 13)
+
+
+class OfflineSpoolTests(AgentTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.spool = self.agent.OfflineSpool(self.directory.name)
+
+    def test_append_during_replay_is_kept(self):
+        self.spool.append('ack', ids=[1])
+        records, segments = self.spool.take()
+        self.assertEqual(records, [{'kind': 'ack', 'ids': [1]}])
+
+        # Gravado por outra thread enquanto o reenvio estava em andamento
+        self.spool.append('ack', ids=[2])
+        self.spool.commit(segments)
+
+        records, _ = self.spool.take()
+        self.assertEqual(records, [{'kind': 'ack', 'ids': [2]}])
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+
+class BlockedSitesPolicyTests(AgentTestCase):
+    def test_etag_sent_back_and_304_keeps_list(self):
+        responses = [
+            FakeResponse(200, ['jogos.example.com'], {'ETag': '"v1"'}),
+            FakeResponse(304),
+        ]
+        session = mock.Mock()
+        session.get.side_effect = responses
+
+        config = self.agent.AgentConfig()
+        policy = self.agent.BlockedSitesPolicy(config)
+        with mock.patch.object(self.agent.RequestsSession, 'get_session', return_value=session):
+            self.assertTrue(policy.refresh())
+            self.assertFalse(policy.refresh())
+
+        first, second = session.get.call_args_list
+        self.assertEqual(first.kwargs['headers'], {})
+        self.assertEqual(second.kwargs['headers'], {'If-None-Match': '"v1"'})
+        self.assertEqual(policy.urls, ['jogos.example.com'])
+        self.assertEqual(policy.etag, '"v1"')
+
+
+class AutoUpdaterRetryTests(AgentTestCase):
+    def test_retry_after_schedules_next_check(self):
+        session = mock.Mock()
+        session.post.return_value = FakeResponse(200, {
+            'update_available': False, 'latest_version': '2.0.0', 'retry_after': 30,
+        })
+        updater = self.agent.AutoUpdater(self.agent.AgentConfig())
+
+        with mock.patch.object(self.agent.RequestsSession, 'get_session', return_value=session):
+            self.assertIsNone(updater.check_for_updates())
+
+        self.assertTrue(30 <= updater.next_check_delay() <= 90)
+        # Consumido: a verificação seguinte volta ao intervalo normal
+        self.assertGreater(updater.next_check_delay(), 90)
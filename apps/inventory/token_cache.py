@@ -0,0 +1,100 @@
+"""
+Cache de validação dos tokens do agente
+
+O check-in valida o token em toda requisição. O resultado da consulta
+(token ativo ou não) fica num LRU em memória com TTL, de modo que o caminho
+estável do heartbeat não consulta o banco para autenticação.
+
+A invalidação é feita pelos signals de AgentToken (signals.py). Com vários
+processos cada um tem seu próprio cache; o TTL limita o tempo em que um
+token desativado em outro processo ainda é aceito.
+
+Uma consulta ao banco que corre junto com uma invalidação não grava seu
+resultado (possivelmente anterior à alteração): cada invalidação avança a
+geração do cache e o resultado só entra se a geração não mudou.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .models import AgentToken
+
+# Tempo (segundos) que um resultado permanece válido no cache
+TOKEN_CACHE_TTL = getattr(settings, 'INVENTORY_TOKEN_CACHE_TTL', 300)
+
+# Tempo (segundos) para resultados negativos (token inexistente/inativo)
+TOKEN_CACHE_NEGATIVE_TTL = getattr(settings, 'INVENTORY_TOKEN_CACHE_NEGATIVE_TTL', 30)
+
+# Número máximo de tokens mantidos no cache
+TOKEN_CACHE_MAX_SIZE = getattr(settings, 'INVENTORY_TOKEN_CACHE_MAX_SIZE', 10000)
+
+
+class TokenCache:
+    """LRU com TTL para o resultado de validação de token_hash"""
+
+    def __init__(self, ttl=TOKEN_CACHE_TTL, negative_ttl=TOKEN_CACHE_NEGATIVE_TTL, max_size=TOKEN_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def is_valid(self, token_hash):
+        """Retorna True se o token_hash pertence a um AgentToken ativo"""
+        if not token_hash:
+            return False
+
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(token_hash)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        valid = AgentToken.objects.filter(token_hash=token_hash, is_active=True).exists()
+        expires = now + (self.ttl if valid else self.negative_ttl)
+
+        with self._lock:
+            if generation != self._generation:
+                # Invalidado durante a consulta: o resultado pode estar velho
+                return valid
+            self._entries[token_hash] = (valid, expires)
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return valid
+
+    def invalidate(self, token_hash):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(token_hash, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores para acompanhar a eficiência do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+token_cache = TokenCache()
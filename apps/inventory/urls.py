@@ -2,13 +2,20 @@ from django.urls import path
 from .views import (
     # API Endpoints
     MachineCheckinView,
+    MachineBatchCheckinView,
     RunCommandView,
+    CommandJobView,
+    MachineGroupRunCommandView,
+    CommandBatchView,
     AgentDownloadView,
     MachineNotificationView,
+    MachineNotificationWaitView,
+    MachineNotificationAckView,
     AgentVersionView,
 
     # Machine Views
     MachineListView,
+    MachineDiskTrendView,
     MachineDetailView,
     MachineCreateView,
     MachineUpdateView,
@@ -30,8 +37,10 @@ from .views import (
     NotificationListView,
     NotificationDetailView,
     NotificationCreateView,
-    NotificationDeleteView, AgentVersionListView, AgentVersionCreateView, AgentTokenDeleteView, AgentVersionToggleView,
+    NotificationDeleteView, NotificationBroadcastView, AgentVersionListView, AgentVersionCreateView, AgentTokenDeleteView, AgentVersionToggleView,
+    AgentVersionRolloutView,
     AgentValidateTokenAPIView, AgentCheckUpdateAPIView, AgentDownloadAPIView, AgentHealthCheckAPIView,
+    AgentDeltaAPIView,
     AgentTokenDeactivateView, AgentTokenCreateView, AgentTokenListView,
 )
 
@@ -40,13 +49,20 @@ app_name = 'inventario'
 urlpatterns = [
     # ==================== API ENDPOINTS ====================
     path('inventario/checkin/', MachineCheckinView.as_view(), name='checkin'),
+    path('inventario/checkin/batch/', MachineBatchCheckinView.as_view(), name='checkin_batch'),
     path('run/<int:machine_id>/', RunCommandView.as_view(), name='run_command'),
+    path('inventario/jobs/<int:pk>/', CommandJobView.as_view(), name='command_job'),
+    path('inventario/jobs/batch/<int:pk>/', CommandBatchView.as_view(), name='command_batch'),
+    path('inventario/groups/<int:pk>/run/', MachineGroupRunCommandView.as_view(), name='group_run_command'),
     path('notifications/', MachineNotificationView.as_view(), name='machine-notifications'),
+    path('notifications/wait/', MachineNotificationWaitView.as_view(), name='machine-notifications-wait'),
+    path('notifications/ack/', MachineNotificationAckView.as_view(), name='machine-notifications-ack'),
     path('agent/download/', AgentDownloadView.as_view(), name='agent_download'),
     path('agent/version/', AgentVersionView.as_view(), name='agent_version'),
 
     # ==================== MACHINES ====================
     path('machines/', MachineListView.as_view(), name='machine_list'),
+    path('machines/disk-trend/', MachineDiskTrendView.as_view(), name='machine_disk_trend'),
     path('machines/<int:pk>/', MachineDetailView.as_view(), name='machine_detail'),
     path('machines/new/', MachineCreateView.as_view(), name='machine_create'),
     path('machines/<int:pk>/edit/', MachineUpdateView.as_view(), name='machine_update'),
@@ -69,6 +85,7 @@ urlpatterns = [
     path('inventario/notifications/<int:pk>/', NotificationDetailView.as_view(), name='notifications_detail'),
     path('inventario/notifications/new/', NotificationCreateView.as_view(), name='notifications_create'),
     path('inventario/notifications/<int:pk>/delete/', NotificationDeleteView.as_view(), name='notifications_delete'),
+    path('inventario/notifications/broadcast/', NotificationBroadcastView.as_view(), name='notifications_broadcast'),
 
     # ============================================================================
     # GERENCIAMENTO DE TOKENS (Requer Login)
@@ -120,6 +137,12 @@ urlpatterns = [
         name='version_toggle'
     ),
 
+    path(
+        'agent/versions/<int:pk>/rollout/',
+        AgentVersionRolloutView.as_view(),
+        name='version_rollout'
+    ),
+
     # ============================================================================
     # API ENDPOINTS (Sem autenticação - para o agente usar)
     # ============================================================================
@@ -142,6 +165,12 @@ urlpatterns = [
         name='api_download_agent'
     ),
 
+    path(
+        'inventario/agent/delta/<int:source_pk>/<int:target_pk>/',
+        AgentDeltaAPIView.as_view(),
+        name='api_delta_agent'
+    ),
+
     path(
         'inventario/health/',
         AgentHealthCheckAPIView.as_view(),
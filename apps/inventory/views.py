@@ -1,59 +1,49 @@
+import io
 import os
 import re
 import json
 from datetime import timedelta
-import datetime
 import logging
-import hashlib
 from django.views import View
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, FileResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils import timezone
-from django.db import models as dj_models
+from django.conf import settings
 from django.views.generic import ListView, DetailView, UpdateView, CreateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
-from django.db.models import Q
-from .forms import MachineForm, NotificationForm, BlockedSiteForm, MachineGroupForm
-from .models import Machine, BlockedSite, Notification, MachineGroup, AgentToken, AgentVersion
+from django.db.models import Q, Count
+from .forms import MachineForm, NotificationForm, BlockedSiteForm, MachineGroupForm, NotificationBroadcastForm
+from .models import (
+    Machine, BlockedSite, Notification, MachineGroup, AgentToken, AgentVersion,
+    MachineMemoryModule, MachineNetworkAdapter, CommandJob, CommandBatch,
+)
+from .checkin import apply_checkin, apply_checkin_batch, CheckinResync
+from .token_cache import token_cache
+from .heartbeat import checkin_load
+from .policy import get_policy
+from .broker import notification_broker
+from .broadcast import broadcast_notification
+from .telemetry import machines_filling_disk
+from .search import search_machines
+from .pagination import KeysetPaginationMixin
+from .artifacts import etag_matches, file_digest_cache, prepare_version, serve_artifact
+from .rollout import select_version, version_tuple, download_slots
+from .delta import find_delta, schedule_delta
+from .commands import command_queue, job_events, serialize_job, fan_out, aggregate_batch
 
 logger = logging.getLogger(__name__)
 
 
-def parse_wmi_date(wmi_date_str):
-    """
-    Converte formato de data WMI/JSON do PowerShell/Python
-    Formato recebido: "/Date(1234567890000)/" (timestamp em milissegundos)
-    """
-    if not wmi_date_str:
-        return None
-
-    try:
-        # Remove /Date( e )/
-        if isinstance(wmi_date_str, str) and wmi_date_str.startswith('/Date('):
-            ms = int(wmi_date_str.replace('/Date(', '').replace(')/', ''))
-            # Converte de milissegundos para datetime
-            return datetime.datetime.utcfromtimestamp(ms / 1000).replace(tzinfo=datetime.timezone.utc)
-
-        # Se já for datetime, retorna
-        if isinstance(wmi_date_str, datetime.datetime):
-            return wmi_date_str
-
-        return None
-    except (ValueError, AttributeError) as e:
-        logger.error(f"Erro ao parsear data WMI: {wmi_date_str} - {e}")
-        return None
-
-
 @method_decorator(csrf_exempt, name='dispatch')
 class MachineCheckinView(View):
     def post(self, request):
@@ -62,77 +52,121 @@ class MachineCheckinView(View):
 
             raw = request.body.decode('utf-8')
             data = json.loads(raw)
-            hostname = data['hostname']
-            ip = data.get('ip', '')
-            hw = data.get('hardware', {})
-
             token_hash = data.get("token")
-            if not AgentToken.objects.filter(token_hash=token_hash, is_active=True).exists():
+            if not token_cache.is_valid(token_hash):
                 return JsonResponse({'error': 'Token inválido'}, status=401)
 
-            install_date = parse_wmi_date(hw.get('install_date'))
-            last_boot = parse_wmi_date(hw.get('last_boot'))
-
-            machine, _ = Machine.objects.update_or_create(
-                hostname=hostname,
-                defaults={
-                    'ip_address': ip,
-                    'is_online': True,
-                    'last_seen': timezone.now(),
-
-                    'loggedUser': hw.get('logged_user'),
-
-                    'tpm': hw.get('tpm'),
-
-                    'manufacturer': hw.get('manufacturer'),
-                    'model': hw.get('model'),
-
-                    'serial_number': hw.get('serial_number'),
-                    'bios_version': hw.get('bios_version'),
-
-                    'mac_address': hw.get('mac_address'),
-                    'total_memory_slots': hw.get('total_memory_slots'),
-                    'populated_memory_slots': hw.get('populated_memory_slots'),
-                    'memory_modules': hw.get('memory_modules'),
-
-                    'os_caption': hw.get('os_caption'),
-                    'os_architecture': hw.get('os_architecture'),
-                    'os_build': hw.get('os_build'),
-                    'install_date': install_date,
-                    'last_boot': last_boot,
-                    'uptime_days': hw.get('uptime_days'),
-
-                    'cpu': hw.get('cpu'),
-                    'ram_gb': hw.get('ram_gb'),
-                    'disk_space_gb': hw.get('disk_space_gb'),
-                    'disk_free_gb': hw.get('disk_free_gb'),
-
-                    'network_info': hw.get('network_adapters'),
-                    'gpu_name': hw.get('gpu_name'),
-                    'gpu_driver': hw.get('gpu_driver'),
-                    'antivirus_name': hw.get('antivirus_name'),
-                    'av_state': str(hw.get('av_state')),
-                },
-            )
-            return JsonResponse({'status': 'ok', 'machine_id': machine.id})
+            checkin_load.record()
+
+            # Check-in incremental: full, diff ou heartbeat (ver checkin.py)
+            try:
+                machine, changed_fields = apply_checkin(data)
+            except CheckinResync as e:
+                return JsonResponse({
+                    'status': 'resync',
+                    'inventory_hash': e.inventory_hash,
+                    'next_checkin': checkin_load.interval_hint(),
+                }, status=409)
+
+            logger.debug(f"Check-in {machine.hostname}: campos gravados {changed_fields}")
+
+            return JsonResponse({
+                'status': 'ok',
+                'machine_id': machine.id,
+                'inventory_hash': machine.inventory_hash,
+                'next_checkin': checkin_load.interval_hint(),
+            })
         except Exception as e:
             logger.exception("Erro no check-in")
             return JsonResponse({'error': str(e)}, status=400)
 
     def get(self, request):
+        """
+        Sites bloqueados da máquina (política materializada em MachinePolicy)
+
+        Responde 304 quando o If-None-Match do agente já é a versão atual.
+        """
         host = request.GET.get('host')
         if not host:
             return JsonResponse({'error': 'host parameter required'}, status=400)
 
-        sites = (
-            BlockedSite.objects.filter(
-                dj_models.Q(machine__hostname=host)
-                | dj_models.Q(group__machine__hostname=host)
-            )
-            .values_list('url', flat=True)
-            .distinct()
-        )
-        return JsonResponse(list(sites), safe=False)
+        urls, version = get_policy(host)
+        etag = f'"{version}"'
+
+        if etag_matches(request.headers.get('If-None-Match', ''), {etag}):
+            response = HttpResponse(status=304)
+        else:
+            response = JsonResponse(urls, safe=False)
+
+        response['ETag'] = etag
+        return response
+
+
+# Máximo de check-ins aceitos em uma requisição de lote
+CHECKIN_BATCH_MAX_ITEMS = getattr(settings, 'INVENTORY_CHECKIN_BATCH_MAX_ITEMS', 1000)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class MachineBatchCheckinView(View):
+    """
+    Check-in em lote para relays/proxies de filiais
+
+    Aceita:
+        - Array JSON de payloads de check-in
+        - Objeto {"token": "...", "checkins": [...]} (token aplicado aos itens sem token)
+        - NDJSON (Content-Type: application/x-ndjson), um payload por linha
+
+    Response:
+        {
+            "status": "ok",
+            "total": 2,
+            "next_checkin": 60,
+            "results": [
+                {"hostname": "PC-01", "status": "ok", "machine_id": 1, "inventory_hash": "..."},
+                {"hostname": "PC-02", "status": "resync", "inventory_hash": "..."}
+            ]
+        }
+    """
+
+    def post(self, request):
+        try:
+            raw = request.body.decode('utf-8')
+
+            if 'ndjson' in (request.content_type or ''):
+                items = [json.loads(line) for line in raw.splitlines() if line.strip()]
+                default_token = None
+            else:
+                data = json.loads(raw)
+                if isinstance(data, dict):
+                    items = data.get('checkins', [])
+                    default_token = data.get('token')
+                else:
+                    items = data
+                    default_token = None
+
+            if not isinstance(items, list):
+                return JsonResponse({'error': 'Lista de check-ins inválida'}, status=400)
+
+            if len(items) > CHECKIN_BATCH_MAX_ITEMS:
+                return JsonResponse({
+                    'error': f'Máximo de {CHECKIN_BATCH_MAX_ITEMS} check-ins por lote'
+                }, status=413)
+
+            def authorize(item):
+                return token_cache.is_valid(item.get('token') or default_token)
+
+            checkin_load.record(len(items))
+            results = apply_checkin_batch(items, authorize=authorize)
+
+            return JsonResponse({
+                'status': 'ok',
+                'total': len(results),
+                'results': results,
+                'next_checkin': checkin_load.interval_hint(),
+            })
+        except Exception as e:
+            logger.exception("Erro no check-in em lote")
+            return JsonResponse({'error': str(e)}, status=400)
 
 
 class RunCommandView(LoginRequiredMixin, View):
@@ -146,25 +180,107 @@ class RunCommandView(LoginRequiredMixin, View):
         if not cmd:
             return JsonResponse({'error': 'command required'}, status=400)
 
-        # executa via WinRM
-        import winrm  # se ainda precisar desse recurso
+        try:
+            timeout = int(request.POST.get('timeout') or 0) or None
+        except ValueError:
+            return JsonResponse({'error': 'timeout inválido'}, status=400)
+
+        # Executado pelo pool de workers; o resultado é consultado pelo job
+        job = command_queue.submit(machine, cmd, timeout=timeout, user=request.user)
+
+        return JsonResponse({
+            'job_id': job.pk,
+            'status': job.status,
+            'status_url': reverse('inventario:command_job', args=[job.pk]),
+        }, status=202)
+
+
+# Espera máxima (segundos) do ?wait= na consulta de jobs
+COMMAND_JOB_MAX_WAIT = 60
+
+
+class CommandJobView(LoginRequiredMixin, View):
+    """
+    Resultado de um comando remoto
+
+    GET /api/inventario/jobs/<id>/?wait=30 aguarda até 30s pela conclusão
+    """
+
+    def get(self, request, pk):
+        job = get_object_or_404(CommandJob, pk=pk)
 
         try:
-            session = winrm.Session(
-                f"http://{machine.ip_address}:5985/wsman",
-                auth=('admin', 'senha'),
-                server_cert_validation='ignore',
-            )
-            result = session.run_ps(cmd)
-            return JsonResponse(
-                {
-                    'stdout': result.std_out.decode('utf-8', 'ignore'),
-                    'stderr': result.std_err.decode('utf-8', 'ignore'),
-                    'status_code': result.status_code,
-                }
-            )
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
+            wait = min(max(float(request.GET.get('wait', 0)), 0), COMMAND_JOB_MAX_WAIT)
+        except ValueError:
+            return JsonResponse({'error': 'wait inválido'}, status=400)
+
+        if wait and not job.is_finished:
+            event = job_events.subscribe(job.pk)
+            try:
+                job.refresh_from_db()
+                if not job.is_finished and event.wait(wait):
+                    job.refresh_from_db()
+            finally:
+                job_events.unsubscribe(job.pk, event)
+
+        return JsonResponse(serialize_job(job))
+
+
+class MachineGroupRunCommandView(LoginRequiredMixin, View):
+    """
+    Envia o mesmo comando para todas as máquinas do grupo
+
+    POST /api/inventario/groups/<pk>/run/ (command, timeout, only_online)
+    """
+
+    def post(self, request, pk):
+        group = get_object_or_404(MachineGroup, pk=pk)
+
+        cmd = request.POST.get('command', '').strip()
+        if not cmd:
+            return JsonResponse({'error': 'command required'}, status=400)
+
+        try:
+            timeout = int(request.POST.get('timeout') or 0) or None
+        except ValueError:
+            return JsonResponse({'error': 'timeout inválido'}, status=400)
+
+        batch = fan_out(
+            group,
+            cmd,
+            timeout=timeout,
+            user=request.user,
+            only_online=request.POST.get('only_online') == 'true',
+        )
+
+        return JsonResponse({
+            'batch_id': batch.pk,
+            'total': batch.total,
+            'status_url': reverse('inventario:command_batch', args=[batch.pk]),
+        }, status=202)
+
+
+class CommandBatchView(LoginRequiredMixin, View):
+    """Resumo do comando em grupo: contagem por status e saídas distintas"""
+
+    def get(self, request, pk):
+        batch = get_object_or_404(CommandBatch.objects.select_related('group'), pk=pk)
+        return JsonResponse(aggregate_batch(batch))
+
+
+def serialize_notification(notif):
+    """Formato JSON das notificações entregues ao agente"""
+    return {
+        'id': notif.id,
+        'title': notif.title,
+        'message': notif.message,
+        # Usar getattr para compatibilidade caso algum campo não exista
+        'type': getattr(notif, 'type', 'info'),
+        'priority': getattr(notif, 'priority', 'normal'),
+        'status': getattr(notif, 'status', 'pending'),
+        'is_read': notif.is_read,
+        'created_at': notif.created_at.isoformat(),
+    }
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -255,19 +371,7 @@ class MachineNotificationView(View):
                 )[:limit]
 
                 # Serializar para JSON
-                notifications_data = []
-                for notif in notifications:
-                    notifications_data.append({
-                        'id': notif.id,
-                        'title': notif.title,
-                        'message': notif.message,
-                        # Usar getattr para compatibilidade caso algum campo não exista
-                        'type': getattr(notif, 'type', 'info'),
-                        'priority': getattr(notif, 'priority', 'normal'),
-                        'status': getattr(notif, 'status', 'pending'),
-                        'is_read': notif.is_read,
-                        'created_at': notif.created_at.isoformat(),
-                    })
+                notifications_data = [serialize_notification(notif) for notif in notifications]
 
                 return JsonResponse({
                     'success': True,
@@ -362,58 +466,257 @@ class MachineNotificationView(View):
 
 
 
-class AgentDownloadView(View):
+# Máximo de IDs aceitos em uma confirmação em lote
+NOTIFICATION_ACK_MAX_IDS = 500
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class MachineNotificationAckView(View):
+    """
+    Confirma (marca como lidas) várias notificações de uma máquina de uma vez
+
+    Body JSON:
+        {
+            "machine_name": "DESKTOP-ABC",
+            "notification_ids": [1, 2, 3]
+        }
+
+    Response:
+        {
+            "success": true,
+            "updated": 3,
+            "notification_ids": [1, 2, 3]
+        }
+
+    Apenas notificações da própria máquina são afetadas, com um único
+    UPDATE ... WHERE id IN (...).
+    """
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'JSON inválido no body'
+            }, status=400)
+
+        machine_name = data.get('machine_name')
+        notification_ids = data.get('notification_ids')
+
+        if not machine_name or not isinstance(notification_ids, list):
+            return JsonResponse({
+                'success': False,
+                'error': 'Campos machine_name e notification_ids são obrigatórios'
+            }, status=400)
+
+        if len(notification_ids) > NOTIFICATION_ACK_MAX_IDS:
+            return JsonResponse({
+                'success': False,
+                'error': f'Máximo de {NOTIFICATION_ACK_MAX_IDS} notificações por requisição'
+            }, status=400)
+
+        try:
+            notification_ids = [int(pk) for pk in notification_ids]
+        except (TypeError, ValueError):
+            return JsonResponse({
+                'success': False,
+                'error': 'notification_ids deve conter apenas inteiros'
+            }, status=400)
+
+        machine_id = Machine.objects.filter(
+            hostname__iexact=machine_name
+        ).values_list('id', flat=True).first()
+
+        if machine_id is None:
+            return JsonResponse({
+                'success': False,
+                'error': f'Máquina {machine_name} não encontrada'
+            }, status=404)
+
+        now = timezone.now()
+        updated = Notification.objects.filter(
+            machine_id=machine_id,
+            id__in=notification_ids,
+            is_read=False
+        ).update(is_read=True, status='read', read_at=now, updated_at=now)
+
+        return JsonResponse({
+            'success': True,
+            'updated': updated,
+            'notification_ids': notification_ids
+        })
+
+
+# Tempo máximo (segundos) que o long-poll de notificações segura a requisição
+NOTIFICATION_LONG_POLL_MAX_TIMEOUT = getattr(settings, 'INVENTORY_NOTIFICATION_LONG_POLL_TIMEOUT', 60)
+
+# Espera sugerida (segundos) ao agente quando o limite de long-polls é atingido
+NOTIFICATION_LONG_POLL_RETRY_AFTER = 30
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class MachineNotificationWaitView(View):
+    """
+    Long-poll de notificações para o agente
+
+    GET /api/notifications/wait/?machine_name=DESKTOP-ABC&after_id=10&timeout=55
+
+    Retorna imediatamente se houver notificações pendentes com id > after_id;
+    caso contrário segura a requisição até uma nova notificação da máquina
+    ser publicada (notification_broker) ou o timeout expirar.
+    Response no mesmo formato de GET /api/notifications/.
+
+    Com INVENTORY_NOTIFICATION_MAX_WAITERS long-polls já abertos neste
+    processo responde 429 com retry_after (ver broker.py sobre o
+    dimensionamento dos workers).
+    """
+
     def get(self, request):
-        agent_path = os.path.abspath(os.path.join(
-            os.path.dirname(__file__), 'agents', 'agent.ps1'
-        ))
+        try:
+            machine_name = request.GET.get('machine_name')
+            after_id = int(request.GET.get('after_id', 0))
+            limit = int(request.GET.get('limit', 20))
+            timeout = min(
+                float(request.GET.get('timeout', NOTIFICATION_LONG_POLL_MAX_TIMEOUT)),
+                NOTIFICATION_LONG_POLL_MAX_TIMEOUT
+            )
+        except ValueError as e:
+            return JsonResponse({
+                'success': False,
+                'error': f'Parâmetro inválido: {str(e)}',
+                'notifications': []
+            }, status=400)
+
+        if not machine_name:
+            return JsonResponse({
+                'success': False,
+                'error': 'Parâmetro machine_name é obrigatório',
+                'notifications': []
+            }, status=400)
+
+        machine = Machine.objects.filter(hostname__iexact=machine_name).only('id', 'hostname').first()
+        if machine is None:
+            return JsonResponse({
+                'success': False,
+                'error': f'Máquina {machine_name} não encontrada',
+                'machine_name': machine_name,
+                'notifications': []
+            }, status=200)
+
+        def pending():
+            return list(
+                Notification.objects.filter(
+                    machine_id=machine.id, is_read=False, id__gt=after_id
+                ).order_by('id')[:limit]
+            )
+
+        # Assina antes de consultar para não perder publicações entre os dois passos
+        event = notification_broker.subscribe(machine.id)
+        try:
+            notifications = pending()
+            if not notifications and event is None:
+                # Limite de long-polls do processo: não segura a thread
+                response = JsonResponse({
+                    'success': False,
+                    'error': 'Muitos long-polls abertos, tente novamente',
+                    'retry_after': NOTIFICATION_LONG_POLL_RETRY_AFTER,
+                    'notifications': []
+                }, status=429)
+                response['Retry-After'] = str(NOTIFICATION_LONG_POLL_RETRY_AFTER)
+                return response
+            if not notifications and timeout > 0:
+                # Também consulta no timeout: notificações criadas em outro
+                # processo não acordam o evento deste
+                event.wait(timeout)
+                notifications = pending()
+        finally:
+            if event is not None:
+                notification_broker.unsubscribe(machine.id, event)
+
+        notifications_data = [serialize_notification(notif) for notif in notifications]
+
+        return JsonResponse({
+            'success': True,
+            'machine_name': machine.hostname,
+            'machine_id': machine.id,
+            'total': len(notifications_data),
+            'notifications': notifications_data
+        })
+
+
+AGENT_SCRIPT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'agents', 'agent.ps1'))
 
-        if not os.path.exists(agent_path):
+
+class AgentDownloadView(View):
+    def get(self, request):
+        artifact = file_digest_cache.get(AGENT_SCRIPT_PATH)
+        if artifact is None:
             return JsonResponse({'error': 'Agent file not found'}, status=404)
 
-        with open(agent_path, 'rb') as f:
-            resp = HttpResponse(f.read(), content_type='text/plain')
-            resp['Content-Disposition'] = 'attachment; filename="agent.ps1"'
-            return resp
+        return serve_artifact(
+            request,
+            open_file=lambda: io.BytesIO(artifact['content']),
+            size=artifact['size'],
+            sha256=artifact['sha256'],
+            last_modified=artifact['mtime'],
+            content_type='text/plain',
+            filename='agent.ps1',
+            open_gzip=(lambda: io.BytesIO(artifact['gzip'])) if artifact['gzip'] else None,
+            gzip_size=len(artifact['gzip']) if artifact['gzip'] else None,
+        )
 
 
 class AgentVersionView(View):
     def get(self, request):
-        agent_path = os.path.abspath(os.path.join(
-            os.path.dirname(__file__), 'agents', 'agent.ps1'
-        ))
-
-        if not os.path.exists(agent_path):
+        # Digest em cache, recalculado só quando o arquivo muda
+        artifact = file_digest_cache.get(AGENT_SCRIPT_PATH)
+        if artifact is None:
             return JsonResponse({'error': 'Agent file not found'}, status=404)
 
-        with open(agent_path, 'rb') as f:
-            content = f.read()
-            sha256 = hashlib.sha256(content).hexdigest()
-
         return JsonResponse({
             'version': '2.4',
             'download_url': request.build_absolute_uri('/api/agent/download/'),
-            'sha256': sha256,
+            'sha256': artifact['sha256'],
         })
 
 
 # ==================== VIEWS PARA INTERFACE WEB ====================
 
-class MachineListView(LoginRequiredMixin, ListView):
+class MachineListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Machine
     template_name = 'inventario/machine_list.html'
     context_object_name = 'machines'
     paginate_by = 20
+    keyset_ordering = '-last_seen'
+
+    # Colunas exibidas na listagem; os JSONs de hardware ficam de fora
+    list_fields = (
+        'hostname', 'ip_address', 'loggedUser', 'ram_gb', 'disk_free_gb',
+        'is_online', 'last_seen', 'group__name',
+    )
+
+    def get_keyset_ordering(self):
+        # A busca livre já vem ordenada por relevância
+        if self.request.GET.get('q', '').strip():
+            return None
+        return self.keyset_ordering
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('group').only(*self.list_fields)
 
         # Filtros
+        q = self.request.GET.get('q', '').strip()
         hostname = self.request.GET.get('hostname')
         ip_address = self.request.GET.get('ip_address')
         group = self.request.GET.get('group')
         is_online = self.request.GET.get('is_online')
 
+        # Filtros de componentes (tabelas normalizadas e indexadas)
+        part_number = self.request.GET.get('part_number')
+        mac = self.request.GET.get('mac')
+        gateway = self.request.GET.get('gateway')
+
         if hostname:
             queryset = queryset.filter(hostname__icontains=hostname)
         if ip_address:
@@ -422,6 +725,22 @@ class MachineListView(LoginRequiredMixin, ListView):
             queryset = queryset.filter(group_id=group)
         if is_online:
             queryset = queryset.filter(is_online=(is_online == 'true'))
+        if part_number:
+            queryset = queryset.filter(pk__in=MachineMemoryModule.objects.filter(
+                part_number=part_number.strip()
+            ).values('machine_id'))
+        if mac:
+            queryset = queryset.filter(pk__in=MachineNetworkAdapter.objects.filter(
+                mac=mac.strip().upper()
+            ).values('machine_id'))
+        if gateway:
+            queryset = queryset.filter(pk__in=MachineNetworkAdapter.objects.filter(
+                gateway=gateway.strip()
+            ).values('machine_id'))
+
+        # Busca livre: índice FTS ordenado por relevância (search.py)
+        if q:
+            return search_machines(queryset, q)
 
         return queryset.order_by('-last_seen')
 
@@ -431,11 +750,40 @@ class MachineListView(LoginRequiredMixin, ListView):
         return context
 
 
+class MachineDiskTrendView(LoginRequiredMixin, View):
+    """
+    Máquinas com disco enchendo (telemetria horária)
+
+    GET /api/machines/disk-trend/?days=30&min_drop_gb=5
+    """
+
+    def get(self, request):
+        try:
+            days = int(request.GET.get('days', 30))
+            min_drop_gb = float(request.GET.get('min_drop_gb', 5))
+        except ValueError as e:
+            return JsonResponse({'error': f'Parâmetro inválido: {str(e)}'}, status=400)
+
+        rows = machines_filling_disk(days=days, min_drop_gb=min_drop_gb)
+        hostnames = dict(
+            Machine.objects.filter(pk__in=[row['machine_id'] for row in rows]).values_list('pk', 'hostname')
+        )
+        for row in rows:
+            row['hostname'] = hostnames.get(row['machine_id'])
+
+        return JsonResponse({'days': days, 'total': len(rows), 'machines': rows})
+
+
 class MachineDetailView(LoginRequiredMixin, DetailView):
     model = Machine
     template_name = 'inventario/machine_detail.html'
     context_object_name = 'machine'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['changes'] = self.object.changes.all()[:50]
+        return context
+
 
 class MachineCreateView(LoginRequiredMixin, CreateView):
     model = Machine
@@ -450,6 +798,11 @@ class MachineUpdateView(LoginRequiredMixin, UpdateView):
     template_name = 'inventario/machine_edit.html'
     success_url = reverse_lazy('inventario:machine_list')
 
+    def form_valid(self, form):
+        # Edição manual invalida o hash: o próximo check-in do agente será completo
+        form.instance.inventory_hash = None
+        return super().form_valid(form)
+
 
 class MachineDeleteView(LoginRequiredMixin, DeleteView):
     model = Machine
@@ -497,10 +850,17 @@ class MachineGroupDeleteView(LoginRequiredMixin, DeleteView):
 
 # ==================== BLOCKED SITE VIEWS ====================
 
-class BlockedSiteListView(LoginRequiredMixin, ListView):
+class BlockedSiteListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = BlockedSite
     template_name = 'inventario/blockedsite_list.html'
     context_object_name = 'sites'
+    paginate_by = 50
+    keyset_ordering = '-id'
+
+    def get_queryset(self):
+        return BlockedSite.objects.select_related('machine', 'group').only(
+            'url', 'machine__hostname', 'group__name'
+        )
 
 
 class BlockedSiteCreateView(LoginRequiredMixin, CreateView):
@@ -530,11 +890,48 @@ class BlockedSiteDeleteView(LoginRequiredMixin, DeleteView):
 
 # ==================== NOTIFICATION VIEWS ====================
 
-class NotificationListView(LoginRequiredMixin, ListView):
+class NotificationListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Notification
     template_name = 'inventario/notification_list.html'
     context_object_name = 'notifications'
-    ordering = ['-created_at']
+    paginate_by = 30
+
+    ORDERINGS = ('-created_at', 'created_at', 'priority')
+
+    def get_keyset_ordering(self):
+        order = self.request.GET.get('order')
+        return order if order in self.ORDERINGS else '-created_at'
+
+    def get_filtered_queryset(self):
+        queryset = Notification.objects.all()
+
+        machine = self.request.GET.get('machine')
+        status = self.request.GET.get('status')
+
+        if machine:
+            queryset = queryset.filter(machine_id=machine)
+        if status:
+            queryset = queryset.filter(status=status)
+
+        return queryset
+
+    def get_queryset(self):
+        # Apenas o hostname da máquina, sem carregar os JSONs de hardware
+        return self.get_filtered_queryset().select_related('machine').only(
+            'title', 'message', 'type', 'priority', 'status', 'is_read',
+            'created_at', 'read_at', 'machine__hostname'
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        totals = self.get_filtered_queryset().aggregate(
+            total=Count('id'),
+            total_pending=Count('id', filter=Q(status='pending')),
+            total_read=Count('id', filter=Q(status='read')),
+        )
+        context.update(totals)
+        context['machines'] = Machine.objects.only('hostname').order_by('hostname')
+        return context
 
 
 class NotificationDetailView(LoginRequiredMixin, DetailView):
@@ -550,6 +947,43 @@ class NotificationCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy('inventario:notifications_list')
 
 
+class NotificationBroadcastView(LoginRequiredMixin, View):
+    """
+    Envia uma notificação a um grupo de máquinas ou a toda a frota
+
+    POST (form): group, only_online, title, message, type, priority, expires_at
+
+    Response:
+        {"success": true, "total": 5000, "created": 5000, "chunks": 10}
+    """
+
+    def post(self, request):
+        form = NotificationBroadcastForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'success': False, 'errors': form.errors}, status=400)
+
+        chunks = []
+
+        created = broadcast_notification(
+            form.get_machines(),
+            title=form.cleaned_data['title'],
+            message=form.cleaned_data['message'],
+            type=form.cleaned_data['type'],
+            priority=form.cleaned_data['priority'],
+            expires_at=form.cleaned_data.get('expires_at'),
+            progress=lambda done, total: chunks.append((done, total)),
+        )
+
+        logger.info(f"Notificação '{form.cleaned_data['title']}' enviada para {created} máquinas")
+
+        return JsonResponse({
+            'success': True,
+            'total': chunks[-1][1] if chunks else 0,
+            'created': created,
+            'chunks': len(chunks),
+        })
+
+
 class NotificationDeleteView(LoginRequiredMixin, DeleteView):
     model = Notification
     success_url = reverse_lazy('inventario:notifications_list')
@@ -720,16 +1154,27 @@ class AgentVersionCreateView(LoginRequiredMixin, CreateView):
     """Cria nova versão do agente"""
     model = AgentVersion
     template_name = 'inventario/agent_version_create.html'
-    fields = ['version', 'file_path', 'release_notes', 'is_mandatory']
+    fields = [
+        'version', 'file_path', 'release_notes', 'is_mandatory',
+        'rollout_percentage', 'rollout_groups', 'rollout_slots_per_minute',
+    ]
     success_url = reverse_lazy('inventario:version_list')
 
     def form_valid(self, form):
         form.instance.created_by = self.request.user
+        response = super().form_valid(form)
+
+        # Digest e variante gzip calculados uma vez, aqui
+        prepare_version(self.object)
+
+        # Delta a partir da versão anterior, gerado fora da requisição
+        schedule_delta(self.object)
+
         messages.success(
             self.request,
             f"✅ Versão {form.instance.version} criada com sucesso!"
         )
-        return super().form_valid(form)
+        return response
 
     def form_invalid(self, form):
         messages.error(self.request, "❌ Erro ao criar versão. Verifique os campos.")
@@ -750,6 +1195,34 @@ class AgentVersionToggleView(LoginRequiredMixin, View):
         return redirect('inventario:version_list')
 
 
+class AgentVersionRolloutView(LoginRequiredMixin, View):
+    """Avança a onda do rollout ou interrompe/retoma a distribuição"""
+
+    def post(self, request, pk):
+        version = get_object_or_404(AgentVersion, pk=pk)
+
+        if 'halt' in request.POST:
+            version.rollout_halted = not version.rollout_halted
+            version.save(update_fields=['rollout_halted'])
+            status_text = "interrompido" if version.rollout_halted else "retomado"
+            messages.success(request, f"✅ Rollout da versão {version.version} {status_text}.")
+            return redirect('inventario:version_list')
+
+        try:
+            percentage = int(request.POST.get('rollout_percentage', ''))
+        except ValueError:
+            messages.error(request, "❌ Percentual inválido.")
+            return redirect('inventario:version_list')
+
+        version.rollout_percentage = max(0, min(100, percentage))
+        version.save(update_fields=['rollout_percentage'])
+        messages.success(
+            request,
+            f"✅ Versão {version.version} liberada para {version.rollout_percentage}% da frota."
+        )
+        return redirect('inventario:version_list')
+
+
 # ============================================================================
 # API VIEWS (REST) - SEM AUTENTICAÇÃO PARA O AGENTE
 # ============================================================================
@@ -772,6 +1245,13 @@ class AgentValidateTokenAPIView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            # Rejeita tokens inexistentes/inativos sem consultar o banco
+            if not token_cache.is_valid(token):
+                return Response(
+                    {'valid': False, 'message': 'Token inválido'},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+
             # Busca token
             try:
                 agent_token = AgentToken.objects.get(token_hash=token, is_active=True)
@@ -817,10 +1297,8 @@ class AgentCheckUpdateAPIView(APIView):
             current_version = data.get('current_version', '0.0.0')
             machine_name = data.get('machine_name', '')
 
-            # Busca versão mais recente ativa
-            latest_version = AgentVersion.objects.filter(
-                is_active=True
-            ).order_by('-created_at').first()
+            # Versão mais recente liberada para esta máquina (rollout gradual)
+            latest_version = select_version(machine_name)
 
             if not latest_version:
                 return Response({
@@ -828,25 +1306,44 @@ class AgentCheckUpdateAPIView(APIView):
                     'message': 'Nenhuma versão disponível'
                 })
 
-            # Compara versões (simplificado)
-            def version_tuple(v):
-                try:
-                    return tuple(map(int, v.split('.')))
-                except:
-                    return (0, 0, 0)
-
             current = version_tuple(current_version)
             latest = version_tuple(latest_version.version)
 
-            if latest > current or latest_version.is_mandatory:
+            # Obrigatória também vale para voltar a uma versão anterior
+            if latest > current or (latest_version.is_mandatory and latest != current):
+                retry_after = download_slots.acquire(
+                    latest_version.pk, latest_version.rollout_slots_per_minute
+                )
+                if retry_after:
+                    return Response({
+                        'update_available': False,
+                        'current_version': current_version,
+                        'latest_version': latest_version.version,
+                        'retry_after': retry_after
+                    })
+
+                # Delta só se já tiver sido gerado a partir da versão atual do agente
+                source = AgentVersion.objects.filter(version=current_version).exclude(
+                    pk=latest_version.pk
+                ).only('pk', 'sha256').first()
+                delta = find_delta(source.pk, latest_version.pk) if source else None
+                delta_url = request.build_absolute_uri(
+                    f'/api/inventario/agent/delta/{source.pk}/{latest_version.pk}/'
+                ) if delta else None
+
                 return Response({
                     'update_available': True,
                     'version': latest_version.version,
                     'download_url': request.build_absolute_uri(
                         f'/api/inventario/agent/download/{latest_version.pk}/'
                     ),
+                    'delta_url': delta_url,
+                    # Hash do arquivo base do delta; o agente confere com o local
+                    'delta_source_sha256': source.sha256 if delta else None,
                     'release_notes': latest_version.release_notes,
-                    'is_mandatory': latest_version.is_mandatory
+                    'is_mandatory': latest_version.is_mandatory,
+                    'sha256': latest_version.sha256,
+                    'size': latest_version.file_size,
                 })
 
             return Response({
@@ -878,13 +1375,65 @@ class AgentDownloadAPIView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # Retorna arquivo
-            response = FileResponse(
-                version.file_path.open('rb'),
-                content_type='text/x-python'
+            if not version.sha256:
+                prepare_version(version)
+
+            # Artefato imutável: ETag = SHA-256, Range e variante gzip
+            return serve_artifact(
+                request,
+                open_file=lambda: version.file_path.open('rb'),
+                size=version.file_size,
+                sha256=version.sha256,
+                last_modified=version.created_at.timestamp(),
+                content_type='text/x-python',
+                filename=f'agent_{version.version}.py',
+                open_gzip=(lambda: version.gzip_file.open('rb')) if version.gzip_file else None,
+                gzip_size=version.gzip_file.size if version.gzip_file else None,
+                cache_control='public, max-age=86400',
+            )
+
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-            response['Content-Disposition'] = f'attachment; filename="agent_{version.version}.py"'
 
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AgentDeltaAPIView(APIView):
+    """
+    Delta binário entre duas versões do agente
+
+    Só serve deltas já gerados (versões consecutivas, após o upload); 404
+    quando o delta não existe ou não compensa e o agente baixa o arquivo
+    completo. X-Source-SHA256 é o hash do arquivo base e
+    X-Target-SHA256 o do arquivo reconstruído.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request, source_pk, target_pk):
+        try:
+            delta = find_delta(source_pk, target_pk)
+            if delta is None or not delta.target.is_active or not delta.target.sha256:
+                return Response(
+                    {'error': 'Delta indisponível'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            source, target = delta.source, delta.target
+
+            response = serve_artifact(
+                request,
+                open_file=lambda: delta.delta_file.open('rb'),
+                size=delta.size,
+                sha256=delta.sha256,
+                last_modified=delta.created_at.timestamp(),
+                content_type='application/octet-stream',
+                filename=f'agent_{source.version}_to_{target.version}.delta',
+                cache_control='public, max-age=86400',
+            )
+            response['X-Source-SHA256'] = source.sha256
+            response['X-Target-SHA256'] = target.sha256
             return response
 
         except Exception as e:
@@ -903,5 +1452,14 @@ class AgentHealthCheckAPIView(APIView):
     def get(self, request):
         return Response({
             'status': 'healthy',
-            'timestamp': timezone.now().isoformat()
+            'timestamp': timezone.now().isoformat(),
+            'token_cache': token_cache.stats(),
+            'command_queue': {
+                'pending': command_queue.pending_count(),
+                'running': command_queue.running_count(),
+            },
+            'checkin': {
+                'rate': checkin_load.rate(),
+                'next_checkin': checkin_load.interval_hint(),
+            },
         })
\ No newline at end of file